@@ -0,0 +1,225 @@
+"""
+Graph analytics over cluster relationships.
+
+The relationship graph is treated as undirected and held as a CSR adjacency
+structure (indptr / indices arrays). All algorithms are level-synchronous:
+every step works on a whole BFS frontier with NumPy array operations instead
+of visiting nodes one at a time, so a step costs a handful of vectorized
+passes over the edges it touches.
+
+- connected components: min-label propagation with pointer jumping
+- degree centrality
+- betweenness centrality: Brandes' algorithm, run from every cluster or
+  from a random sample of clusters with the result scaled up
+- shortest paths: breadth-first search with parent links
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .layout import graph_edges
+except ImportError:  # loaded as a top-level module by `streamlit run app/main.py`
+    from layout import graph_edges
+
+# Above this many clusters betweenness is estimated from sampled sources
+EXACT_BETWEENNESS_LIMIT = 2000
+DEFAULT_BETWEENNESS_SAMPLES = 64
+
+
+def _distinct(nodes: np.ndarray, scratch: np.ndarray) -> np.ndarray:
+    """Mask keeping one occurrence of every node, without sorting.
+
+    scratch is an int array with a slot per node; the last write to a slot
+    wins, so only that occurrence reads its own position back.
+    """
+    positions = np.arange(len(nodes))
+    scratch[nodes] = positions
+    return scratch[nodes] == positions
+
+
+def _expand(
+    indptr: np.ndarray, indices: np.ndarray, frontier: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (source, neighbour) arrays for every edge leaving frontier"""
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.empty(0, dtype=indices.dtype)
+        return empty, empty
+    sources = np.repeat(frontier, counts)
+    # Positions of the edges in indices: starts[i], starts[i] + 1, ...
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return sources, indices[np.repeat(starts, counts) + offsets]
+
+
+class GraphAnalytics:
+    """Analytics of the relationship graph of a list of clusters.
+
+    Results are computed on first use and kept, so an instance should be
+    dropped when the clusters change (ClusterManager.get_analytics keeps
+    one per data version).
+    """
+
+    def __init__(self, clusters: Sequence[Dict]):
+        self.ids = [str(cluster["id"]) for cluster in clusters]
+        self.index = {cluster_id: i for i, cluster_id in enumerate(self.ids)}
+        n = len(self.ids)
+        sources, targets = graph_edges(clusters, self.index)
+        # Both directions of every edge, without duplicates, sorted by source
+        pairs = np.unique(
+            np.concatenate([sources * n + targets, targets * n + sources]).astype(
+                np.int64
+            )
+        )
+        self.indices = (pairs % n).astype(np.intp) if n else pairs
+        counts = np.bincount(pairs // n, minlength=n) if n else np.zeros(0, int)
+        self.indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.intp)
+        self._components: Optional[np.ndarray] = None
+        self._betweenness: Dict[Tuple, np.ndarray] = {}
+
+    @property
+    def edge_count(self) -> int:
+        """Number of undirected edges"""
+        return len(self.indices) // 2
+
+    def degrees(self) -> np.ndarray:
+        """Number of related clusters of every cluster"""
+        return np.diff(self.indptr)
+
+    def components(self) -> np.ndarray:
+        """Component label of every cluster (the smallest index in it)"""
+        if self._components is None:
+            self._components = self._label_components()
+        return self._components
+
+    def _label_components(self) -> np.ndarray:
+        n = len(self.ids)
+        labels = np.arange(n)
+        sources = np.repeat(np.arange(n), self.degrees())
+        targets = self.indices
+        while True:
+            smallest = np.minimum(labels[sources], labels[targets])
+            updated = labels.copy()
+            np.minimum.at(updated, labels[sources], smallest)
+            np.minimum.at(updated, sources, smallest)
+            # Pointer jumping: follow labels until they point at themselves
+            while True:
+                jumped = updated[updated]
+                if np.array_equal(jumped, updated):
+                    break
+                updated = jumped
+            if np.array_equal(updated, labels):
+                return labels
+            labels = updated
+
+    def component_sizes(self) -> List[Tuple[int, List[str]]]:
+        """(size, ids of its clusters) for every component, largest first"""
+        labels = self.components()
+        order = np.argsort(labels, kind="stable")
+        roots, starts, sizes = np.unique(
+            labels[order], return_index=True, return_counts=True
+        )
+        groups = [
+            (int(size), [self.ids[i] for i in order[start : start + size]])
+            for start, size in zip(starts, sizes)
+        ]
+        groups.sort(key=lambda group: -group[0])
+        return groups
+
+    def betweenness(self, samples: Optional[int] = None, seed: int = 0) -> np.ndarray:
+        """Betweenness centrality of every cluster, normalized to [0, 1].
+
+        With samples, shortest paths are only followed from that many
+        random source clusters and the result is scaled by n / samples, an
+        unbiased estimate. Without it the exact value is computed for graphs
+        of up to EXACT_BETWEENNESS_LIMIT clusters and DEFAULT_BETWEENNESS_SAMPLES
+        sources are sampled above that.
+        """
+        n = len(self.ids)
+        if samples is None and n > EXACT_BETWEENNESS_LIMIT:
+            samples = DEFAULT_BETWEENNESS_SAMPLES
+        if samples is not None and samples >= n:
+            samples = None
+        key = (samples, seed)
+        if key not in self._betweenness:
+            self._betweenness[key] = self._betweenness_from(samples, seed)
+        return self._betweenness[key]
+
+    def _betweenness_from(self, samples: Optional[int], seed: int) -> np.ndarray:
+        n = len(self.ids)
+        if samples is None:
+            sources = np.arange(n)
+        else:
+            sources = np.random.default_rng(seed).choice(n, samples, replace=False)
+
+        centrality = np.zeros(n)
+        for source in sources:
+            centrality += self._dependencies(int(source))
+        if n > 2:
+            # Each undirected path is counted from both ends
+            centrality *= n / len(sources) / ((n - 1) * (n - 2))
+        else:
+            centrality[:] = 0
+        return centrality
+
+    def _dependencies(self, source: int) -> np.ndarray:
+        """Brandes' dependency of source on every other cluster"""
+        n = len(self.ids)
+        distance = np.full(n, -1)
+        distance[source] = 0
+        paths = np.zeros(n)
+        paths[source] = 1
+        scratch = np.empty(n, dtype=np.intp)
+        levels = []  # (parent, child) edges of each BFS level
+        frontier = np.array([source])
+        depth = 0
+        while len(frontier):
+            parents, children = _expand(self.indptr, self.indices, frontier)
+            new = children[distance[children] < 0]
+            distance[new] = depth + 1
+            on_path = distance[children] == depth + 1
+            parents, children = parents[on_path], children[on_path]
+            np.add.at(paths, children, paths[parents])
+            levels.append((parents, children))
+            frontier = new[_distinct(new, scratch)]
+            depth += 1
+
+        dependency = np.zeros(n)
+        for parents, children in reversed(levels):
+            share = paths[parents] / paths[children] * (1 + dependency[children])
+            np.add.at(dependency, parents, share)
+        dependency[source] = 0
+        return dependency
+
+    def shortest_path(self, source_id: str, target_id: str) -> Optional[List[str]]:
+        """Ids of the clusters on a shortest path between two clusters
+        (both included), or None if they are not connected"""
+        source = self.index.get(str(source_id))
+        target = self.index.get(str(target_id))
+        if source is None or target is None:
+            return None
+        parent = np.full(len(self.ids), -1)
+        parent[source] = source
+        scratch = np.empty(len(self.ids), dtype=np.intp)
+        frontier = np.array([source])
+        while len(frontier) and parent[target] < 0:
+            parents, children = _expand(self.indptr, self.indices, frontier)
+            unseen = parent[children] < 0
+            parents, children = parents[unseen], children[unseen]
+            keep = _distinct(children, scratch)
+            frontier = children[keep]
+            parent[frontier] = parents[keep]
+        if parent[target] < 0:
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(int(parent[path[-1]]))
+        return [self.ids[i] for i in reversed(path)]
+
+    def top(self, scores: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
+        """The k clusters with the highest scores, highest first"""
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [(self.ids[i], float(scores[i])) for i in order]
@@ -0,0 +1,517 @@
+"""
+Binary workbench files, mapped into memory instead of parsed.
+
+A file is a header followed by fixed-width record arrays and a string table,
+little-endian, every section starting on an 8-byte boundary:
+
+    header          magic, format version, the size of every section and
+                    the string numbers of the other keys of the document
+                    and of the facet summary
+    clusters        8 uint32 per cluster: id, name and extra (string
+                    numbers), first member, member count, first
+                    relationship, relationship count and a reserved zero
+    members         4 uint32 per member: id, name, metadata and extra
+                    (string numbers)
+    relationships   1 uint32 per relationship: the string number of the id
+    string offsets  n + 1 uint64: string i is data[offsets[i]:offsets[i+1]]
+    string data     the UTF-8 text of every distinct string, back to back
+
+Metadata and the keys of clusters, members and the document that have no
+field of their own are stored as compact JSON text, NO_STRING marking a
+member without metadata or a record without other keys. Ids and names that
+are not strings, and relationship lists holding anything but strings, are
+kept with the other keys so that they read back as they were written. The
+facet summary is the JSON of the most common metadata values per field, as
+ClusterManager.get_facet_counts returns them, so that they can be shown
+without reading every member.
+
+Opening a file maps it and checks the header; records and strings are only
+read when a cluster or member is looked at, so the operating system only
+pages in the parts of the file that are used. As in compact_store, clusters
+and members are handed out as views that behave like the dicts they stand
+for. Keys set on a cluster view are kept in memory over what the file holds;
+members and the member and relationship lists read from the file are
+read-only, so they are replaced rather than changed in place.
+"""
+
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+from abc import abstractmethod
+from array import array
+from collections.abc import Mapping, MutableMapping, Sequence
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Union
+
+try:
+    from .export import to_json
+except ImportError:  # loaded as a top-level module by `streamlit run app/main.py`
+    from export import to_json
+
+MAGIC = b"CWB\x00"
+FORMAT_VERSION = 1
+# magic, version, clusters, members, relationships, strings, document, facets
+HEADER = struct.Struct("<4sI6Q")
+CLUSTER_FIELDS = 8
+MEMBER_FIELDS = 4
+NO_STRING = 0xFFFFFFFF
+
+# Marks a key deleted from a cluster view, or no default given
+_ABSENT = object()
+_CLUSTER_KEYS = ("id", "name", "members", "relationships")
+_MEMBER_KEYS = ("id", "name", "metadata")
+
+
+class BinaryFormatError(ValueError):
+    """Raised when a file is not a binary workbench this version can read.
+
+    code is one of the ERROR_MESSAGES keys in messages.py and params holds the
+    values its message is formatted with.
+    """
+
+    def __init__(self, code: str, params: Optional[Dict[str, Any]] = None):
+        super().__init__(code)
+        self.code = code
+        self.params = params or {}
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _section_bounds(clusters: int, members: int, relationships: int, strings: int):
+    """Start and end of the clusters, members, relationships and string
+    offsets sections, then the start of the string data"""
+    bounds = []
+    position = HEADER.size
+    for size in (
+        4 * CLUSTER_FIELDS * clusters,
+        4 * MEMBER_FIELDS * members,
+        4 * relationships,
+        8 * (strings + 1),
+    ):
+        bounds.append((position, position + size))
+        position = _aligned(position + size)
+    return bounds, position
+
+
+def _words(view: memoryview, typecode: str):
+    """view as an array of little-endian integers, without copying it on
+    little-endian machines"""
+    words = view.cast(typecode)
+    if sys.byteorder == "little":
+        return words
+    swapped = array(typecode, words)
+    swapped.byteswap()
+    return swapped
+
+
+# -- writing -------------------------------------------------------------
+
+
+class _StringTableWriter:
+    """Numbers distinct strings in order of first use"""
+
+    def __init__(self):
+        self.numbers: Dict[str, int] = {}
+
+    def add(self, s: str) -> int:
+        number = self.numbers.get(s)
+        if number is None:
+            number = self.numbers[s] = len(self.numbers)
+        return number
+
+    def add_json(self, value: Any) -> int:
+        return self.add(to_json(value))
+
+    def other_keys(self, record: Mapping, fields: tuple) -> int:
+        """String number of the keys of record without a field of their own
+        (and of an id or name that is not a string), or NO_STRING"""
+        other = {key: value for key, value in record.items() if key not in fields}
+        for key in ("id", "name"):
+            if not isinstance(record.get(key, ""), str):
+                other[key] = record[key]
+        return self.add_json(other) if other else NO_STRING
+
+
+def write_binary(data: Mapping, stream: BinaryIO, facets: Optional[Dict] = None):
+    """Write a cluster document to stream in the binary workbench format,
+    with facets as its facet summary if given"""
+    strings = _StringTableWriter()
+    clusters = array("I")
+    members = array("I")
+    relationships = array("I")
+    for cluster in data["clusters"]:
+        related = cluster.get("relationships", [])
+        listed = all(isinstance(r, str) for r in related)
+        # A list holding other ids is kept with the other keys instead
+        fields = _CLUSTER_KEYS if listed else ("id", "name", "members")
+        other = strings.other_keys(cluster, fields)
+        clusters.extend(
+            (
+                strings.add(str(cluster["id"])),
+                strings.add(str(cluster["name"])),
+                other,
+                len(members) // MEMBER_FIELDS,
+                len(cluster["members"]),
+                len(relationships),
+                len(related) if listed else 0,
+                0,
+            )
+        )
+        if listed:
+            relationships.extend(map(strings.add, related))
+        for member in cluster["members"]:
+            metadata = member.get("metadata", _ABSENT)
+            members.extend(
+                (
+                    strings.add(str(member["id"])),
+                    strings.add(str(member["name"])),
+                    NO_STRING if metadata is _ABSENT else strings.add_json(metadata),
+                    strings.other_keys(member, _MEMBER_KEYS),
+                )
+            )
+    document = {key: value for key, value in data.items() if key != "clusters"}
+    document_number = strings.add_json(document) if document else NO_STRING
+    facets_number = NO_STRING if facets is None else strings.add_json(facets)
+
+    encoded = [s.encode("utf-8", "surrogatepass") for s in strings.numbers]
+    offsets = array("Q", [0])
+    for text in encoded:
+        offsets.append(offsets[-1] + len(text))
+    sections = (clusters, members, relationships, offsets)
+    if sys.byteorder != "little":
+        for section in sections:
+            section.byteswap()
+
+    stream.write(
+        HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            len(clusters) // CLUSTER_FIELDS,
+            len(members) // MEMBER_FIELDS,
+            len(relationships),
+            len(encoded),
+            document_number,
+            facets_number,
+        )
+    )
+    bounds, _ = _section_bounds(
+        len(clusters) // CLUSTER_FIELDS,
+        len(members) // MEMBER_FIELDS,
+        len(relationships),
+        len(encoded),
+    )
+    for section, (start, end) in zip(sections, bounds):
+        stream.write(section.tobytes())
+        stream.write(b"\0" * (_aligned(end) - end))
+    for text in encoded:
+        stream.write(text)
+
+
+def export_binary(data: Mapping, facets: Optional[Dict] = None) -> bytes:
+    """Return a cluster document in the binary workbench format"""
+    buffer = io.BytesIO()
+    write_binary(data, buffer, facets)
+    return buffer.getvalue()
+
+
+def save_binary(data: Mapping, path: str, facets: Optional[Dict] = None):
+    """Write a binary workbench file, replacing path only once it is complete.
+
+    The old file is never written to, so workbenches still mapping it keep
+    reading what they opened.
+    """
+    temporary = f"{path}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            write_binary(data, f, facets)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+# -- reading -------------------------------------------------------------
+
+
+class BinaryWorkbench:
+    """A binary workbench file, mapped into memory.
+
+    source is the path of the file, which is then opened with mmap, or a
+    bytes-like object holding its contents.
+    """
+
+    def __init__(self, source: Union[str, os.PathLike, bytes, memoryview]):
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                if os.fstat(f.fileno()).st_size < HEADER.size:
+                    raise BinaryFormatError("invalid_binary_workbench")
+                source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(source).cast("B")
+        if len(view) < HEADER.size or view[:4] != MAGIC:
+            raise BinaryFormatError("invalid_binary_workbench")
+        _, version, clusters, members, relationships, strings, *numbers = (
+            HEADER.unpack_from(view)
+        )
+        if version != FORMAT_VERSION:
+            raise BinaryFormatError("binary_workbench_version", {"version": version})
+        bounds, data = _section_bounds(clusters, members, relationships, strings)
+        if len(view) < data:
+            raise BinaryFormatError("truncated_binary_workbench")
+        self._clusters, self._members, self._relationships, self._offsets = (
+            _words(view[start:end], typecode)
+            for (start, end), typecode in zip(bounds, "IIIQ")
+        )
+        if len(view) < data + self._offsets[-1]:
+            raise BinaryFormatError("truncated_binary_workbench")
+        self._data = view[data:]
+        self._document, self._facets = numbers
+        # Ids, names and relationships decoded so far, so that they are
+        # decoded once and the lookup tables share one str for each
+        self._strings: Dict[int, str] = {}
+        self.clusters = ClusterRecords(self)
+
+    def __len__(self) -> int:
+        """Number of clusters"""
+        return len(self._clusters) // CLUSTER_FIELDS
+
+    @property
+    def member_count(self) -> int:
+        """Number of members of all clusters"""
+        return len(self._members) // MEMBER_FIELDS
+
+    def _decode(self, number: int) -> str:
+        start, end = self._offsets[number], self._offsets[number + 1]
+        return str(self._data[start:end], "utf-8", "surrogatepass")
+
+    def string(self, number: int) -> str:
+        """Return string number of the string table"""
+        s = self._strings.get(number)
+        if s is None:
+            s = self._strings[number] = self._decode(number)
+        return s
+
+    def _json(self, number: int) -> Any:
+        return json.loads(self._decode(number))
+
+    def _other(self, number: int) -> Dict:
+        return {} if number == NO_STRING else self._json(number)
+
+    def document(self) -> Dict:
+        """The keys of the document other than "clusters" """
+        return self._other(self._document)
+
+    def facets(self) -> Optional[Dict]:
+        """The facet summary written with the file, if any"""
+        return None if self._facets == NO_STRING else self._json(self._facets)
+
+    # -- clusters ----------------------------------------------------------
+
+    def cluster_value(self, number: int, key: str) -> Any:
+        """Return the value of key for cluster number, as written"""
+        base = CLUSTER_FIELDS * number
+        other = self._clusters[base + 2]
+        if other != NO_STRING:
+            values = self._json(other)
+            if key in values:
+                return values[key]
+        if key == "id" or key == "name":
+            return self.string(self._clusters[base + (key == "name")])
+        if key == "members":
+            start, count = self._clusters[base + 3], self._clusters[base + 4]
+            return MemberRecords(self, start, count)
+        if key == "relationships":
+            start, count = self._clusters[base + 5], self._clusters[base + 6]
+            return RelationshipRecords(self, start, count)
+        raise KeyError(key)
+
+    def cluster_keys(self, number: int) -> Iterator[str]:
+        """Keys of cluster number, as written"""
+        other = self._other(self._clusters[CLUSTER_FIELDS * number + 2])
+        yield from _CLUSTER_KEYS
+        yield from (key for key in other if key not in _CLUSTER_KEYS)
+
+    # -- members -----------------------------------------------------------
+
+    def member_value(self, number: int, key: str, default: Any = _ABSENT) -> Any:
+        """Return the value of key for member number, as written, or default
+        if given and the member has no such key"""
+        base = MEMBER_FIELDS * number
+        members = self._members
+        if members[base + 3] != NO_STRING:
+            values = self._json(members[base + 3])
+            if key in values:
+                return values[key]
+        if key == "id":
+            return self.string(members[base])
+        if key == "name":
+            return self.string(members[base + 1])
+        if key == "metadata" and members[base + 2] != NO_STRING:
+            return self._json(members[base + 2])
+        if default is _ABSENT:
+            raise KeyError(key)
+        return default
+
+    def member_keys(self, number: int) -> Iterator[str]:
+        """Keys of member number, as written"""
+        base = MEMBER_FIELDS * number
+        yield "id"
+        yield "name"
+        if self._members[base + 2] != NO_STRING:
+            yield "metadata"
+        other = self._other(self._members[base + 3])
+        yield from (key for key in other if key not in _MEMBER_KEYS)
+
+
+class BinaryCluster(MutableMapping):
+    """A cluster of a BinaryWorkbench, with the keys set on it kept in memory"""
+
+    __slots__ = ("_workbench", "number", "_changes")
+
+    def __init__(self, workbench: BinaryWorkbench, number: int):
+        self._workbench = workbench
+        self.number = number
+        self._changes: Optional[Dict] = None
+
+    def __getitem__(self, key):
+        if self._changes is not None and key in self._changes:
+            value = self._changes[key]
+            if value is _ABSENT:
+                raise KeyError(key)
+            return value
+        return self._workbench.cluster_value(self.number, key)
+
+    def __setitem__(self, key, value):
+        if self._changes is None:
+            self._changes = {}
+        self._changes[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self[key] = _ABSENT
+
+    def __iter__(self) -> Iterator[str]:
+        changes = self._changes or {}
+        keys = list(self._workbench.cluster_keys(self.number))
+        for key in keys:
+            if changes.get(key) is not _ABSENT:
+                yield key
+        for key, value in changes.items():
+            if value is not _ABSENT and key not in keys:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def __reduce__(self):
+        # Copies and pickles are plain dicts, detached from the file
+        return dict, (dict(self),)
+
+
+class BinaryMember(Mapping):
+    """Read-only dict view of a member of a BinaryWorkbench"""
+
+    __slots__ = ("_workbench", "number")
+
+    def __init__(self, workbench: BinaryWorkbench, number: int):
+        self._workbench = workbench
+        self.number = number
+
+    def __getitem__(self, key):
+        return self._workbench.member_value(self.number, key)
+
+    def get(self, key, default=None):
+        return self._workbench.member_value(self.number, key, default)
+
+    def __iter__(self) -> Iterator[str]:
+        return self._workbench.member_keys(self.number)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class _Records(Sequence):
+    """A read-only run of records of a BinaryWorkbench, compared like a list.
+
+    Subclasses build each record in _item.
+    """
+
+    __slots__ = ("_workbench", "_start", "_count")
+
+    def __init__(self, workbench: BinaryWorkbench, start: int, count: int):
+        self._workbench = workbench
+        self._start = start
+        self._count = count
+
+    @abstractmethod
+    def _item(self, number: int):
+        """Return the record with a number"""
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._item(self._start + i) for i in range(self._count)[index]]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._item(self._start + index)
+
+    def __iter__(self) -> Iterator:
+        return map(self._item, range(self._start, self._start + self._count))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, tuple, _Records)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+class ClusterRecords(_Records):
+    """Every cluster of a BinaryWorkbench, as views built on access"""
+
+    __slots__ = ()
+
+    def __init__(self, workbench: BinaryWorkbench):
+        super().__init__(workbench, 0, len(workbench))
+
+    def _item(self, number: int) -> BinaryCluster:
+        return BinaryCluster(self._workbench, number)
+
+
+class MemberRecords(_Records):
+    """The members of a cluster, as views built on access"""
+
+    __slots__ = ()
+
+    def _item(self, number: int) -> BinaryMember:
+        return BinaryMember(self._workbench, number)
+
+
+class RelationshipRecords(_Records):
+    """The ids of the clusters a cluster is related to"""
+
+    __slots__ = ()
+
+    def _item(self, number: int) -> str:
+        return self._workbench.string(self._workbench._relationships[number])
@@ -1,123 +1,1009 @@
-import copy
+import bisect
+import heapq
+import os
+import sys
 import uuid
-from typing import Dict, List, Any, Optional
+from collections.abc import Mapping, MutableMapping, MutableSequence
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
 import json
+import sqlite3
+
+try:
+    from .analytics import GraphAnalytics
+    from .binary_store import (
+        BinaryFormatError,
+        BinaryWorkbench,
+        export_binary,
+        save_binary,
+    )
+    from .columnar import ColumnarFormatError, export_archive, read_archive
+    from .compact_store import CompactFieldIndex, CompactStore
+    from .dataset_cache import DatasetCache, content_hash
+    from .export import export_json
+    from .json_stream import ClusterStream, StreamFormatError
+    from .operations import validate_operations
+    from .search_index import FieldIndex, SearchIndex
+    from .workbench_db import WorkbenchDB, WorkbenchLockedError
+    from .validation import (
+        ValidationError,
+        drop_duplicate_members,
+        index_members,
+        validate_clusters,
+        validate_document,
+    )
+except ImportError:  # loaded as a top-level module by `streamlit run app/main.py`
+    from analytics import GraphAnalytics
+    from binary_store import (
+        BinaryFormatError,
+        BinaryWorkbench,
+        export_binary,
+        save_binary,
+    )
+    from columnar import ColumnarFormatError, export_archive, read_archive
+    from compact_store import CompactFieldIndex, CompactStore
+    from dataset_cache import DatasetCache, content_hash
+    from export import export_json
+    from json_stream import ClusterStream, StreamFormatError
+    from operations import validate_operations
+    from search_index import FieldIndex, SearchIndex
+    from workbench_db import WorkbenchDB, WorkbenchLockedError
+    from validation import (
+        ValidationError,
+        drop_duplicate_members,
+        index_members,
+        validate_clusters,
+        validate_document,
+    )
+
+
+class ClusterSizeIndex:
+    """Cluster sizes kept in sorted order for constant-time order statistics"""
+
+    def __init__(self):
+        # (member count, cluster_id) pairs, ascending
+        self._entries: List[Tuple[int, str]] = []
+
+    def copy(self) -> "ClusterSizeIndex":
+        """Return an independent copy of the index"""
+        copy = ClusterSizeIndex()
+        copy._entries = list(self._entries)
+        return copy
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, entries: List[Tuple[int, str]]):
+        """Replace the contents with entries in a single sort"""
+        self._entries = sorted(entries)
+
+    def add(self, size: int, cluster_id: str):
+        bisect.insort(self._entries, (size, cluster_id))
+
+    def remove(self, size: int, cluster_id: str):
+        i = bisect.bisect_left(self._entries, (size, cluster_id))
+        if i < len(self._entries) and self._entries[i] == (size, cluster_id):
+            del self._entries[i]
+
+    def min(self) -> int:
+        return self._entries[0][0] if self._entries else 0
+
+    def max(self) -> int:
+        return self._entries[-1][0] if self._entries else 0
+
+    def median(self) -> float:
+        n = len(self._entries)
+        if not n:
+            return 0
+        mid = n // 2
+        if n % 2:
+            return self._entries[mid][0]
+        return (self._entries[mid - 1][0] + self._entries[mid][0]) / 2
+
+    def largest(self, k: int) -> List[Tuple[int, str]]:
+        """Return the k largest (size, cluster_id) pairs, largest first"""
+        return self._entries[: -k - 1 : -1] if k > 0 else []
+
+
+class RelationshipIndex:
+    """Relationships between clusters with their reverse edges.
+
+    Forward edges come from each cluster's relationships list; the reverse
+    sets answer "which clusters point at this one" without a scan. Degrees
+    treat the graph as undirected and ignore relationships to clusters that
+    do not exist; they are kept up to date as clusters are added and
+    removed, so degree statistics never need a pass over the graph.
+    Connected components are left to GraphAnalytics.
+    """
+
+    def __init__(self):
+        # cluster_id -> ids it points at / ids pointing at it
+        self._out: Dict[str, Set[str]] = {}
+        self._in: Dict[str, Set[str]] = {}
+        # cluster_id -> number of neighbors, degree -> number of clusters
+        self._degrees: MutableMapping = {}
+        self._degree_counts: Dict[int, int] = {}
+        self._degree_total = 0
+
+    def layer(self) -> "LayeredRelationshipIndex":
+        """Return an index that starts out like this one and leaves it
+        unchanged when changed itself"""
+        return LayeredRelationshipIndex(self)
+
+    def clear(self):
+        self._out = {}
+        self._in = {}
+        self._degrees = {}
+        self._degree_counts = {}
+        self._degree_total = 0
+
+    def add(self, cluster_id: str, related_ids: List):
+        """Add a cluster (not currently added) and the relationships it lists"""
+        targets = set(map(str, related_ids))
+        self._out[cluster_id] = targets
+        for target in targets:
+            self._in.setdefault(target, set()).add(cluster_id)
+        related = self.neighbors(cluster_id)
+        self._set_degree(cluster_id, len(related))
+        for other in related:
+            self._set_degree(other, self._degrees[other] + 1)
+
+    def remove(self, cluster_id: str):
+        """Remove a cluster and the relationships it lists"""
+        self._drop_degree(cluster_id)
+        self._drop_edges(cluster_id)
+
+    def _drop_degree(self, cluster_id: str):
+        """Forget the degree of a cluster and its place in its neighbors'"""
+        if cluster_id in self._degrees:
+            for other in self.neighbors(cluster_id):
+                self._set_degree(other, self._degrees[other] - 1)
+            self._set_degree(cluster_id, None)
+
+    def _drop_edges(self, cluster_id: str):
+        for target in self._out.pop(cluster_id, ()):
+            referrers = self._in[target]
+            referrers.discard(cluster_id)
+            if not referrers:
+                del self._in[target]
+
+    def _set_degree(self, cluster_id: str, degree: Optional[int]):
+        """Record the degree of a cluster, or forget it if degree is None"""
+        counts = self._degree_counts
+        old = self._degrees.pop(cluster_id, None)
+        if old is not None:
+            self._degree_total -= old
+            counts[old] -= 1
+            if not counts[old]:
+                del counts[old]
+        if degree is not None:
+            self._degrees[cluster_id] = degree
+            self._degree_total += degree
+            counts[degree] = counts.get(degree, 0) + 1
+
+    def referrers(self, cluster_id: str) -> Set[str]:
+        """Ids of the clusters whose relationships list cluster_id"""
+        return set(self._in.get(cluster_id, ()))
+
+    def neighbors(self, cluster_id: str) -> Set[str]:
+        """Ids of existing clusters related to cluster_id in either direction"""
+        related = self._out.get(cluster_id, set()) | self._in.get(cluster_id, set())
+        related.discard(cluster_id)
+        return {other for other in related if other in self._out}
+
+    def stats(self) -> Dict[str, Any]:
+        """Degree statistics and the number of clusters without neighbors"""
+        counts = self._degree_counts
+        clusters = sum(counts.values())
+        return {
+            "min_degree": min(counts, default=0),
+            "max_degree": max(counts, default=0),
+            "avg_degree": round(self._degree_total / max(clusters, 1), 2),
+            "isolated_clusters": counts.get(0, 0),
+        }
+
+
+class LayeredRelationshipIndex(RelationshipIndex):
+    """A RelationshipIndex over a base index shared with other owners.
+
+    A cluster added or removed through the layer is hidden from the base,
+    which is never changed, and its relationships are kept by the layer.
+    """
+
+    def __init__(self, base: RelationshipIndex):
+        super().__init__()
+        self._base = base
+        # ids of the clusters whose base relationships no longer apply
+        self._hidden: Set[str] = set()
+        self._degrees = LayeredDict(base._degrees)
+        self._degree_counts = dict(base._degree_counts)
+        self._degree_total = base._degree_total
+
+    def clear(self):
+        super().clear()
+        self._base = RelationshipIndex()
+        self._hidden = set()
+
+    def add(self, cluster_id: str, related_ids: List):
+        self._hidden.add(cluster_id)
+        super().add(cluster_id, related_ids)
+
+    def remove(self, cluster_id: str):
+        self._drop_degree(cluster_id)
+        self._hidden.add(cluster_id)
+        self._drop_edges(cluster_id)
+
+    def referrers(self, cluster_id: str) -> Set[str]:
+        hidden = self._hidden
+        referrers = super().referrers(cluster_id)
+        referrers.update(
+            other for other in self._base._in.get(cluster_id, ()) if other not in hidden
+        )
+        return referrers
+
+    def neighbors(self, cluster_id: str) -> Set[str]:
+        if cluster_id in self._hidden:
+            related = set(self._out.get(cluster_id, ()))
+        else:
+            related = set(self._base._out.get(cluster_id, ()))
+        related |= self.referrers(cluster_id)
+        related.discard(cluster_id)
+        return {
+            other
+            for other in related
+            if other in self._out
+            or (other not in self._hidden and other in self._base._out)
+        }
+
+
+class LayeredDict(MutableMapping):
+    """A dict over a base dict shared with other owners, which is never
+    changed: entries set or deleted are kept by the layer"""
+
+    def __init__(self, base: Dict):
+        self._base = base
+        self._local: Dict = {}
+        # keys of the base deleted through the layer
+        self._deleted: Set = set()
+
+    def __contains__(self, key) -> bool:
+        return key in self._local or (key not in self._deleted and key in self._base)
+
+    def __getitem__(self, key):
+        if key in self._local:
+            return self._local[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        return self._base[key]
+
+    def __setitem__(self, key, value):
+        self._local[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._local.pop(key, None)
+        if key in self._base:
+            self._deleted.add(key)
+
+    def __iter__(self) -> Iterator:
+        yield from self._local
+        for key in self._base:
+            if key not in self._local and key not in self._deleted:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+# Most values per metadata field kept in the facet summary of binary
+# workbench files, which answers get_facet_counts until members are indexed
+STORED_FACET_LIMIT = 20
+
+# Lookup tables and indexes a manager shares with its base (see load_shared)
+_SHARED_INDEXES = (
+    "_cluster_index",
+    "_member_index",
+    "_member_owner",
+    "_search_index",
+    "_field_index",
+    "_relationships",
+    "_sizes",
+    "_positions",
+    "_total_members",
+    "_total_relationships",
+)
 
 
 class ClusterManager:
     """Main class to handle cluster operations and data management"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        max_history: int = 10,
+        max_history_bytes: int = 64 * 1024**2,
+        compact: bool = False,
+    ):
         self.data = {"clusters": []}
+        # Keep loaded clusters in a CompactStore instead of as dicts
+        self.compact = compact
+        self._store: Optional[CompactStore] = None
         self.history = []
-        self.max_history = 10
+        self.redo_history = []
+        self.max_history = max_history
+        # Approximate memory budget shared by the undo and redo histories
+        self.max_history_bytes = max_history_bytes
+        self._history_bytes = 0
         self.dragged_member = None
         self.drag_source_cluster = None
+        # id -> cluster and (cluster_id, member_id) -> member lookup tables
+        self._cluster_index: Dict[str, Dict] = {}
+        self._member_index: Dict[Tuple[str, str], Dict] = {}
+        self._search_index = SearchIndex()
+        self._field_index = FieldIndex()
+        # Running totals and size order, maintained as clusters are (un)indexed
+        self._total_members = 0
+        self._total_relationships = 0
+        self._sizes = ClusterSizeIndex()
+        self._relationships = RelationshipIndex()
+        # cluster_id -> position in self.data["clusters"], built on demand
+        self._positions: Optional[Dict[str, int]] = None
+        # Problems found by the last load_data / load_stream call, and the
+        # duplicate members it dropped when asked to resolve them
+        self.validation_errors: List[ValidationError] = []
+        self.resolved_duplicates: List[ValidationError] = []
+        # member_id -> id of the cluster holding it (kept by the store if compact)
+        self._member_owner: Dict[str, str] = {}
+        # Incremented on every change to the data, so that anything derived
+        # from it can be cached until the version moves on
+        self.version = 0
+        # Export bytes by format and options for the version in _exports_version
+        self._exports: Dict[tuple, bytes] = {}
+        self._exports_version = -1
+        # Manager loaded into a DatasetCache whose data this one shares: its
+        # lookup tables and indexes while _sharing (layers over them after),
+        # its clusters until they are changed (id of a base cluster -> the
+        # copy changed instead) and their member and relationship lists (ids
+        # in _shared_lists) until those are changed
+        self._base: Optional["ClusterManager"] = None
+        self._sharing = False
+        self._owned_clusters: Dict[int, Dict] = {}
+        self._shared_lists: Set[int] = set()
+        # SQLite file the workbench is saved to after every change, if opened
+        self._db: Optional[WorkbenchDB] = None
+        # False after load_binary or reopening a workbench file until the
+        # member lookup tables and the search and field indexes are first
+        # needed; until then facets come from the summary stored in the file
+        self._members_indexed = True
+        self._stored_facets: Optional[Dict] = None
+        # Graph analytics of the relationships, for the version it was built at
+        self._analytics: Optional[GraphAnalytics] = None
+        self._analytics_version = -1
 
-    def load_data(self, json_data: Dict) -> tuple[bool, str]:
-        """Load and validate JSON data"""
+    def load_data(
+        self,
+        json_data: Dict,
+        workers: Optional[int] = None,
+        resolve_duplicates: bool = False,
+    ) -> tuple:
+        """Load and validate JSON data.
+
+        Every problem found is kept in self.validation_errors; the first one
+        is returned as (False, error_code[, params]). Member ids used more than
+        once are an error unless resolve_duplicates is set, in which case only
+        the first occurrence is kept and the dropped ones are listed in
+        self.resolved_duplicates.
+        """
+        self.resolved_duplicates = []
         try:
-            # Basic structure validation
-            if not isinstance(json_data, dict):
-                return False, "invalid_json"
+            self.validation_errors = validate_document(
+                json_data, workers=workers, check_member_ids=False
+            )
+            if not self.validation_errors:
+                _, duplicates = index_members(json_data["clusters"])
+                if duplicates and resolve_duplicates:
+                    drop_duplicate_members(json_data["clusters"], duplicates)
+                    self.resolved_duplicates = duplicates
+                else:
+                    self.validation_errors = duplicates
+            if self.validation_errors:
+                return self.validation_errors[0].as_result()
 
-            if "clusters" not in json_data:
-                return False, "missing_clusters"
+            for cluster in json_data["clusters"]:
+                self._normalize_cluster(cluster)
+            self._install(json_data)
+            return True, "data_loaded"
+
+        except Exception as e:
+            return False, "unexpected_error", {"e": e}
 
-            if not isinstance(json_data["clusters"], list):
-                return False, "clusters_not_array"
+    def load_stream(
+        self,
+        stream: BinaryIO,
+        collect_all: bool = False,
+        resolve_duplicates: bool = False,
+    ) -> tuple:
+        """Load and validate JSON data from a binary file object.
 
-            if len(json_data["clusters"]) == 0:
+        Clusters are parsed and validated one at a time, so the first problem
+        is reported (with its character offset) without reading the rest of
+        the document. With collect_all the remaining clusters are still
+        validated, but not kept, so that self.validation_errors lists every
+        problem in the document. resolve_duplicates works as in load_data.
+        """
+        self.validation_errors = []
+        self.resolved_duplicates = []
+        try:
+            reader = ClusterStream(stream)
+            clusters = []
+            cluster_ids = set()
+            member_owners: Dict[str, str] = {}
+            for i, (offset, cluster) in enumerate(reader):
+                errors = validate_clusters([cluster], i, collect_all)
+                if not errors:
+                    cluster_id = str(cluster["id"])
+                    if cluster_id in cluster_ids:
+                        errors = [ValidationError("duplicate_ids", i, None, {"i": i})]
+                    cluster_ids.add(cluster_id)
+                if not errors:
+                    _, duplicates = index_members([cluster], i, member_owners)
+                    if duplicates and resolve_duplicates:
+                        drop_duplicate_members([cluster], duplicates, start=i)
+                        self.resolved_duplicates.extend(duplicates)
+                    else:
+                        errors = duplicates
+                if errors:
+                    self.validation_errors.extend(
+                        error._replace(params={**error.params, "offset": offset})
+                        for error in errors
+                    )
+                    if not collect_all:
+                        break
+                if self.validation_errors:
+                    # Keep validating, but the document will not be loaded
+                    continue
+
+                self._normalize_cluster(cluster)
+                clusters.append(cluster)
+
+            if self.validation_errors:
+                return self.validation_errors[0].as_result()
+            if not clusters:
                 return False, "no_clusters"
 
-            # Validate each cluster
-            for i, cluster in enumerate(json_data["clusters"]):
-                if not isinstance(cluster, dict):
-                    return False, "cluster_not_object", {"i": i}
-
-                # Check required keys
-                required_keys = ["id", "name", "members"]
-                missing_keys = [key for key in required_keys if key not in cluster]
-                if missing_keys:
-                    return False, "missing_keys", {"i": i, "missing_keys": missing_keys}
-
-                # Validate members
-                if not isinstance(cluster["members"], list):
-                    return False, "members_not_array", {"i": i}
-
-                # Validate each member
-                for j, member in enumerate(cluster["members"]):
-                    if not isinstance(member, dict):
-                        return False, "member_not_object", {"i": i, "j": j}
-
-                    member_required = ["id", "name"]
-                    member_missing = [
-                        key for key in member_required if key not in member
-                    ]
-                    if member_missing:
-                        return (
-                            False,
-                            "member_missing_keys",
-                            {"i": i, "j": j, "member_missing": member_missing},
-                        )
-
-                # Ensure relationships key exists
-                if "relationships" not in cluster:
-                    cluster["relationships"] = []
-                elif not isinstance(cluster["relationships"], list):
-                    cluster["relationships"] = []
-
-            # Check for duplicate cluster IDs
-            cluster_ids = [str(cluster["id"]) for cluster in json_data["clusters"]]
-            if len(cluster_ids) != len(set(cluster_ids)):
-                return False, "duplicate_ids"
-
-            self.data = json_data
-            self.save_state()
+            json_data = reader.extra
+            json_data["clusters"] = clusters
+            self._install(json_data)
             return True, "data_loaded"
 
+        except StreamFormatError as e:
+            if self.validation_errors:
+                return self.validation_errors[0].as_result()
+            self.validation_errors.append(ValidationError(e.code, params=e.params))
+            return (False, e.code, e.params) if e.params else (False, e.code)
+        except UnicodeDecodeError:
+            return False, "encoding_error"
+        except Exception as e:
+            return False, "unexpected_error", {"e": e}
+
+    def load_columnar(
+        self, stream: BinaryIO, resolve_duplicates: bool = False
+    ) -> tuple:
+        """Load a zip archive of tables written by export_columnar.
+
+        The tables are assembled into a cluster document which is then
+        validated and loaded like load_data.
+        """
+        self.validation_errors = []
+        self.resolved_duplicates = []
+        try:
+            json_data = read_archive(stream)
+        except ColumnarFormatError as e:
+            self.validation_errors.append(ValidationError(e.code, params=e.params))
+            return (False, e.code, e.params) if e.params else (False, e.code)
+        except Exception as e:
+            return False, "unexpected_error", {"e": e}
+        return self.load_data(json_data, resolve_duplicates=resolve_duplicates)
+
+    def load_binary(self, source) -> tuple:
+        """Open a binary workbench written by export_binary or save_binary.
+
+        source is the path of the file, which is mapped into memory, or its
+        contents. The file is not parsed or validated again: clusters are
+        views reading it as they are used, and changes are kept in memory
+        (compact storage does not apply). Only the clusters are indexed;
+        members are indexed on the first search, member lookup or change.
+        """
+        self.validation_errors = []
+        self.resolved_duplicates = []
+        try:
+            workbench = BinaryWorkbench(source)
+        except BinaryFormatError as e:
+            self.validation_errors.append(ValidationError(e.code, params=e.params))
+            return (False, e.code, e.params) if e.params else (False, e.code)
         except Exception as e:
             return False, "unexpected_error", {"e": e}
+        json_data = workbench.document()
+        json_data["clusters"] = list(workbench.clusters)
+        self._install(json_data, mapped=True, facets=workbench.facets())
+        return True, "data_loaded"
+
+    @staticmethod
+    def _normalize_cluster(cluster: Dict):
+        """Ensure a validated cluster has a relationships list"""
+        if not isinstance(cluster.get("relationships"), list):
+            cluster["relationships"] = []
+
+    def load_shared(
+        self,
+        stream: BinaryIO,
+        cache: DatasetCache,
+        columnar: bool = False,
+        collect_all: bool = False,
+        resolve_duplicates: bool = False,
+    ) -> tuple:
+        """Load a file like load_stream (or load_columnar), through a cache
+        shared with other sessions.
 
-    def save_state(self):
-        """Save current state to history"""
-        if len(self.history) >= self.max_history:
-            self.history.pop(0)
-        self.history.append(copy.deepcopy(self.data))
+        The file is parsed and validated only if no session loaded the same
+        content with the same options before. This manager then shares the
+        cached clusters and indexes: its first change gives it its own
+        cluster list and layers over the indexes, and each cluster (and each
+        of its member lists) is only copied when a change reaches it.
+        Compact storage builds its own store from the cached clusters.
+        """
+        digest, size = content_hash(stream)
+        key = (digest, columnar, resolve_duplicates)
+        base = cache.get(key)
+        if base is None:
+            base = ClusterManager()
+            if columnar:
+                result = base.load_columnar(stream, resolve_duplicates)
+            else:
+                result = base.load_stream(stream, collect_all, resolve_duplicates)
+            if not result[0]:
+                self.validation_errors = base.validation_errors
+                self.resolved_duplicates = []
+                return result
+            cache.put(key, base, size)
+        self.validation_errors = []
+        self.resolved_duplicates = base.resolved_duplicates
+        if self.compact:
+            self._install({**base.data, "clusters": list(base.data["clusters"])})
+        else:
+            self._install(base.data, base)
+        return True, "data_loaded"
+
+    def _install(
+        self,
+        json_data: Dict,
+        base: Optional["ClusterManager"] = None,
+        mapped: bool = False,
+        facets: Optional[Dict] = None,
+    ):
+        """Make validated data the workbench contents with a fresh history.
+
+        With base, json_data is base.data and is shared with base, along
+        with its indexes, until the first change. mapped clusters are read
+        from a binary workbench file and are not put in compact storage.
+        Clusters read from a file (mapped, or given with the facet summary
+        saved with them) have their members indexed later.
+        """
+        self._store = None
+        self._base = base
+        self._sharing = base is not None
+        self._owned_clusters = {}
+        self._shared_lists = set()
+        self._stored_facets = facets
+        if self.compact and not mapped:
+            self._store = CompactStore()
+            json_data["clusters"] = self._store.load(json_data["clusters"])
+        self._field_index = (
+            FieldIndex() if self._store is None else CompactFieldIndex(self._store)
+        )
+        self.data = json_data
+        self.version += 1
+        if base is not None:
+            for name in _SHARED_INDEXES:
+                setattr(self, name, getattr(base, name))
+        else:
+            self._rebuild_index(defer_members=mapped or facets is not None)
+        self.history = []
+        self.redo_history = []
+        self._history_bytes = 0
+        self.save_state("load")
+        if self._db is not None:
+            self._db.write_all(self.data, self._facet_summary())
+
+    def save_state(self, operation: str = "checkpoint", changes: Optional[List] = None):
+        """Record an operation and the changes it made in the history"""
+        changes = changes or []
+        entry = {
+            "operation": operation,
+            "changes": changes,
+            "bytes": self._estimate_changes_size(changes),
+        }
+        self.history.append(entry)
+        self._history_bytes += entry["bytes"]
+        self._trim_history()
+
+    def _trim_history(self):
+        """Evict history entries beyond the count or byte budget.
+
+        history[0] is the state undo stops at, so the oldest undoable entries
+        go first, then the redo entries furthest from the current state. The
+        newest entry and the next one to redo are kept even when either alone
+        is over the byte budget, so the last operation can always be undone.
+        """
+        while len(self.history) > max(self.max_history, 1) or (
+            self._history_bytes > self.max_history_bytes and len(self.history) > 2
+        ):
+            self._history_bytes -= self.history.pop(1)["bytes"]
+        while (
+            self._history_bytes > self.max_history_bytes and len(self.redo_history) > 1
+        ):
+            self._history_bytes -= self.redo_history.pop(0)["bytes"]
+
+    @staticmethod
+    def _estimate_changes_size(changes: List) -> int:
+        """Approximate the memory kept alive by a list of history changes"""
+        size = sys.getsizeof(changes)
+        for change in changes:
+            size += sys.getsizeof(change)
+            for value in change[1:]:
+                if isinstance(value, (MutableSequence, Mapping)):
+                    size += sys.getsizeof(value)
+                if isinstance(value, Mapping) and "members" in value:
+                    size += sys.getsizeof(value["members"])
+                    size += sum(sys.getsizeof(m) for m in value["members"])
+        return size
 
     def undo(self) -> bool:
         """Undo last operation"""
         if len(self.history) > 1:
-            self.history.pop()  # Remove current state
-            self.data = copy.deepcopy(self.history[-1])
+            entry = self.history.pop()
+            for change in reversed(entry["changes"]):
+                self._apply_change(change, undo=True)
+            self._settle_owners(entry["changes"])
+            self._persist(entry["changes"])
+            self.redo_history.append(entry)
+            self._trim_history()
             return True
         return False
 
+    def redo(self) -> bool:
+        """Redo the last undone operation"""
+        if self.redo_history:
+            entry = self.redo_history.pop()
+            for change in entry["changes"]:
+                self._apply_change(change, undo=False)
+            self._settle_owners(entry["changes"])
+            self._persist(entry["changes"])
+            self.history.append(entry)
+            self._trim_history()
+            return True
+        return False
+
+    def clear(self):
+        """Remove all clusters from the workbench"""
+        self._commit("clear", [("replace", self.data["clusters"], [])])
+
+    def _commit(self, operation: str, changes: List):
+        """Apply changes and record them as a single undoable operation.
+
+        Each change carries enough information to be applied in either
+        direction, so history cost is proportional to what the operation
+        touched rather than to the size of the dataset:
+
+        - ("set", cluster_id, key, before, after)
+        - ("extend", cluster_id, key, items)
+        - ("insert", index, cluster) / ("remove", index, cluster)
+        - ("replace", before_clusters, after_clusters)
+        """
+        applied: List = []
+        try:
+            self._apply_changes(changes, applied)
+        except Exception:
+            self._rollback(applied)
+            raise
+        self._record(operation, applied)
+
+    def _apply_changes(self, changes: List, applied: List):
+        """Apply changes in order, appending each one to applied once done"""
+        if self._sharing:
+            self._unshare()
+        for change in changes:
+            self._apply_change(change, undo=False)
+            applied.append(self._as_stored(change))
+
+    def _as_stored(self, change: tuple) -> tuple:
+        """Return a change just applied with the value or cluster it put in
+        the workbench as stored there (compact storage wraps them), so that
+        redoing it puts back the same object later changes refer to"""
+        kind = change[0]
+        if kind == "set":
+            return change[:4] + (self._cluster_index[change[1]][change[2]],)
+        if kind == "insert":
+            return change[:2] + (self.data["clusters"][change[1]],)
+        return change
+
+    def _unshare(self):
+        """Stop sharing the lookup tables and indexes of the base before the
+        first change.
+
+        The cluster list, the id -> cluster table and the size order are
+        copied, which only copies references. The member tables and the
+        search, field and relationship indexes become layers over those of
+        the base, which only hold the clusters this manager changes.
+        Clusters are copied by _own_cluster when a change first reaches them.
+        """
+        self.data = {**self.data, "clusters": list(self.data["clusters"])}
+        self._cluster_index = dict(self._cluster_index)
+        self._sizes = self._sizes.copy()
+        self._member_index = LayeredDict(self._member_index)
+        self._member_owner = LayeredDict(self._member_owner)
+        self._search_index = self._search_index.layer()
+        self._field_index = self._field_index.layer()
+        self._relationships = self._relationships.layer()
+        self._sharing = False
+
+    def _own_cluster(self, cluster_id: str) -> Dict:
+        """Return the cluster with an id, first replacing it by a copy if it
+        is still the base's.
+
+        The copy shares the member and relationship lists of the base
+        cluster; those are copied when a change extends them.
+        """
+        cluster = self._cluster_index[cluster_id]
+        if self._base is None or cluster is not self._base._cluster_index.get(
+            cluster_id
+        ):
+            return cluster
+        copy = dict(cluster)
+        self.data["clusters"][self._position_of(cluster)] = copy
+        self._cluster_index[cluster_id] = copy
+        self._owned_clusters[id(cluster)] = copy
+        self._shared_lists.update(
+            id(cluster[key]) for key in ("members", "relationships")
+        )
+        return copy
+
+    def _rollback(self, applied: List):
+        """Undo changes applied by _apply_changes that will not be recorded"""
+        for change in reversed(applied):
+            self._apply_change(change, undo=True)
+        self._settle_owners(applied)
+        del applied[:]
+
+    def _record(self, operation: str, changes: List):
+        """Record applied changes as one history entry, dropping the redo stack"""
+        self._settle_owners(changes)
+        self._persist(changes)
+        self._history_bytes -= sum(entry["bytes"] for entry in self.redo_history)
+        self.redo_history = []
+        self.save_state(operation, changes)
+
+    def _apply_change(self, change: tuple, undo: bool):
+        """Apply a single history change forwards or backwards"""
+        self._index_all_members()
+        self.version += 1
+        kind = change[0]
+        if kind == "set":
+            _, cluster_id, key, before, after = change
+            cluster = self._own_cluster(cluster_id)
+            value = before if undo else after
+            # Names and relationships are indexed per cluster; only a change
+            # of members has to index the cluster's members again
+            if key == "name":
+                self._search_index.rename(cluster_id, cluster["name"], value)
+                cluster["name"] = value
+            elif key == "relationships":
+                self._total_relationships += len(value) - len(
+                    cluster.get("relationships", [])
+                )
+                self._relationships.remove(cluster_id)
+                cluster["relationships"] = value
+                self._relationships.add(cluster_id, value)
+            else:
+                self._unindex_cluster(cluster)
+                cluster[key] = value
+                self._index_cluster(cluster)
+        elif kind == "extend":
+            _, cluster_id, key, items = change
+            cluster = self._own_cluster(cluster_id)
+            self._unindex_cluster(cluster)
+            # Lists shared with a base manager or read from a binary file
+            # are replaced by a copy instead of extended
+            if id(cluster[key]) in self._shared_lists or not isinstance(
+                cluster[key], MutableSequence
+            ):
+                cluster[key] = list(cluster[key])
+            if undo:
+                del cluster[key][len(cluster[key]) - len(items) :]
+            else:
+                cluster[key].extend(items)
+            self._index_cluster(cluster)
+        elif kind in ("insert", "remove"):
+            _, index, cluster = change
+            # Changes made before a base cluster was copied still refer to it
+            cluster = self._owned_clusters.get(id(cluster), cluster)
+            if (kind == "insert") == undo:
+                del self.data["clusters"][index]
+                self._unindex_cluster(cluster)
+            else:
+                self.data["clusters"].insert(index, self._new_cluster(cluster))
+                self._index_cluster(self.data["clusters"][index])
+            self._positions = None
+        elif kind == "replace":
+            _, before, after = change
+            clusters = before if undo else after
+            # The base's cluster list is never changed in place
+            if self._base is not None and clusters is self._base.data["clusters"]:
+                clusters = list(clusters)
+            self.data["clusters"] = clusters
+            self._rebuild_index()
+        else:
+            raise ValueError(f"Unknown history change: {kind}")
+
+    def _settle_owners(self, changes: List):
+        """Record the owners of the members of every cluster changes touched.
+
+        Within an operation a member can briefly sit in two clusters (a merge
+        extends one cluster before removing the other), and unindexing either
+        of them forgets its owner, so owners are claimed again at the end.
+        """
+        for cluster_id in self._touched_clusters(changes, members_only=True):
+            cluster = self._cluster_index.get(cluster_id)
+            if cluster is not None:
+                self._claim_members(cluster)
+
+    @staticmethod
+    def _touched_clusters(changes: List, members_only: bool = False) -> Set[str]:
+        """Return the ids of the clusters changes set, extended, inserted or
+        removed, leaving out those whose members they left alone if
+        members_only is set"""
+        touched = set()
+        for change in changes:
+            if change[0] in ("set", "extend"):
+                if not members_only or change[2] == "members":
+                    touched.add(change[1])
+            elif change[0] in ("insert", "remove"):
+                touched.add(str(change[2]["id"]))
+        return touched
+
+    def _persist(self, changes: List):
+        """Write what changes touched to the open workbench file, if any"""
+        if self._db is None:
+            return
+        if any(change[0] == "replace" for change in changes):
+            self._db.write_all(self.data, self._facet_summary())
+        else:
+            self._db.update(
+                self.data["clusters"],
+                self._cluster_positions(),
+                self._touched_clusters(changes),
+            )
+
+    def _new_cluster(self, cluster: Dict) -> Dict:
+        """Return cluster in the form the workbench stores clusters in"""
+        return cluster if self._store is None else self._store.add_cluster(cluster)
+
+    def _cluster_positions(self) -> Dict[str, int]:
+        """Return cluster_id -> position in self.data["clusters"]"""
+        if self._positions is None:
+            self._positions = {
+                str(cluster["id"]): i for i, cluster in enumerate(self.data["clusters"])
+            }
+        return self._positions
+
+    def _position_of(self, cluster: Dict) -> int:
+        """Return the position of a cluster object in self.data["clusters"]"""
+        return self._cluster_positions()[str(cluster["id"])]
+
+    def _rebuild_index(self, defer_members: bool = False):
+        """Rebuild the cluster and member lookup tables from self.data,
+        leaving the members to _index_all_members if defer_members is set"""
+        self._members_indexed = not defer_members
+        self._cluster_index = {}
+        self._member_index = {}
+        self._member_owner = {}
+        self._search_index.clear()
+        self._field_index.clear()
+        self._relationships.clear()
+        self._positions = None
+        self._total_members = 0
+        self._total_relationships = 0
+        if self._store is not None:
+            self._store.release_all()
+        for cluster in self.data["clusters"]:
+            self._index_cluster(cluster, track_size=False)
+        self._sizes.load(
+            [(len(c["members"]), str(c["id"])) for c in self.data["clusters"]]
+        )
+
+    def _index_cluster(self, cluster: Dict, track_size: bool = True):
+        """Add a cluster and its members to the lookup tables"""
+        cluster_id = str(cluster["id"])
+        self._cluster_index[cluster_id] = cluster
+        self._total_members += len(cluster["members"])
+        self._total_relationships += len(cluster.get("relationships", []))
+        if track_size:
+            self._sizes.add(len(cluster["members"]), cluster_id)
+        self._relationships.add(cluster_id, cluster.get("relationships", []))
+        if self._members_indexed:
+            self._index_members(cluster_id, cluster)
+
+    def _index_members(self, cluster_id: str, cluster: Dict):
+        """Add the members of a cluster to the member lookup tables and the
+        search and field indexes"""
+        self._claim_members(cluster)
+        self._search_index.add(
+            cluster_id, [cluster["name"], *(m["name"] for m in cluster["members"])]
+        )
+        self._field_index.add(cluster_id, cluster["members"])
+
+    def _index_all_members(self):
+        """Index the members of every cluster if loading left them for later"""
+        if self._members_indexed:
+            return
+        self._members_indexed = True
+        for cluster in self.data["clusters"]:
+            self._index_members(str(cluster["id"]), cluster)
+
+    def _claim_members(self, cluster: Dict):
+        """Record cluster as the owner of each of its members"""
+        if self._store is not None:
+            self._store.claim(cluster)
+            return
+        cluster_id = str(cluster["id"])
+        for member in cluster["members"]:
+            member_id = str(member["id"])
+            self._member_index.setdefault((cluster_id, member_id), member)
+            self._member_owner[member_id] = cluster_id
+
+    def _unindex_cluster(self, cluster: Dict):
+        """Remove a cluster and its members from the lookup tables"""
+        cluster_id = str(cluster["id"])
+        self._cluster_index.pop(cluster_id, None)
+        self._total_members -= len(cluster["members"])
+        self._total_relationships -= len(cluster.get("relationships", []))
+        self._sizes.remove(len(cluster["members"]), cluster_id)
+        self._relationships.remove(cluster_id)
+        if self._store is not None:
+            self._store.release(cluster)
+        else:
+            for member in cluster["members"]:
+                member_id = str(member["id"])
+                self._member_index.pop((cluster_id, member_id), None)
+                if self._member_owner.get(member_id) == cluster_id:
+                    del self._member_owner[member_id]
+        self._search_index.remove(cluster_id)
+        self._field_index.remove(cluster_id, cluster["members"])
+
     def get_cluster_by_id(self, cluster_id: str) -> Optional[Dict]:
         """Get cluster by ID"""
-        for cluster in self.data["clusters"]:
-            if str(cluster["id"]) == str(cluster_id):
-                return cluster
-        return None
+        return self._cluster_index.get(str(cluster_id))
 
     def get_member_by_id(self, cluster_id: str, member_id: str) -> Optional[Dict]:
         """Get member by ID from a specific cluster"""
-        cluster = self.get_cluster_by_id(cluster_id)
-        if cluster:
-            for member in cluster["members"]:
-                if str(member["id"]) == str(member_id):
-                    return member
-        return None
+        self._index_all_members()
+        if self._store is not None:
+            cluster = self._cluster_index.get(str(cluster_id))
+            return None if cluster is None else self._store.member(cluster, member_id)
+        return self._member_index.get((str(cluster_id), str(member_id)))
+
+    def get_member_owner(self, member_id: str) -> Optional[str]:
+        """Get the ID of the cluster holding a member"""
+        self._index_all_members()
+        if self._store is not None:
+            return self._store.owner_of(member_id)
+        return self._member_owner.get(str(member_id))
 
-    def get_metrics(self) -> Dict[str, Any]:
-        """Calculate cluster metrics"""
+    def get_metrics(self, top_k: int = 5) -> Dict[str, Any]:
+        """Return cluster metrics from the running totals kept by the index"""
         total_clusters = len(self.data["clusters"])
-        total_members = sum(
-            len(cluster["members"]) for cluster in self.data["clusters"]
-        )
-        total_relationships = sum(
-            len(cluster.get("relationships", [])) for cluster in self.data["clusters"]
-        )
+        total_members = self._total_members
+        total_relationships = self._total_relationships
         avg_members = total_members / max(total_clusters, 1)
 
         return {
@@ -125,155 +1011,617 @@ class ClusterManager:
             "total_members": total_members,
             "avg_members_per_cluster": round(avg_members, 2),
             "total_relationships": total_relationships,
+            "min_cluster_size": self._sizes.min(),
+            "max_cluster_size": self._sizes.max(),
+            "median_cluster_size": self._sizes.median(),
+            "largest_clusters": [
+                {
+                    "id": cluster_id,
+                    "name": self._cluster_index[cluster_id]["name"],
+                    "members": size,
+                }
+                for size, cluster_id in self._sizes.largest(top_k)
+            ],
+            **self._relationships.stats(),
+            "history_depth": len(self.history) - 1 if self.history else 0,
+            "redo_depth": len(self.redo_history),
+            "history_bytes": self._history_bytes,
         }
 
+    def get_neighbors(self, cluster_id: str) -> Set[str]:
+        """Get the IDs of clusters related to a cluster in either direction"""
+        return self._relationships.neighbors(str(cluster_id))
+
+    def get_referrers(self, cluster_id: str) -> Set[str]:
+        """Get the IDs of clusters whose relationships point at a cluster"""
+        return self._relationships.referrers(str(cluster_id))
+
+    def get_analytics(self) -> GraphAnalytics:
+        """Return graph analytics of the relationships, kept until the data
+        changes so that components and centralities are only computed once
+        """
+        if self._analytics is None or self._analytics_version != self.version:
+            self._analytics = GraphAnalytics(self.data["clusters"])
+            self._analytics_version = self.version
+        return self._analytics
+
+    def search_cluster_ids(self, query: str) -> Set[str]:
+        """Return ids of clusters matching query.
+
+        Free text is matched against cluster and member names. Terms of the
+        form field:value (or field:"quoted value") where field is a member
+        metadata field keep only clusters with a member having that value for
+        every such field; other terms are treated as free text.
+        """
+        self._index_all_members()
+        filters, text = self._field_index.parse_query(query)
+        matching_ids = None
+        if filters:
+            matching_ids = {
+                cluster_id for cluster_id, _ in self._field_index.match(filters)
+            }
+        if text or matching_ids is None:
+            text_ids = self._search_index.search(text)
+            matching_ids = text_ids if matching_ids is None else matching_ids & text_ids
+        return matching_ids
+
+    def get_facet_fields(self) -> List[str]:
+        """Return the member metadata fields that can be searched as field:value"""
+        if not self._members_indexed and self._stored_facets is not None:
+            return list(self._stored_facets["counts"])
+        self._index_all_members()
+        return self._field_index.fields
+
+    def get_facet_counts(
+        self, fields: Optional[List[str]] = None, limit: Optional[int] = 5
+    ) -> Dict[str, List[Tuple[str, int]]]:
+        """Return the most common values and their member counts per metadata field"""
+        stored = self._stored_facets
+        if (
+            not self._members_indexed
+            and stored is not None
+            and limit is not None
+            and limit <= stored["limit"]
+            and set(fields or ()) <= set(stored["counts"])
+        ):
+            return {
+                field: [tuple(count) for count in stored["counts"][field][:limit]]
+                for field in (stored["counts"] if fields is None else fields)
+            }
+        self._index_all_members()
+        if fields is None:
+            fields = self._field_index.fields
+        return {field: self._field_index.facet_counts(field, limit) for field in fields}
+
     def search_clusters(self, query: str) -> List[Dict]:
         """Search clusters by name or member name"""
         if not query:
             return self.data["clusters"]
 
-        query = query.lower()
-        matching_clusters = []
+        positions = self._cluster_positions()
+        matching_ids = sorted(self.search_cluster_ids(query), key=positions.__getitem__)
+        return [self._cluster_index[cluster_id] for cluster_id in matching_ids]
 
-        for cluster in self.data["clusters"]:
-            # Search in cluster name
-            if query in cluster["name"].lower():
-                matching_clusters.append(cluster)
+    def find_clusters(self, query: str, limit: int = 20) -> List[Dict]:
+        """Return up to limit clusters matching query, best matches first.
+
+        The query is matched like search_clusters, and also against cluster
+        ids. A cluster whose id is the query ranks first, then clusters whose
+        name starts with it, then names containing it, then clusters that
+        only match through their members; ties keep workbench order.
+        """
+        query = query.strip()
+        if not query:
+            return self.data["clusters"][:limit]
+        needle = query.lower()
+        candidates = self.search_cluster_ids(query)
+        if query in self._cluster_index:
+            candidates.add(query)
+        positions = self._cluster_positions()
+        cluster_index = self._cluster_index
+
+        def rank(cluster_id: str) -> Tuple[int, int]:
+            name = str(cluster_index[cluster_id]["name"]).lower()
+            if cluster_id.lower() == needle:
+                tier = 0
+            elif name.startswith(needle):
+                tier = 1
+            elif needle in name:
+                tier = 2
+            else:
+                tier = 3
+            return tier, positions[cluster_id]
+
+        return [
+            cluster_index[cluster_id]
+            for cluster_id in heapq.nsmallest(limit, candidates, key=rank)
+        ]
+
+    def find_members(
+        self, cluster_id: str, query: str, limit: Optional[int] = None
+    ) -> List[Dict]:
+        """Return up to limit members of a cluster matching query, in order.
+
+        Free text is matched against member names and ids; field:value
+        terms keep only members with that metadata value, as in searches.
+        """
+        cluster = self.get_cluster_by_id(cluster_id)
+        if cluster is None:
+            return []
+        self._index_all_members()
+        filters, text = self._field_index.parse_query(query)
+        needle = text.strip().lower()
+        allowed = None
+        if filters:
+            cluster_id = str(cluster_id)
+            allowed = {
+                member_id
+                for owner, member_id in self._field_index.match(filters)
+                if owner == cluster_id
+            }
+        found = []
+        for member in cluster["members"]:
+            if limit is not None and len(found) >= limit:
+                break
+            member_id = str(member["id"])
+            if allowed is not None and member_id not in allowed:
                 continue
+            if (
+                needle
+                and needle not in str(member["name"]).lower()
+                and needle not in member_id.lower()
+            ):
+                continue
+            found.append(member)
+        return found
 
-            # Search in member names
-            for member in cluster["members"]:
-                if query in member["name"].lower():
-                    matching_clusters.append(cluster)
-                    break
+    def select_members(self, cluster_id: str, rule: str) -> Optional[List[str]]:
+        """Return the ids of a cluster's members matching every term of a
+        rule such as `department:Engineering level:3`, in cluster order.
 
-        return matching_clusters
+        Returns None unless the rule is made of field:value terms on
+        indexed metadata fields only.
+        """
+        self._index_all_members()
+        filters, text = self._field_index.parse_query(rule)
+        if not filters or text:
+            return None
+        return [str(member["id"]) for member in self.find_members(cluster_id, rule)]
 
-    def merge_clusters(self, cluster1_id: str, cluster2_id: str, new_name: str) -> bool:
-        """Merge two clusters into one"""
+    def _cached_export(self, key: tuple, build) -> bytes:
+        """Return build(), reusing the result until the data changes"""
+        if self._exports_version != self.version:
+            self._exports = {}
+            self._exports_version = self.version
+        if key not in self._exports:
+            self._exports[key] = build()
+        return self._exports[key]
+
+    def export_json(self, compact: bool = False, compress: bool = False) -> bytes:
+        """Return the workbench as JSON bytes, cached until the data changes.
+
+        The document is encoded in chunks rather than as one string; compact
+        drops the indentation and compress gzips the output.
+        """
+        return self._cached_export(
+            ("json", compact, compress),
+            lambda: export_json(self.data, compact, compress),
+        )
+
+    def export_columnar(self, fmt: str = "parquet") -> bytes:
+        """Return the workbench as a zip of clusters, members and relationships
+        tables in fmt ("parquet", "feather" or "csv"), cached like export_json
+        """
+        return self._cached_export(
+            ("columnar", fmt), lambda: export_archive(self.data["clusters"], fmt)
+        )
+
+    def export_binary(self) -> bytes:
+        """Return the workbench as a binary workbench file, cached like
+        export_json"""
+        return self._cached_export(
+            ("binary",), lambda: export_binary(self.data, self._facet_summary())
+        )
+
+    def save_binary(self, path: str) -> tuple:
+        """Write the workbench to a binary workbench file for load_binary.
+
+        A file already at path is replaced, not overwritten, so a workbench
+        reading it (this one included) is not disturbed.
+        """
         try:
-            cluster1 = self.get_cluster_by_id(cluster1_id)
-            cluster2 = self.get_cluster_by_id(cluster2_id)
+            save_binary(self.data, path, self._facet_summary())
+        except OSError as e:
+            return False, "binary_save_error", {"e": e}
+        return True, "binary_saved"
 
-            if not cluster1 or not cluster2:
-                return False
+    def _facet_summary(self) -> Dict:
+        """The facets stored in binary workbench files"""
+        return {
+            "limit": STORED_FACET_LIMIT,
+            "counts": self.get_facet_counts(limit=STORED_FACET_LIMIT),
+        }
+
+    def open_workbench(self, path: str) -> tuple:
+        """Keep the workbench in a SQLite file from now on.
+
+        A file holding a saved workbench is loaded, with a fresh history and
+        without validating it again; its members are indexed on the first
+        search, member lookup or change, as after load_binary. Otherwise the
+        current data is saved to it. From then on every change writes only
+        the clusters it touched. A file another workbench has open is not
+        opened, since the two would overwrite each other's changes.
+        """
+        if (
+            self._db is not None
+            and os.path.exists(path)
+            and os.path.samefile(self._db.path, path)
+        ):
+            self.close_workbench()
+        try:
+            db = WorkbenchDB(path)
+        except WorkbenchLockedError:
+            return False, "workbench_locked", {"path": path}
+        except (sqlite3.Error, ValueError) as e:
+            return False, "workbench_error", {"e": e}
+        try:
+            json_data = None if db.is_empty() else db.load()
+            facets = db.facets()
+        except (sqlite3.Error, ValueError) as e:
+            db.close()
+            return False, "workbench_error", {"e": e}
+        self.close_workbench()
+        if json_data is None:
+            db.write_all(self.data, self._facet_summary())
+            self._db = db
+            return True, "workbench_created"
+        self.validation_errors = []
+        self.resolved_duplicates = []
+        self._install(json_data, facets=facets)
+        self._db = db
+        return True, "workbench_opened"
 
-            self.save_state()
+    def close_workbench(self):
+        """Stop saving to the workbench file, if one is open"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
 
-            # Combine members (remove duplicates by ID)
-            existing_member_ids = {str(m["id"]) for m in cluster1["members"]}
-            for member in cluster2["members"]:
-                if str(member["id"]) not in existing_member_ids:
-                    cluster1["members"].append(member)
+    @property
+    def workbench_path(self) -> Optional[str]:
+        """Path of the open workbench file, if any"""
+        return None if self._db is None else self._db.path
 
-            # Combine relationships (remove duplicates and self-references)
-            combined_relationships = set(cluster1.get("relationships", []))
-            combined_relationships.update(cluster2.get("relationships", []))
-            combined_relationships.discard(cluster1_id)
-            combined_relationships.discard(cluster2_id)
+    def save_snapshot(self, name: str) -> tuple:
+        """Keep a copy of the saved workbench under name in its file"""
+        if self._db is None:
+            return False, "no_workbench_file"
+        self._db.save_snapshot(name)
+        return True, "snapshot_saved"
 
-            cluster1["relationships"] = list(combined_relationships)
-            cluster1["name"] = new_name
+    def list_snapshots(self) -> List[Tuple[str, str, int]]:
+        """(name, creation time, number of clusters) of the saved snapshots"""
+        return [] if self._db is None else self._db.snapshots()
 
-            # Remove cluster2 and update relationships pointing to it
-            self.data["clusters"] = [
-                c for c in self.data["clusters"] if str(c["id"]) != str(cluster2_id)
-            ]
+    def restore_snapshot(self, name: str) -> tuple:
+        """Replace the clusters with those of a snapshot, as an undoable step"""
+        if self._db is None:
+            return False, "no_workbench_file"
+        document = self._db.load_snapshot(name)
+        if document is None:
+            return False, "unknown_snapshot", {"name": name}
+        clusters = [self._new_cluster(cluster) for cluster in document["clusters"]]
+        self._commit("restore_snapshot", [("replace", self.data["clusters"], clusters)])
+        return True, "snapshot_restored"
+
+    def apply_batch(self, operations: List[Dict]) -> tuple:
+        """Apply a list of operations as one undoable step.
+
+        Operations are the dicts described in operations.py. The whole batch
+        is checked first; it is then applied in order, each operation seeing
+        the result of the ones before it, and recorded as a single history
+        entry. If any operation cannot be applied, everything the batch
+        changed is rolled back. Returns (True, "batch_applied") or
+        (False, error_code, params) like load_data.
+        """
+        errors = validate_operations(operations, self._cluster_index)
+        if errors:
+            return errors[0].as_result()
+
+        applied: List = []
+        try:
+            for number, operation in enumerate(operations, 1):
+                changes = self._operation_changes(operation)
+                if changes is None:
+                    self._rollback(applied)
+                    params = {"number": number, "op": operation["op"]}
+                    return False, "operation_failed", params
+                self._apply_changes(changes, applied)
+        except Exception as e:
+            self._rollback(applied)
+            return False, "unexpected_error", {"e": e}
+        self._record("batch", applied)
+        return True, "batch_applied"
 
-            # Update relationships in other clusters
-            for cluster in self.data["clusters"]:
-                if str(cluster2_id) in cluster.get("relationships", []):
-                    cluster["relationships"].remove(str(cluster2_id))
-                    if str(cluster1_id) not in cluster["relationships"]:
-                        cluster["relationships"].append(str(cluster1_id))
+    def _operation_changes(self, operation: Dict) -> Optional[List]:
+        """Return the changes an operation dict makes, or None if it cannot run"""
+        op = operation["op"]
+        if op == "move":
+            return self._move_changes(
+                operation["source"], operation["target"], operation["members"]
+            )
+        if op == "merge":
+            return self._merge_changes(
+                operation["cluster1"], operation["cluster2"], operation["name"]
+            )
+        if op == "split":
+            return self._split_changes(
+                operation["cluster"],
+                operation["members"],
+                operation["name"],
+                operation.get("id"),
+            )
+        if op == "reassign":
+            return self._reassign_changes(operation["assignments"])
+        return None
 
+    def merge_clusters(self, cluster1_id: str, cluster2_id: str, new_name: str) -> bool:
+        """Merge two clusters into one"""
+        try:
+            changes = self._merge_changes(cluster1_id, cluster2_id, new_name)
+            if changes is None:
+                return False
+            self._commit("merge", changes)
             return True
         except Exception:
             return False
 
+    def _merge_changes(
+        self, cluster1_id: str, cluster2_id: str, new_name: str
+    ) -> Optional[List]:
+        cluster1 = self.get_cluster_by_id(cluster1_id)
+        cluster2 = self.get_cluster_by_id(cluster2_id)
+
+        if not cluster1 or not cluster2 or cluster1 is cluster2:
+            return None
+
+        cluster1_id = str(cluster1["id"])
+        cluster2_id = str(cluster2["id"])
+
+        # Combine members (remove duplicates by ID)
+        existing_member_ids = {str(m["id"]) for m in cluster1["members"]}
+        new_members = [
+            m for m in cluster2["members"] if str(m["id"]) not in existing_member_ids
+        ]
+
+        # Combine relationships (remove duplicates and self-references)
+        combined_relationships = set(cluster1.get("relationships", []))
+        combined_relationships.update(cluster2.get("relationships", []))
+        combined_relationships.discard(cluster1_id)
+        combined_relationships.discard(cluster2_id)
+
+        changes = [
+            ("extend", cluster1_id, "members", new_members),
+            (
+                "set",
+                cluster1_id,
+                "relationships",
+                cluster1.get("relationships", []),
+                list(combined_relationships),
+            ),
+            ("set", cluster1_id, "name", cluster1["name"], new_name),
+            # Remove cluster2 and update relationships pointing to it
+            ("remove", self._position_of(cluster2), cluster2),
+        ]
+
+        # Update relationships in the clusters pointing at cluster2
+        positions = self._cluster_positions()
+        referrers = self._relationships.referrers(cluster2_id)
+        referrers -= {cluster1_id, cluster2_id}
+        for cluster_id in sorted(referrers, key=positions.__getitem__):
+            relationships = self._cluster_index[cluster_id].get("relationships", [])
+            updated = [r for r in relationships if str(r) != cluster2_id]
+            if cluster1_id not in updated:
+                updated.append(cluster1_id)
+            changes.append(("set", cluster_id, "relationships", relationships, updated))
+        return changes
+
     def move_members(
         self, source_cluster_id: str, target_cluster_id: str, member_ids: List[str]
     ) -> bool:
         """Move members from source to target cluster"""
         try:
-            source_cluster = self.get_cluster_by_id(source_cluster_id)
-            target_cluster = self.get_cluster_by_id(target_cluster_id)
-
-            if not source_cluster or not target_cluster:
+            changes = self._move_changes(
+                source_cluster_id, target_cluster_id, member_ids
+            )
+            if changes is None:
                 return False
+            self._commit("move", changes)
+            return True
+        except Exception:
+            return False
 
-            self.save_state()
+    def _move_changes(
+        self, source_cluster_id: str, target_cluster_id: str, member_ids: List[str]
+    ) -> Optional[List]:
+        source_cluster = self.get_cluster_by_id(source_cluster_id)
+        target_cluster = self.get_cluster_by_id(target_cluster_id)
 
-            # Find members to move
-            members_to_move = []
-            remaining_members = []
+        if not source_cluster or not target_cluster:
+            return None
 
-            for member in source_cluster["members"]:
-                if str(member["id"]) in member_ids:
-                    members_to_move.append(member)
-                else:
-                    remaining_members.append(member)
+        # Only members the source cluster actually holds can move
+        source_id = str(source_cluster["id"])
+        target_id = str(target_cluster["id"])
+        member_ids = {
+            member_id
+            for member_id in map(str, member_ids)
+            if self.get_member_owner(member_id) == source_id
+        }
+        if not member_ids:
+            return None
 
-            if not members_to_move:
-                return False
+        # Find members to move
+        members_to_move = []
+        remaining_members = []
 
-            # Update clusters
-            source_cluster["members"] = remaining_members
-            target_cluster["members"].extend(members_to_move)
+        for member in source_cluster["members"]:
+            if str(member["id"]) in member_ids:
+                members_to_move.append(member)
+            else:
+                remaining_members.append(member)
 
+        return [
+            ("set", source_id, "members", source_cluster["members"], remaining_members),
+            ("extend", target_id, "members", members_to_move),
+        ]
+
+    def reassign_members(self, assignments: Dict[str, str]) -> bool:
+        """Move members to new clusters, wherever they currently are.
+
+        assignments maps member ids to target cluster ids. Every member and
+        target must exist; members already in their target are left alone.
+        Each affected cluster is walked once, so the cost is linear in the
+        size of the clusters involved, and members keep their relative
+        order in both their old and their new cluster.
+        """
+        try:
+            changes = self._reassign_changes(assignments)
+            if changes is None:
+                return False
+            self._commit("reassign", changes)
             return True
         except Exception:
             return False
 
+    def _reassign_changes(self, assignments: Dict[str, str]) -> Optional[List]:
+        # source cluster id -> {member id -> target cluster id}
+        moving: Dict[str, Dict[str, str]] = {}
+        for member_id, target_id in assignments.items():
+            target = self.get_cluster_by_id(target_id)
+            owner = self.get_member_owner(member_id)
+            if target is None or owner is None:
+                return None
+            target_id = str(target["id"])
+            if owner != target_id:
+                moving.setdefault(owner, {})[str(member_id)] = target_id
+        if not moving:
+            return None
+
+        changes = []
+        # target cluster id -> members it gains, in workbench order
+        gained: Dict[str, List] = {}
+        positions = self._cluster_positions()
+        for source_id in sorted(moving, key=positions.__getitem__):
+            destinations = moving[source_id]
+            source_cluster = self._cluster_index[source_id]
+            remaining_members = []
+            for member in source_cluster["members"]:
+                target_id = destinations.get(str(member["id"]))
+                if target_id is None:
+                    remaining_members.append(member)
+                else:
+                    gained.setdefault(target_id, []).append(member)
+            changes.append(
+                (
+                    "set",
+                    source_id,
+                    "members",
+                    source_cluster["members"],
+                    remaining_members,
+                )
+            )
+        changes.extend(
+            ("extend", target_id, "members", members)
+            for target_id, members in gained.items()
+        )
+        return changes
+
     def split_cluster(
-        self, cluster_id: str, member_ids: List[str], new_cluster_name: str
+        self,
+        cluster_id: str,
+        member_ids: List[str],
+        new_cluster_name: str,
+        new_cluster_id: Optional[str] = None,
     ) -> bool:
-        """Split cluster by moving selected members to a new cluster"""
+        """Split cluster by moving selected members to a new cluster.
+
+        The new cluster gets a random id unless new_cluster_id is given.
+        """
         try:
-            source_cluster = self.get_cluster_by_id(cluster_id)
-            if not source_cluster:
+            changes = self._split_changes(
+                cluster_id, member_ids, new_cluster_name, new_cluster_id
+            )
+            if changes is None:
                 return False
+            self._commit("split", changes)
+            return True
+        except Exception:
+            return False
 
-            self.save_state()
+    def _split_changes(
+        self,
+        cluster_id: str,
+        member_ids: List[str],
+        new_cluster_name: str,
+        new_cluster_id: Optional[str] = None,
+    ) -> Optional[List]:
+        source_cluster = self.get_cluster_by_id(cluster_id)
+        if not source_cluster:
+            return None
 
-            # Create new cluster
+        # Create new cluster
+        if new_cluster_id is None:
             new_cluster_id = str(uuid.uuid4())[:8]
-            members_to_move = []
-            remaining_members = []
-
-            for member in source_cluster["members"]:
-                if str(member["id"]) in member_ids:
-                    members_to_move.append(member)
-                else:
-                    remaining_members.append(member)
+        elif str(new_cluster_id) in self._cluster_index:
+            return None
+        member_ids = set(map(str, member_ids))
+        members_to_move = []
+        remaining_members = []
 
-            if not members_to_move:
-                return False
+        for member in source_cluster["members"]:
+            if str(member["id"]) in member_ids:
+                members_to_move.append(member)
+            else:
+                remaining_members.append(member)
 
-            # Update source cluster
-            source_cluster["members"] = remaining_members
+        if not members_to_move:
+            return None
 
-            # Create new cluster
-            new_cluster = {
+        new_cluster = self._new_cluster(
+            {
                 "id": new_cluster_id,
                 "name": new_cluster_name,
                 "members": members_to_move,
                 "relationships": [],
             }
+        )
 
-            self.data["clusters"].append(new_cluster)
-            return True
-        except Exception:
-            return False
+        source_id = str(source_cluster["id"])
+        return [
+            ("set", source_id, "members", source_cluster["members"], remaining_members),
+            ("insert", len(self.data["clusters"]), new_cluster),
+        ]
 
     def handle_drag_drop(
-        self, source_cluster_id: str, member_id: str, target_cluster_id: str
+        self,
+        source_cluster_id: Optional[str],
+        member_id: str,
+        target_cluster_id: str,
     ) -> bool:
-        """Handle drag and drop operation for moving members"""
+        """Handle drag and drop operation for moving members.
+
+        source_cluster_id may be None, in which case the cluster currently
+        holding the member is used.
+        """
         try:
-            # Get the member from source cluster
-            member = self.get_member_by_id(source_cluster_id, member_id)
-            if not member:
+            # Get the cluster holding the member
+            owner = self.get_member_owner(member_id)
+            if owner is None:
+                return False
+            if source_cluster_id is None:
+                source_cluster_id = owner
+            elif str(source_cluster_id) != owner:
                 return False
 
             # Move the member
@@ -0,0 +1,370 @@
+"""
+Columnar (table) representation of cluster documents.
+
+A workbench is stored as three tables, written with pandas:
+
+- clusters: id, name (one row per cluster, in workbench order)
+- members: cluster_id, id, name and one metadata.<field> column per metadata
+  field, with nested fields flattened to dotted names
+- relationships: cluster_id, related_id
+
+The tables are bundled in a zip archive as Parquet or Feather files (these
+need the optional pyarrow package) or as CSV, together with a schema.json
+that records how each column was encoded. Metadata values that are not
+plain strings, numbers or booleans (lists, objects, mixed types) are stored
+as JSON text. Ids are stored as strings, and members without a metadata
+value in a column are indistinguishable from members whose value is null.
+"""
+
+import importlib.util
+import io
+import json
+import zipfile
+from itertools import chain, repeat
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ("parquet", "feather", "csv")
+SCHEMA_FILE = "schema.json"
+SCHEMA_VERSION = 1
+CSV_CHUNK_ROWS = 100000
+METADATA_PREFIX = "metadata."
+
+_TABLES = ("clusters", "members", "relationships")
+_FIXED_COLUMNS = {
+    "clusters": ("id", "name"),
+    "members": ("cluster_id", "id", "name"),
+    "relationships": ("cluster_id", "related_id"),
+}
+
+
+class ColumnarFormatError(ValueError):
+    """Raised when an archive does not hold valid cluster tables.
+
+    code is one of the ERROR_MESSAGES keys in messages.py and params holds the
+    values its message is formatted with.
+    """
+
+    def __init__(self, code: str, params: Optional[Dict[str, Any]] = None):
+        super().__init__(code)
+        self.code = code
+        self.params = params or {}
+
+
+def available_formats() -> List[str]:
+    """Formats that can be written here; Parquet and Feather need pyarrow"""
+    if importlib.util.find_spec("pyarrow") is None:
+        return ["csv"]
+    return list(FORMATS)
+
+
+# -- encoding ----------------------------------------------------------------
+
+
+def _encode_column(values: List, native_lists: bool = False) -> Tuple[str, Any]:
+    """Pick a storage kind for a column of Python values and convert it.
+
+    With native_lists, lists whose items all have the same scalar type are
+    kept as lists (Parquet and Feather store them as list columns).
+    """
+    kinds = set(map(type, values))
+    kinds.discard(type(None))
+    if kinds == {list} and native_lists:
+        items = set(map(type, chain.from_iterable(v for v in values if v)))
+        if len(items) <= 1 and items <= {str, int, float, bool}:
+            return "list", np.array(values + [None], dtype=object)[:-1]
+    if kinds <= {str}:
+        return "string", np.array(values, dtype=object)
+    if kinds == {bool}:
+        return "bool", pd.array(values, dtype="boolean")
+    if kinds == {int}:
+        try:
+            return "int", pd.array(values, dtype="Int64")
+        except (OverflowError, TypeError, ValueError):
+            pass
+    elif kinds <= {int, float}:
+        return "float", np.array(
+            [np.nan if v is None else v for v in values], dtype=float
+        )
+    encode = json.JSONEncoder().encode
+    return "json", np.array(
+        [None if v is None else encode(v) for v in values], dtype=object
+    )
+
+
+def _flatten_records(
+    records: List[Any],
+    prefix: str,
+    columns: Dict[str, Any],
+    kinds: Dict[str, str],
+    native_lists: bool = False,
+):
+    """Add one column per (nested) key of a list of dicts to columns"""
+    empty: Dict = {}
+    records = [r if type(r) is dict else empty for r in records]
+    for key in dict.fromkeys(chain.from_iterable(records)):
+        values = list(map(dict.get, records, repeat(key)))
+        name = f"{prefix}{key}"
+        value_kinds = set(map(type, values))
+        value_kinds.discard(type(None))
+        if value_kinds == {dict}:
+            _flatten_records(values, f"{name}.", columns, kinds, native_lists)
+        else:
+            kinds[name], columns[name] = _encode_column(values, native_lists)
+
+
+def to_frames(
+    clusters: List[Dict], native_lists: bool = False
+) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Dict[str, str]]]:
+    """Split clusters into the three tables and the schema of their columns"""
+    cluster_ids = np.array([str(c["id"]) for c in clusters], dtype=object)
+    sizes = np.fromiter(
+        (len(c["members"]) for c in clusters), dtype=np.int64, count=len(clusters)
+    )
+    related = np.fromiter(
+        (len(c.get("relationships", ())) for c in clusters),
+        dtype=np.int64,
+        count=len(clusters),
+    )
+    members = [m for c in clusters for m in c["members"]]
+
+    member_columns: Dict[str, Any] = {
+        "cluster_id": np.repeat(cluster_ids, sizes),
+        "id": np.array([str(m["id"]) for m in members], dtype=object),
+        "name": np.array([m["name"] for m in members], dtype=object),
+    }
+    member_kinds = dict.fromkeys(member_columns, "string")
+    _flatten_records(
+        [m.get("metadata") for m in members],
+        METADATA_PREFIX,
+        member_columns,
+        member_kinds,
+        native_lists,
+    )
+
+    frames = {
+        "clusters": pd.DataFrame(
+            {
+                "id": cluster_ids,
+                "name": np.array([c["name"] for c in clusters], dtype=object),
+            }
+        ),
+        "members": pd.DataFrame(member_columns),
+        "relationships": pd.DataFrame(
+            {
+                "cluster_id": np.repeat(cluster_ids, related),
+                "related_id": np.array(
+                    [str(r) for c in clusters for r in c.get("relationships", ())],
+                    dtype=object,
+                ),
+            }
+        ),
+    }
+    schema = {
+        "clusters": {"id": "string", "name": "string"},
+        "members": member_kinds,
+        "relationships": {"cluster_id": "string", "related_id": "string"},
+    }
+    return frames, schema
+
+
+def member_frame(cluster: Dict) -> pd.DataFrame:
+    """Members of one cluster as a frame for display: id, name and a column
+    per metadata field (prefixed with "metadata." only where a field is
+    itself called id or name)
+    """
+    members = cluster["members"]
+    columns: Dict[str, Any] = {
+        "id": np.array([str(m["id"]) for m in members], dtype=object),
+        "name": np.array([m["name"] for m in members], dtype=object),
+    }
+    metadata: Dict[str, Any] = {}
+    _flatten_records([m.get("metadata") for m in members], "", metadata, {})
+    for field, values in metadata.items():
+        columns[METADATA_PREFIX + field if field in columns else field] = values
+    return pd.DataFrame(columns)
+
+
+def write_archive(clusters: List[Dict], stream: BinaryIO, fmt: str = "parquet"):
+    """Write clusters as a zip archive of tables in the given format"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown columnar format: {fmt}")
+    frames, schema = to_frames(clusters, native_lists=fmt != "csv")
+    # Parquet and Feather files are compressed already
+    compression = zipfile.ZIP_DEFLATED if fmt == "csv" else zipfile.ZIP_STORED
+    with zipfile.ZipFile(stream, "w", compression) as archive:
+        archive.writestr(
+            SCHEMA_FILE,
+            json.dumps(
+                {"version": SCHEMA_VERSION, "format": fmt, "columns": schema}, indent=2
+            ),
+        )
+        for table in _TABLES:
+            frame = frames[table]
+            with archive.open(f"{table}.{fmt}", "w") as entry:
+                if fmt == "parquet":
+                    frame.to_parquet(entry, index=False, compression="zstd")
+                elif fmt == "feather":
+                    # Feather needs a seekable target
+                    buffer = io.BytesIO()
+                    frame.to_feather(buffer, compression="zstd")
+                    entry.write(buffer.getbuffer())
+                else:
+                    with io.TextIOWrapper(entry, encoding="utf-8", newline="") as text:
+                        frame.to_csv(text, index=False, chunksize=CSV_CHUNK_ROWS)
+
+
+def export_archive(clusters: List[Dict], fmt: str = "parquet") -> bytes:
+    """Return clusters as zip archive bytes"""
+    buffer = io.BytesIO()
+    write_archive(clusters, buffer, fmt)
+    return buffer.getvalue()
+
+
+# -- decoding ----------------------------------------------------------------
+
+
+def _decode_column(column: pd.Series, kind: str) -> List:
+    """Turn a stored column back into a list of Python values (None if null)"""
+    values = column.astype(object).where(column.notna(), None).tolist()
+    if kind == "json":
+        # Parse the whole column as one JSON array instead of value by value
+        return json.loads(
+            "[" + ",".join("null" if v is None else v for v in values) + "]"
+        )
+    if kind == "list":
+        return [
+            v.tolist() if isinstance(v, np.ndarray) else v if v is None else list(v)
+            for v in values
+        ]
+    if kind == "int":
+        return [None if v is None else int(v) for v in values]
+    if kind == "float":
+        return [None if v is None else float(v) for v in values]
+    if kind == "bool":
+        return [None if v is None else bool(v) for v in values]
+    return values
+
+
+_CSV_DTYPES = {
+    "string": "string",
+    "json": "string",
+    "int": "Int64",
+    "float": "float64",
+    "bool": "boolean",
+}
+
+
+def _read_table(archive: zipfile.ZipFile, table: str, fmt: str, kinds: Dict) -> Any:
+    with archive.open(f"{table}.{fmt}") as entry:
+        if fmt == "parquet":
+            return pd.read_parquet(io.BytesIO(entry.read()))
+        if fmt == "feather":
+            return pd.read_feather(io.BytesIO(entry.read()))
+        dtypes = {name: _CSV_DTYPES[kind] for name, kind in kinds.items()}
+        return pd.read_csv(entry, dtype=dtypes, keep_default_na=False, na_values=[""])
+
+
+def read_archive(stream: BinaryIO) -> Dict:
+    """Read a zip archive written by write_archive into a cluster document"""
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        raise ColumnarFormatError("invalid_archive")
+    with archive:
+        try:
+            schema = json.loads(archive.read(SCHEMA_FILE))
+        except (KeyError, ValueError):
+            raise ColumnarFormatError("missing_archive_table", {"table": SCHEMA_FILE})
+        fmt = schema.get("format")
+        if fmt not in FORMATS:
+            raise ColumnarFormatError("invalid_archive")
+        frames = {}
+        for table in _TABLES:
+            kinds = schema["columns"].get(table, {})
+            try:
+                frames[table] = _read_table(archive, table, fmt, kinds)
+            except KeyError:
+                raise ColumnarFormatError(
+                    "missing_archive_table", {"table": f"{table}.{fmt}"}
+                )
+            missing = [c for c in _FIXED_COLUMNS[table] if c not in frames[table]]
+            if missing:
+                raise ColumnarFormatError(
+                    "missing_archive_columns",
+                    {"table": table, "missing_keys": missing},
+                )
+    return from_frames(frames, schema["columns"])
+
+
+def _metadata_records(frame: pd.DataFrame, kinds: Dict[str, str]) -> List[Dict]:
+    """Rebuild the metadata dict of every member from the metadata columns"""
+    names = [name for name in frame.columns if name.startswith(METADATA_PREFIX)]
+    if not names:
+        return [{} for _ in range(len(frame))]
+    paths = [name[len(METADATA_PREFIX) :].split(".") for name in names]
+    columns = [_decode_column(frame[name], kinds.get(name, "string")) for name in names]
+    if all(len(path) == 1 for path in paths):
+        keys = [path[0] for path in paths]
+        return [
+            (
+                dict(zip(keys, row))
+                if None not in row
+                else {key: value for key, value in zip(keys, row) if value is not None}
+            )
+            for row in zip(*columns)
+        ]
+    records = []
+    for row in zip(*columns):
+        record: Dict[str, Any] = {}
+        for path, value in zip(paths, row):
+            if value is None:
+                continue
+            target = record
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+        records.append(record)
+    return records
+
+
+def from_frames(
+    frames: Dict[str, pd.DataFrame], schema: Optional[Dict[str, Dict]] = None
+) -> Dict:
+    """Assemble a cluster document from the three tables"""
+    schema = schema or {}
+    cluster_frame = frames["clusters"]
+    clusters = [
+        {"id": cluster_id, "name": name, "members": [], "relationships": []}
+        for cluster_id, name in zip(
+            _decode_column(cluster_frame["id"], "string"),
+            _decode_column(cluster_frame["name"], "string"),
+        )
+    ]
+    by_id = {cluster["id"]: cluster for cluster in clusters}
+
+    member_frame = frames["members"]
+    metadata = _metadata_records(member_frame, schema.get("members", {}))
+    for cluster_id, member_id, name, record in zip(
+        _decode_column(member_frame["cluster_id"], "string"),
+        _decode_column(member_frame["id"], "string"),
+        _decode_column(member_frame["name"], "string"),
+        metadata,
+    ):
+        cluster = by_id.get(cluster_id)
+        if cluster is None:
+            raise ColumnarFormatError("unknown_archive_cluster", {"id": cluster_id})
+        cluster["members"].append({"id": member_id, "name": name, "metadata": record})
+
+    relationship_frame = frames["relationships"]
+    for cluster_id, related_id in zip(
+        _decode_column(relationship_frame["cluster_id"], "string"),
+        _decode_column(relationship_frame["related_id"], "string"),
+    ):
+        cluster = by_id.get(cluster_id)
+        if cluster is None:
+            raise ColumnarFormatError("unknown_archive_cluster", {"id": cluster_id})
+        cluster["relationships"].append(related_id)
+    return {"clusters": clusters}
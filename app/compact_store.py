@@ -0,0 +1,521 @@
+"""
+Compact in-memory storage of cluster data.
+
+Members are not kept as dicts. Their ids and names live in string tables
+(UTF-8 text back to back in one buffer, addressed by member number), their
+metadata as a tuple of values sharing one tuple of keys with every member of
+the same shape, and cluster membership is integer coded: each cluster holds
+the numbers of its members in an array, and the store keeps a member number
+-> cluster code array, so that finding or changing the owner of a member is
+an array read or write. Member ids are found through a sorted array of their
+hashes instead of a dict.
+
+Clusters and members are handed out as views that behave like the dicts they
+replace (cluster["members"], member.get("metadata"), dict(cluster), ==
+against dicts), so code written for the JSON document works unchanged.
+Member views are read-only and built on access, so the same member is not
+always the same object, and its metadata dict is a fresh copy each time.
+
+CompactFieldIndex indexes member metadata by member number in the same way,
+reading which cluster holds a member from the store.
+"""
+
+import bisect
+from array import array
+from collections.abc import Mapping, MutableMapping, MutableSequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+try:
+    from .search_index import FieldIndex
+except ImportError:  # loaded as a top-level module by `streamlit run app/main.py`
+    from search_index import FieldIndex
+
+# Marks a field the document did not have
+_ABSENT = object()
+_MEMBER_FIELDS = ("id", "name", "metadata")
+_MEMBER_FIELD_SET = frozenset(_MEMBER_FIELDS)
+
+
+class StringTable:
+    """Strings stored back to back as UTF-8 in one buffer, by number"""
+
+    def __init__(self, strings: Iterable[str] = ()):
+        encoded = [s.encode("utf-8", "surrogatepass") for s in strings]
+        self._offsets = array("q", [0])
+        self._offsets.extend(np.cumsum([len(e) for e in encoded], dtype=np.int64))
+        self._buffer = bytearray(b"".join(encoded))
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, number: int) -> str:
+        start, end = self._offsets[number], self._offsets[number + 1]
+        return self._buffer[start:end].decode("utf-8", "surrogatepass")
+
+    def append(self, s: str) -> int:
+        self._buffer += s.encode("utf-8", "surrogatepass")
+        self._offsets.append(len(self._buffer))
+        return len(self) - 1
+
+    def __sizeof__(self) -> int:
+        return (
+            object.__sizeof__(self)
+            + self._offsets.__sizeof__()
+            + self._buffer.__sizeof__()
+        )
+
+
+class MemberView(Mapping):
+    """Read-only dict view of a member of a CompactStore"""
+
+    __slots__ = ("_store", "number")
+
+    def __init__(self, store: "CompactStore", number: int):
+        self._store = store
+        self.number = number
+
+    def __getitem__(self, key):
+        return self._store.member_value(self.number, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return self._store.member_keys(self.number)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def __reduce__(self):
+        # Copies and pickles are plain dicts, detached from the store
+        return dict, (dict(self),)
+
+
+class MemberList(MutableSequence):
+    """A cluster's members, stored as an array of member numbers"""
+
+    __slots__ = ("_store", "numbers")
+
+    def __init__(self, store: "CompactStore", members: Iterable = ()):
+        self._store = store
+        self.numbers = array("i", map(store.number_of, members))
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [MemberView(self._store, n) for n in self.numbers[index]]
+        return MemberView(self._store, self.numbers[index])
+
+    def __iter__(self) -> Iterator[MemberView]:
+        store = self._store
+        return (MemberView(store, number) for number in self.numbers)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.numbers[index] = array("i", map(self._store.number_of, value))
+        else:
+            self.numbers[index] = self._store.number_of(value)
+
+    def __delitem__(self, index):
+        del self.numbers[index]
+
+    def insert(self, index: int, value):
+        self.numbers.insert(index, self._store.number_of(value))
+
+    def extend(self, values: Iterable):
+        self.numbers.extend(map(self._store.number_of, values))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, MemberList) and other._store is self._store:
+            return self.numbers == other.numbers
+        if isinstance(other, (list, tuple, MemberList)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + self.numbers.__sizeof__()
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+class CompactCluster(MutableMapping):
+    """A cluster: id, name, members (a MemberList), relationships and any
+    other keys the document had"""
+
+    __slots__ = ("id", "name", "members", "relationships", "extra", "code", "_store")
+    _FIELDS = ("id", "name", "members", "relationships")
+
+    def __init__(self, store: "CompactStore", cluster: Mapping, code: int):
+        self._store = store
+        self.code = code
+        self.extra: Optional[Dict] = None
+        for field in self._FIELDS:
+            setattr(self, field, _ABSENT)
+        for key, value in cluster.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key in self._FIELDS:
+            value = getattr(self, key)
+            if value is not _ABSENT:
+                return value
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == "members" and not (
+            isinstance(value, MemberList) and value._store is self._store
+        ):
+            value = MemberList(self._store, value)
+        if key in self._FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._FIELDS and getattr(self, key) is not _ABSENT:
+            setattr(self, key, _ABSENT)
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for field in self._FIELDS:
+            if getattr(self, field) is not _ABSENT:
+                yield field
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class CompactStore:
+    """Members, their owners and the clusters of a compact workbench"""
+
+    def __init__(self):
+        self._ids = StringTable()
+        self._names = StringTable()
+        # member number -> (keys, *values), _ABSENT, or metadata that is not
+        # an object as loaded
+        self._metadata: List[Any] = []
+        # member number -> keys other than id, name and metadata, and the
+        # id or name if it is not a string
+        self._extra: Dict[int, Dict] = {}
+        # Sorted hashes of the ids of loaded members and the member number of
+        # each, plus a dict for members added later
+        self._hashes = array("q")
+        self._hash_numbers = array("i")
+        self._added: Dict[str, int] = {}
+        # member number -> code of the cluster holding it, -1 if none
+        self._owners = np.empty(0, dtype=np.intc)
+        # cluster code -> cluster id
+        self._cluster_ids: List[str] = []
+        self._shapes: Dict[tuple, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self._metadata)
+
+    # -- loading -----------------------------------------------------------
+
+    def load(self, clusters: List[Mapping]) -> List[CompactCluster]:
+        """Convert validated clusters to the compact form.
+
+        Equal strings in metadata values and relationships are stored once.
+        """
+        strings: Dict[str, str] = {}
+        members = [member for cluster in clusters for member in cluster["members"]]
+        ids = [member["id"] for member in members]
+        names = [member["name"] for member in members]
+        self._ids = StringTable(map(str, ids))
+        self._names = StringTable(map(str, names))
+        self._metadata = [
+            self._pack_metadata(member.get("metadata", _ABSENT), strings)
+            for member in members
+        ]
+        self._extra = {}
+        for number, member in enumerate(members):
+            self._set_extra(number, member)
+
+        hashes = np.fromiter(
+            (hash(str(member_id)) for member_id in ids), dtype=np.int64, count=len(ids)
+        )
+        order = np.argsort(hashes, kind="stable")
+        self._hashes = array("q", hashes[order].tobytes())
+        self._hash_numbers = array("i", order.astype(np.intc).tobytes())
+        self._added = {}
+        self._owners = np.full(len(members), -1, dtype=np.intc)
+
+        compact = []
+        start = 0
+        for cluster in clusters:
+            count = len(cluster["members"])
+            cluster = {**cluster, "members": MemberList(self)}
+            if isinstance(cluster.get("relationships"), list):
+                cluster["relationships"] = [
+                    strings.setdefault(r, r) if type(r) is str else r
+                    for r in cluster["relationships"]
+                ]
+            compact_cluster = self.add_cluster(cluster)
+            compact_cluster["members"].numbers = array("i", range(start, start + count))
+            start += count
+            compact.append(compact_cluster)
+        return compact
+
+    def _pack_metadata(self, metadata: Any, strings: Dict[str, str]) -> Any:
+        if type(metadata) is not dict:
+            return metadata
+        keys = tuple(metadata)
+        values = [
+            strings.setdefault(value, value) if type(value) is str else value
+            for value in metadata.values()
+        ]
+        return (self._shapes.setdefault(keys, keys), *values)
+
+    def _set_extra(self, number: int, member: Mapping):
+        if (
+            member.keys() <= _MEMBER_FIELD_SET
+            and type(member["id"]) is str
+            and type(member["name"]) is str
+        ):
+            return
+        extra = {
+            key: value for key, value in member.items() if key not in _MEMBER_FIELDS
+        }
+        for key in ("id", "name"):
+            if type(member[key]) is not str:
+                extra[key] = member[key]
+        if extra:
+            self._extra[number] = extra
+
+    def add_cluster(self, cluster: Mapping) -> CompactCluster:
+        """Return a compact copy of a cluster, members included"""
+        if isinstance(cluster, CompactCluster) and cluster._store is self:
+            return cluster
+        compact = CompactCluster(self, cluster, len(self._cluster_ids))
+        self._cluster_ids.append(str(compact["id"]))
+        return compact
+
+    def number_of(self, member: Mapping) -> int:
+        """Return the number of a member, adding new members to the store"""
+        if isinstance(member, MemberView) and member._store is self:
+            return member.number
+        number = len(self._metadata)
+        self._ids.append(str(member["id"]))
+        self._names.append(str(member["name"]))
+        self._metadata.append(self._pack_metadata(member.get("metadata", _ABSENT), {}))
+        self._set_extra(number, member)
+        self._added[str(member["id"])] = number
+        return number
+
+    # -- member access -----------------------------------------------------
+
+    def member_value(self, number: int, key: str) -> Any:
+        """Return the value of key for a member, as the document had it"""
+        extra = self._extra.get(number)
+        if extra is not None and key in extra:
+            return extra[key]
+        if key == "id":
+            return self._ids[number]
+        if key == "name":
+            return self._names[number]
+        if key == "metadata":
+            metadata = self._metadata[number]
+            if type(metadata) is tuple:
+                return dict(zip(metadata[0], metadata[1:]))
+            if metadata is not _ABSENT:
+                return metadata
+        raise KeyError(key)
+
+    def member_keys(self, number: int) -> Iterator[str]:
+        yield "id"
+        yield "name"
+        if self._metadata[number] is not _ABSENT:
+            yield "metadata"
+        for key in self._extra.get(number, ()):
+            if key not in _MEMBER_FIELDS:
+                yield key
+
+    def find(self, member_id: str) -> Optional[int]:
+        """Return the number of the member with an id, if there is one"""
+        member_id = str(member_id)
+        number = self._added.get(member_id)
+        if number is not None:
+            return number
+        h = hash(member_id)
+        i = bisect.bisect_left(self._hashes, h)
+        while i < len(self._hashes) and self._hashes[i] == h:
+            number = self._hash_numbers[i]
+            if self._ids[number] == member_id:
+                return number
+            i += 1
+        return None
+
+    # -- ownership ---------------------------------------------------------
+
+    def _grow_owners(self):
+        if len(self._owners) < len(self):
+            grown = np.full(max(len(self), 2 * len(self._owners)), -1, np.intc)
+            grown[: len(self._owners)] = self._owners
+            self._owners = grown
+
+    @staticmethod
+    def _numbers_of(cluster: CompactCluster) -> np.ndarray:
+        return np.frombuffer(cluster["members"].numbers, dtype=np.intc)
+
+    def claim(self, cluster: CompactCluster):
+        """Record cluster as the owner of all of its members"""
+        self._grow_owners()
+        self._owners[self._numbers_of(cluster)] = cluster.code
+
+    def release(self, cluster: CompactCluster):
+        """Forget the owner of the members still recorded as held by cluster"""
+        numbers = self._numbers_of(cluster)
+        held = numbers[self._owners[numbers] == cluster.code]
+        self._owners[held] = -1
+
+    def release_all(self):
+        self._owners[:] = -1
+
+    def owner_of(self, member_id: str) -> Optional[str]:
+        """Return the id of the cluster holding a member"""
+        number = self.find(member_id)
+        if number is None or number >= len(self._owners):
+            return None
+        code = self._owners[number]
+        return None if code < 0 else self._cluster_ids[code]
+
+    def held(self, numbers: array) -> np.ndarray:
+        """Return which of an array of member numbers a cluster holds, as an
+        array of booleans"""
+        self._grow_owners()
+        return self._owners[np.array(numbers, dtype=np.intc)] >= 0
+
+    def key_of(self, number: int) -> Tuple[str, str]:
+        """Return (cluster id, member id) of a member a cluster holds"""
+        return self._cluster_ids[self._owners[number]], self._ids[number]
+
+    def member(self, cluster: CompactCluster, member_id: str) -> Optional[MemberView]:
+        """Return a member if cluster holds it"""
+        number = self.find(member_id)
+        if (
+            number is None
+            or number >= len(self._owners)
+            or self._owners[number] != cluster.code
+        ):
+            return None
+        return MemberView(self, number)
+
+
+class CompactFieldIndex(FieldIndex):
+    """A FieldIndex over the members of a CompactStore.
+
+    Postings are arrays of member numbers instead of sets of (cluster_id,
+    member_id) pairs. The metadata of a member never changes and the store
+    knows which cluster holds it, so members are indexed once, when a
+    cluster holding them is first added, and removing a cluster leaves them
+    in place: matches and counts only take the members that a cluster holds.
+    Labels are only kept for values that are not already lowercase.
+    """
+
+    def __init__(self, store: CompactStore):
+        super().__init__()
+        self._store = store
+        # field -> lowercased value -> numbers of the members carrying it
+        self._postings: Dict[str, Dict[str, array]] = {}
+        # member number -> whether its metadata is in the postings
+        self._indexed = bytearray()
+
+    def add(self, cluster_id: str, members: MemberList):
+        """Index the metadata of the members of a cluster not indexed yet"""
+        store = self._store
+        indexed = self._indexed
+        if len(indexed) < len(store):
+            indexed.extend(bytes(len(store) - len(indexed)))
+        for number in members.numbers:
+            if indexed[number]:
+                continue
+            indexed[number] = 1
+            metadata = MemberView(store, number).get("metadata")
+            if not isinstance(metadata, dict) or not metadata:
+                continue
+            seen = set()
+            for field, value in self._flatten(metadata):
+                lowered = value.lower()
+                if (field, lowered) in seen:
+                    continue
+                seen.add((field, lowered))
+                values = self._postings.setdefault(field, {})
+                values.setdefault(lowered, array("i")).append(number)
+                if value != lowered:
+                    self._labels.setdefault(field, {}).setdefault(lowered, value)
+
+    def remove(self, cluster_id: str, members: MemberList):
+        """Members stay indexed; the store knows they left the cluster"""
+
+    def clear(self):
+        super().clear()
+        self._indexed = bytearray()
+
+    def _has_field(self, field: str) -> bool:
+        return any(
+            self._store.held(numbers).any()
+            for numbers in self._postings.get(field, {}).values()
+        )
+
+    def match(self, filters: List[Tuple[str, str]]) -> Set[Tuple[str, str]]:
+        postings = [
+            self._postings.get(field, {}).get(value.lower()) for field, value in filters
+        ]
+        if not postings or None in postings:
+            return set()
+        postings.sort(key=len)
+        numbers = np.array(postings[0], dtype=np.intc)
+        for posting in postings[1:]:
+            numbers = np.intersect1d(
+                numbers, np.array(posting, dtype=np.intc), assume_unique=True
+            )
+        held = numbers[self._store.held(numbers)]
+        return {self._store.key_of(number) for number in held.tolist()}
+
+    def facet_counts(
+        self, field: str, limit: Optional[int] = None
+    ) -> List[Tuple[str, int]]:
+        values = self._postings.get(field, {})
+        if not values:
+            return []
+        # All postings of the field back to back, counted in one pass
+        numbers = array("i")
+        starts = []
+        for posting in values.values():
+            starts.append(len(numbers))
+            numbers.extend(posting)
+        counts = np.add.reduceat(self._store.held(numbers), starts)
+        labels = self._labels.get(field, {})
+        counts = sorted(
+            (
+                (labels.get(value, value), int(count))
+                for value, count in zip(values, counts.tolist())
+                if count
+            ),
+            key=lambda item: (-item[1], item[0]),
+        )
+        return counts[:limit] if limit is not None else counts
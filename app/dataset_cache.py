@@ -0,0 +1,91 @@
+"""
+Process-wide cache of loaded datasets, shared between Streamlit sessions.
+
+Uploads are keyed by a hash of their content, so every session opening the
+same file gets the same entry however the file reached it. An entry holds a
+ClusterManager that loaded the file and is never changed afterwards; the
+sessions build on it with ClusterManager.load_shared, which shares its
+clusters and indexes until a session makes its first change.
+
+Entries are evicted least recently used first once the total size of the
+files they were loaded from exceeds max_bytes. An evicted dataset stays in
+memory for as long as sessions still use it.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Hashable, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(stream: BinaryIO) -> Tuple[str, int]:
+    """Return the SHA-256 hex digest and size of what is left in stream,
+    leaving the stream where it was"""
+    start = stream.tell()
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(start)
+    return digest.hexdigest(), size
+
+
+class DatasetCache:
+    """Thread-safe LRU cache of loaded datasets, bounded by source file size"""
+
+    def __init__(self, max_bytes: int = 2 * 1024**3):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        # key -> (value, size of the file it was loaded from)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the dataset stored under key, if any"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int):
+        """Store a dataset loaded from a file of size bytes, evicting the
+        least recently used ones beyond max_bytes (never the new one)"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        """Drop every dataset and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Number of datasets, their total source size and hit counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,114 @@
+"""
+Streaming JSON export of workbench data.
+
+The document is produced by JSONEncoder.iterencode and written out in chunks,
+optionally through gzip, so an export never exists as one large str next to
+its encoded bytes.
+"""
+
+import gzip
+import io
+import json
+from collections.abc import Mapping, Sequence
+from typing import Any, BinaryIO, Iterator
+
+CHUNK_SIZE = 256 * 1024
+
+
+def _to_builtin(value: Any) -> Any:
+    """Encode other mappings and sequences (such as compact store records) as
+    JSON objects and arrays"""
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_COMPACT_ENCODER = json.JSONEncoder(separators=(",", ":"), default=_to_builtin)
+
+
+def to_json(value: Any) -> str:
+    """Encode one value as compact JSON, as the compact export would"""
+    return _COMPACT_ENCODER.encode(value)
+
+
+def _iter_document(data: Any, encoder: json.JSONEncoder) -> Iterator[str]:
+    """Encode data piece by piece, one cluster at a time where possible.
+
+    A cluster document is written by hand around clusters encoded with the C
+    encoder, which is much faster than letting iterencode yield every token.
+    Anything else falls back to iterencode.
+    """
+    if not (
+        isinstance(data, dict)
+        and isinstance(data.get("clusters"), list)
+        and all(isinstance(key, str) for key in data)
+    ):
+        yield from encoder.iterencode(data)
+        return
+
+    indent = encoder.indent
+    # Line breaks before nested values at depth 1 and 2, or nothing if compact
+    outer = "\n" + " " * indent if indent else ""
+    inner = outer + " " * indent if indent else ""
+    for i, (key, value) in enumerate(data.items()):
+        yield ("{" if i == 0 else ",") + outer + json.dumps(key) + encoder.key_separator
+        if key != "clusters" or not value:
+            encoded = encoder.encode(value)
+            yield encoded.replace("\n", outer) if indent else encoded
+            continue
+        yield "["
+        for j, cluster in enumerate(value):
+            encoded = encoder.encode(cluster)
+            if indent:
+                encoded = encoded.replace("\n", inner)
+            yield ("" if j == 0 else ",") + inner + encoded
+        yield outer + "]"
+    yield ("\n" if indent else "") + "}"
+
+
+def iter_json(
+    data: Any, compact: bool = False, chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Yield data encoded as UTF-8 JSON in chunks of about chunk_size bytes.
+
+    The indented form matches json.dumps(data, indent=2); compact drops all
+    optional whitespace.
+    """
+    if compact:
+        encoder = _COMPACT_ENCODER
+    else:
+        encoder = json.JSONEncoder(indent=2, default=_to_builtin)
+    pieces = []
+    size = 0
+    for piece in _iter_document(data, encoder):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(pieces).encode("utf-8")
+            pieces = []
+            size = 0
+    if pieces:
+        yield "".join(pieces).encode("utf-8")
+
+
+def write_json(
+    data: Any, stream: BinaryIO, compact: bool = False, compress: bool = False
+):
+    """Write data as JSON to a binary stream, gzip-compressed if asked"""
+    if compress:
+        # mtime=0 keeps the output identical for identical data
+        with gzip.GzipFile(fileobj=stream, mode="wb", mtime=0) as gz:
+            for chunk in iter_json(data, compact):
+                gz.write(chunk)
+    else:
+        for chunk in iter_json(data, compact):
+            stream.write(chunk)
+
+
+def export_json(data: Any, compact: bool = False, compress: bool = False) -> bytes:
+    """Return data as JSON bytes, gzip-compressed if asked"""
+    buffer = io.BytesIO()
+    write_json(data, buffer, compact, compress)
+    return buffer.getvalue()
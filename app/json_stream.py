@@ -0,0 +1,176 @@
+"""
+Incremental reader for cluster JSON documents.
+
+The top-level object is parsed from a binary stream a chunk at a time and the
+elements of its "clusters" array are yielded one by one, so a document never
+has to be held in memory as bytes, text and Python objects at the same time.
+"""
+
+import codecs
+import json
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+# Decode errors this close to the end of the buffer may only mean that the
+# value continues in the next chunk (the longest escape sequence is "\uXXXX")
+_TRUNCATION_MARGIN = 6
+
+
+class StreamFormatError(ValueError):
+    """Raised when a cluster document is malformed.
+
+    code is one of the ERROR_MESSAGES keys in messages.py and params holds the
+    values its message is formatted with.
+    """
+
+    def __init__(self, code: str, params: Optional[Dict[str, Any]] = None):
+        super().__init__(code)
+        self.code = code
+        self.params = params or {}
+
+
+class ClusterStream:
+    """Iterate over (offset, cluster) pairs of a JSON document read from stream.
+
+    offset is the character position of the cluster in the document. Keys of
+    the top-level object other than "clusters" are collected into extra, in
+    document order, with a None placeholder where "clusters" appeared.
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = 1024 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.extra: Dict[str, Any] = {}
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._text = ""
+        self._pos = 0
+        self._consumed = 0  # characters dropped from the front of _text
+        self._eof = False
+
+    # -- buffer handling -------------------------------------------------
+
+    def _fill(self, min_chars: int = 0) -> bool:
+        """Append at least one chunk (or min_chars) of text; False at EOF"""
+        if self._eof:
+            return False
+        if self._pos > len(self._text) // 2:
+            self._consumed += self._pos
+            self._text = self._text[self._pos :]
+            self._pos = 0
+        chunk = self.stream.read(max(self.chunk_size, min_chars))
+        if not chunk:
+            self._eof = True
+            self._text += self._decoder.decode(b"", final=True)
+            return False
+        self._text += self._decoder.decode(chunk)
+        return True
+
+    def _offset(self, pos: Optional[int] = None) -> int:
+        return self._consumed + (self._pos if pos is None else pos)
+
+    def _syntax_error(self, message: str, offset: Optional[int] = None):
+        if offset is None:
+            offset = self._offset()
+        raise StreamFormatError(
+            "invalid_json_file", {"e": f"{message} (char {offset})"}
+        )
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character, or "" at EOF"""
+        while True:
+            text = self._text
+            pos = self._pos
+            while pos < len(text) and text[pos] in " \t\n\r":
+                pos += 1
+            self._pos = pos
+            if pos < len(text):
+                return text[pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            self._syntax_error(f"Expecting '{char}'")
+        self._pos += 1
+
+    def _value(self) -> Any:
+        """Decode the JSON value starting at the current position"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._text, self._pos)
+            except json.JSONDecodeError as e:
+                offset = self._offset(e.pos)
+                truncated = e.msg.startswith("Unterminated string") or e.pos >= (
+                    len(self._text) - _TRUNCATION_MARGIN
+                )
+                if truncated and self._fill(len(self._text) - self._pos):
+                    continue
+                self._syntax_error(e.msg, offset)
+            # A number or literal ending exactly at the buffer edge may go on
+            # in the next chunk
+            if end == len(self._text) and self._fill(len(self._text) - self._pos):
+                continue
+            self._pos = end
+            return value
+
+    # -- document structure ----------------------------------------------
+
+    def __iter__(self) -> Iterator[Tuple[int, Any]]:
+        first = self._peek()
+        if first == "":
+            self._syntax_error("Expecting value")
+        if first != "{":
+            raise StreamFormatError("invalid_json")
+        self._pos += 1
+
+        seen_clusters = False
+        if self._peek() == "}":
+            self._pos += 1
+        else:
+            while True:
+                key_offset = self._offset()
+                key = self._value()
+                if not isinstance(key, str):
+                    self._syntax_error(
+                        "Expecting property name enclosed in double quotes", key_offset
+                    )
+                self._expect(":")
+                if key == "clusters":
+                    if seen_clusters:
+                        self._syntax_error("Duplicate 'clusters' key", key_offset)
+                    seen_clusters = True
+                    self.extra["clusters"] = None
+                    yield from self._array()
+                else:
+                    self.extra[key] = self._value()
+
+                separator = self._peek()
+                self._pos += 1
+                if separator == "}":
+                    break
+                if separator != ",":
+                    self._syntax_error("Expecting ',' delimiter", self._offset() - 1)
+
+        if self._peek() != "":
+            self._syntax_error("Extra data")
+        if not seen_clusters:
+            raise StreamFormatError("missing_clusters")
+
+    def _array(self) -> Iterator[Tuple[int, Any]]:
+        if self._peek() != "[":
+            raise StreamFormatError("clusters_not_array")
+        self._pos += 1
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            self._peek()
+            offset = self._offset()
+            yield offset, self._value()
+            separator = self._peek()
+            self._pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                self._syntax_error("Expecting ',' delimiter", self._offset() - 1)
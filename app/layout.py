@@ -0,0 +1,312 @@
+"""
+Automatic layout of the cluster graph.
+
+Positions are computed from the relationship graph with a force-directed
+algorithm vectorized with NumPy. Repulsion between all pairs of clusters is
+approximated on a grid (the particle-mesh method): cluster counts are binned
+into cells and convolved with the repulsive force kernel using FFTs, so an
+iteration costs O(n + E + G² log G) instead of O(n²). The result is packed
+onto the slot grid used by the flow view so that cluster nodes never overlap.
+"""
+
+import math
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Position = Tuple[float, float]
+Slot = Tuple[int, int]
+
+SLOT_SIZE = (300.0, 200.0)
+ORIGIN = (100.0, 100.0)
+# How far (in slots) a new cluster may land from its ideal position before it
+# is put in the row below the laid out graph instead
+_SEARCH_RADIUS = 8
+
+
+def graph_edges(
+    clusters: Sequence[Dict], index: Dict[str, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Source and target index arrays of the relationships between clusters"""
+    sources = []
+    targets = []
+    for i, cluster in enumerate(clusters):
+        for related_id in cluster.get("relationships", ()):
+            j = index.get(str(related_id))
+            if j is not None and j != i:
+                sources.append(i)
+                targets.append(j)
+    return np.array(sources, dtype=np.intp), np.array(targets, dtype=np.intp)
+
+
+@lru_cache(maxsize=8)
+def _kernel_fft(grid_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """FFTs of the x and y components of delta / |delta|² for unit cells.
+
+    The kernel covers all cell offsets, laid out for a linear (zero padded)
+    convolution of size 2G. With cells of size h it scales by 1 / h.
+    """
+    size = 2 * grid_size
+    offsets = np.fft.fftfreq(size, 1.0 / size)
+    dx, dy = np.meshgrid(offsets, offsets, indexing="ij")
+    dist2 = dx * dx + dy * dy
+    dist2[0, 0] = np.inf
+    return np.fft.rfft2(dx / dist2), np.fft.rfft2(dy / dist2)
+
+
+def _repulsion(pos: np.ndarray, grid_size: int) -> np.ndarray:
+    """Approximate sum over all other nodes of delta / |delta|² per node"""
+    n = len(pos)
+    low = pos.min(axis=0)
+    extent = max(float((pos.max(axis=0) - low).max()), 1e-9)
+    cell = extent / (grid_size - 1)
+    cells = np.rint((pos - low) / cell).astype(np.intp)
+    flat = cells[:, 0] * grid_size + cells[:, 1]
+    density = np.bincount(flat, minlength=grid_size * grid_size).astype(float)
+    density = density.reshape(grid_size, grid_size)
+
+    size = 2 * grid_size
+    density_f = np.fft.rfft2(density, s=(size, size)) / cell
+    force = np.empty((n, 2))
+    for axis, kernel_f in enumerate(_kernel_fft(grid_size)):
+        field = np.fft.irfft2(density_f * kernel_f, s=(size, size))
+        force[:, axis] = field[:grid_size, :grid_size].ravel()[flat]
+    return force
+
+
+def force_layout(
+    n: int,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    initial: Optional[np.ndarray] = None,
+    pinned: Optional[np.ndarray] = None,
+    iterations: int = 60,
+    seed: int = 0,
+) -> np.ndarray:
+    """Return an (n, 2) array of positions for a graph with the given edges.
+
+    This is Fruchterman-Reingold with unit ideal edge length, grid
+    approximated repulsion, a pull towards the centre that keeps the graph
+    compact and disconnected components together, and a linearly cooling
+    step limit.
+    Nodes flagged in pinned keep their initial position.
+    """
+    rng = np.random.default_rng(seed)
+    side = math.sqrt(max(n, 1))
+    if initial is None:
+        pos = rng.uniform(0.0, side, size=(n, 2))
+    else:
+        pos = np.array(initial, dtype=float)
+    if n < 2:
+        return pos
+    movable = None if pinned is None else ~pinned
+    if movable is not None and not movable.any():
+        return pos
+
+    grid_size = int(min(256, max(16, 2 ** math.ceil(math.log2(side)) * 2)))
+    temperature = side / 10
+    for step in range(iterations):
+        disp = _repulsion(pos, grid_size)
+
+        if len(sources):
+            delta = pos[targets] - pos[sources]
+            dist = np.hypot(delta[:, 0], delta[:, 1])[:, None]
+            pull = delta * dist  # d² / k along the edge
+            for axis in range(2):
+                disp[:, axis] += np.bincount(sources, pull[:, axis], minlength=n)
+                disp[:, axis] -= np.bincount(targets, pull[:, axis], minlength=n)
+
+        centre = pos.mean(axis=0)
+        disp -= 3.14 * (pos - centre)
+
+        length = np.hypot(disp[:, 0], disp[:, 1])[:, None]
+        limit = temperature * (1 - step / iterations)
+        step_disp = disp / np.maximum(length, 1e-9) * np.minimum(length, limit)
+        if movable is not None:
+            step_disp[~movable] = 0
+        pos += step_disp
+    return pos
+
+
+def pack_slots(pos: np.ndarray, aspect: float = 1.0) -> np.ndarray:
+    """Assign every node its own (column, row) slot, keeping neighbours close.
+
+    The slot grid is split in two along its longer side, nodes are divided
+    between the halves by position in proportion to their size, and each half
+    is split again until every node has a slot (recursive coordinate
+    bisection). aspect is the width / height ratio of a slot, used to make
+    the grid roughly square on screen.
+    """
+    n = len(pos)
+    slots = np.zeros((n, 2), dtype=np.intp)
+    columns = max(1, math.ceil(math.sqrt(n / aspect)))
+    rows = max(1, math.ceil(n / columns))
+    stack = [(np.arange(n), 0, 0, columns, rows)]
+    while stack:
+        nodes, column, row, width, height = stack.pop()
+        count = len(nodes)
+        if count == 0:
+            continue
+        if count == 1:
+            slots[nodes[0]] = (column + (width - 1) // 2, row + (height - 1) // 2)
+            continue
+        if width == 1 or height == 1:
+            # A single row or column: spread the nodes out along it in order
+            axis = 0 if height == 1 else 1
+            nodes = nodes[np.argsort(pos[nodes, axis], kind="stable")]
+            steps = np.arange(count) * max(width, height) // count
+            slots[nodes, 0] = column + (steps if axis == 0 else 0)
+            slots[nodes, 1] = row + (steps if axis == 1 else 0)
+            continue
+        axis = 0 if width * aspect >= height and width > 1 else 1
+        size, other = (width, height) if axis == 0 else (height, width)
+        half = size // 2
+        # Nodes sent to the first half, within what both halves can hold
+        k = min(
+            max(round(count * half / size), count - (size - half) * other), half * other
+        )
+        if 0 < k < count:
+            nodes = nodes[np.argpartition(pos[nodes, axis], k - 1)]
+        first, second = nodes[:k], nodes[k:]
+        if axis == 0:
+            stack.append((first, column, row, half, height))
+            stack.append((second, column + half, row, width - half, height))
+        else:
+            stack.append((first, column, row, width, half))
+            stack.append((second, column, row + half, width, height - half))
+    return slots
+
+
+class GraphLayout:
+    """Cluster positions computed from relationships and kept across reruns.
+
+    Clusters that were already laid out keep their slot. New clusters are
+    placed by a force-directed pass in which the known clusters are pinned,
+    unless they make up most of the graph, in which case the whole graph is
+    laid out again.
+    """
+
+    def __init__(self, iterations: int = 60, seed: int = 0):
+        self.iterations = iterations
+        self.seed = seed
+        self._slots: Dict[str, Slot] = {}
+        self._positions: Dict[str, Position] = {}
+
+    def clear(self):
+        self._slots.clear()
+        self._positions.clear()
+
+    def positions(self, clusters: Sequence[Dict]) -> Dict[str, Position]:
+        """Map the id of every cluster to the position of its node"""
+        ids = [str(cluster["id"]) for cluster in clusters]
+        new = [i for i, cluster_id in enumerate(ids) if cluster_id not in self._slots]
+        if not new:
+            if len(self._slots) != len(ids):
+                self._slots = {
+                    cluster_id: self._slots[cluster_id] for cluster_id in ids
+                }
+                self._positions = {
+                    cluster_id: self._positions[cluster_id] for cluster_id in ids
+                }
+            return self._positions
+
+        index = {cluster_id: i for i, cluster_id in enumerate(ids)}
+        sources, targets = graph_edges(clusters, index)
+        if len(new) * 2 > len(ids):
+            slots = self._layout_all(len(ids), sources, targets)
+        else:
+            slots = self._layout_new(ids, new, sources, targets)
+
+        self._slots = dict(zip(ids, slots))
+        self._positions = {
+            cluster_id: (
+                ORIGIN[0] + column * SLOT_SIZE[0],
+                ORIGIN[1] + row * SLOT_SIZE[1],
+            )
+            for cluster_id, (column, row) in self._slots.items()
+        }
+        return self._positions
+
+    def _layout_all(
+        self, n: int, sources: np.ndarray, targets: np.ndarray
+    ) -> List[Slot]:
+        pos = force_layout(
+            n, sources, targets, iterations=self.iterations, seed=self.seed
+        )
+        slots = pack_slots(pos, SLOT_SIZE[0] / SLOT_SIZE[1])
+        return [(int(column), int(row)) for column, row in slots]
+
+    def _layout_new(
+        self,
+        ids: List[str],
+        new: List[int],
+        sources: np.ndarray,
+        targets: np.ndarray,
+    ) -> List[Slot]:
+        n = len(ids)
+        pinned = np.ones(n, dtype=bool)
+        pinned[new] = False
+        pos = np.zeros((n, 2))
+        known = np.flatnonzero(pinned)
+        pos[known] = [self._slots[ids[i]] for i in known]
+
+        # Start new clusters at the mean of their already placed neighbours
+        rng = np.random.default_rng(self.seed)
+        weight = np.zeros(n)
+        total = np.zeros((n, 2))
+        for a, b in ((sources, targets), (targets, sources)):
+            mask = pinned[b] & ~pinned[a]
+            np.add.at(total, a[mask], pos[b[mask]])
+            np.add.at(weight, a[mask], 1)
+        low, high = pos[known].min(axis=0), pos[known].max(axis=0)
+        for i in new:
+            if weight[i]:
+                pos[i] = total[i] / weight[i] + rng.uniform(-0.5, 0.5, 2)
+            else:
+                pos[i] = rng.uniform(low, high + 1)
+
+        pos = force_layout(
+            n,
+            sources,
+            targets,
+            initial=pos,
+            pinned=pinned,
+            iterations=max(self.iterations // 3, 1),
+            seed=self.seed,
+        )
+
+        slots: List[Optional[Slot]] = [None] * n
+        taken = set()
+        for i in known:
+            slots[i] = self._slots[ids[i]]
+            taken.add(slots[i])
+        spill_row = int(high[1]) + 1
+        spill_column = 0
+        for i in new:
+            slot = _nearest_free_slot(pos[i], taken)
+            if slot is None:
+                while (spill_column, spill_row) in taken:
+                    spill_column += 1
+                slot = (spill_column, spill_row)
+            slots[i] = slot
+            taken.add(slot)
+        return slots
+
+
+def _nearest_free_slot(position: np.ndarray, taken: set) -> Optional[Slot]:
+    """Closest slot with non-negative coordinates not in taken, if any is near"""
+    column = max(int(round(position[0])), 0)
+    row = max(int(round(position[1])), 0)
+    for radius in range(_SEARCH_RADIUS + 1):
+        ring = [
+            (column + dc, row + dr)
+            for dc in range(-radius, radius + 1)
+            for dr in range(-radius, radius + 1)
+            if max(abs(dc), abs(dr)) == radius
+        ]
+        ring.sort(key=lambda slot: (slot[0] - column) ** 2 + (slot[1] - row) ** 2)
+        for slot in ring:
+            if slot[0] >= 0 and slot[1] >= 0 and slot not in taken:
+                return slot
+    return None
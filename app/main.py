@@ -1,16 +1,36 @@
 import streamlit as st
 import json
+import os
+import re
 import pandas as pd
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set, Tuple
 from streamlit_flow import streamlit_flow
 from streamlit_flow.elements import StreamlitFlowNode, StreamlitFlowEdge
 from streamlit_flow.state import StreamlitFlowState
 
 # Import our modules
+from analytics import DEFAULT_BETWEENNESS_SAMPLES, EXACT_BETWEENNESS_LIMIT
 from cluster_manager import ClusterManager
-from messages import SUCCESS_MESSAGES, ERROR_MESSAGES, INFO_MESSAGES
+from columnar import available_formats, member_frame
+from dataset_cache import DatasetCache
+from layout import GraphLayout
+from messages import SUCCESS_MESSAGES, ERROR_MESSAGES, INFO_MESSAGES, format_error
+from operations import operations_from_document
 from styles import get_css_styles
+from view_cache import ViewCache
+from visualization import (
+    DEFAULT_NODE_BUDGET,
+    DEFAULT_VIEWPORT,
+    Position,
+    Viewport,
+    diff_flow,
+    flow_signatures,
+    grid_position,
+    patch_flow_elements,
+    plan_flow_view,
+    viewport_around,
+)
 
 # Configure Streamlit page
 st.set_page_config(
@@ -23,11 +43,70 @@ st.set_page_config(
 # Apply custom CSS
 st.markdown(get_css_styles(), unsafe_allow_html=True)
 
-
-def create_flow_visualization(
-    clusters: List[Dict], search_query: str = ""
-) -> StreamlitFlowState:
-    """Create flow visualization of clusters using streamlit-flow (v1.6+ compatible)"""
+# Uploads are parsed incrementally, so the cap only guards against runaway
+# files; Streamlit's own limit is raised to match in .streamlit/config.toml
+MAX_UPLOAD_BYTES = 4 * 1024**3
+
+EXPORT_FORMATS = {
+    "json": "JSON",
+    "binary": "Binary workbench",
+    "parquet": "Parquet",
+    "feather": "Feather",
+    "csv": "CSV",
+}
+
+# Workbench files are kept in this directory, named <name>.db (or <name>.cwb
+# for binary workbench files)
+WORKBENCH_DIR = os.environ.get("CLUSTER_WORKBENCH_DIR", "workbenches")
+WORKBENCH_NAME = re.compile(r"[\w][\w .-]*")
+
+# Most matches a type-ahead selector offers at once
+SELECTOR_LIMIT = 50
+
+# Choices of how many clusters the details section lists per page
+DETAILS_PAGE_SIZES = [10, 25, 50, 100]
+
+MEMBER_NODE_STYLE = {
+    "width": 180,
+    "height": 20,
+    "background": "#FFFFFF",
+    "color": "#333333",
+    "border": "1px solid #CCCCCC",
+    "borderRadius": "5px",
+    "padding": "2px 5px",
+    "fontSize": "12px",
+}
+
+
+@st.cache_resource
+def dataset_cache() -> DatasetCache:
+    """The cache of loaded uploads shared by every session of this server"""
+    return DatasetCache()
+
+
+def cached(cluster_manager, key, compute):
+    """Return compute() memoized for the current version of the workbench data"""
+    return st.session_state.view_cache.get(key, cluster_manager.version, compute)
+
+
+def build_flow_elements(
+    clusters: List[Dict],
+    matched_ids: Optional[Set[str]] = None,
+    expanded: Optional[Set[str]] = None,
+    viewport: Optional[Viewport] = None,
+    node_budget: Optional[int] = DEFAULT_NODE_BUDGET,
+    layout: Optional[Dict[str, Position]] = None,
+) -> Tuple[List[StreamlitFlowNode], List[StreamlitFlowEdge], Tuple[Dict, Dict]]:
+    """Build the flow nodes and edges for clusters, with their signatures
+
+    matched_ids holds the ids of clusters matching the current search; they are
+    highlighted instead of being re-matched against the search query here.
+    Clusters are drawn collapsed unless they are in expanded or inside
+    viewport, and at most node_budget nodes are sent to the browser. Passing
+    node_budget=None and expanded=None draws every member of every cluster.
+    layout maps cluster ids to node positions; without it clusters are placed
+    on a 3-column grid.
+    """
     nodes: List[StreamlitFlowNode] = []
     edges: List[StreamlitFlowEdge] = []
 
@@ -42,33 +121,52 @@ def create_flow_visualization(
         "#3A86FF",
     ]
 
+    if layout is None:
+        positions = [grid_position(i) for i in range(len(clusters))]
+    else:
+        positions = [layout[str(cluster["id"])] for cluster in clusters]
+    if expanded is None and node_budget is None:
+        expanded = {str(cluster["id"]) for cluster in clusters}
+    views = plan_flow_view(
+        clusters,
+        positions,
+        expanded or set(),
+        viewport=viewport,
+        node_budget=node_budget,
+        priority=matched_ids or set(),
+    )
+
     # --- build nodes ---
-    for i, cluster in enumerate(clusters):
+    for view in views:
+        cluster = view.cluster
         cluster_id = str(cluster["id"])
         member_count = len(cluster["members"])
+        x, y = view.position
+        shown = len(view.members) + (1 if view.hidden_members and view.members else 0)
 
-        is_match = False
-        if search_query:
-            q = search_query.lower()
-            is_match = q in cluster["name"].lower() or any(
-                q in m["name"].lower() for m in cluster["members"]
-            )
+        is_match = bool(matched_ids) and cluster_id in matched_ids
 
         nodes.append(
             StreamlitFlowNode(
                 id=cluster_id,
-                pos=(100 + (i % 3) * 300, 100 + (i // 3) * 200),
+                pos=(x, y),
                 data={
-                    "label": cluster["name"],
-                    "members": cluster["members"],
+                    "label": (
+                        cluster["name"]
+                        if view.members
+                        else f"{cluster['name']} ({member_count} members)"
+                    ),
+                    "member_count": member_count,
                     "type": "cluster",
                 },
                 node_type="default" if member_count > 1 else "input",
                 style={
                     "width": 200,
-                    "height": max(100, 50 + member_count * 20),
+                    "height": max(60 if not view.members else 100, 50 + shown * 20),
                     "background": (
-                        "#FF0000" if is_match else color_palette[i % len(color_palette)]
+                        "#FF0000"
+                        if is_match
+                        else color_palette[view.index % len(color_palette)]
                     ),
                     "color": "white",
                     "border": "2px solid #FFFFFF",
@@ -76,47 +174,59 @@ def create_flow_visualization(
                     "padding": "10px",
                 },
                 draggable=True,
+                selectable=True,
             )
         )
 
         # member nodes
-        for j, member in enumerate(cluster["members"]):
+        for j, member in enumerate(view.members):
             nodes.append(
                 StreamlitFlowNode(
                     id=f"{cluster_id}_{member['id']}",
-                    pos=(110 + (i % 3) * 300, 130 + (i // 3) * 200 + j * 25),
+                    pos=(x + 10, y + 30 + j * 25),
                     data={
                         "label": member["name"],
                         "type": "member",
                         "parent": cluster_id,
                     },
                     node_type="default",
-                    style={
-                        "width": 180,
-                        "height": 20,
-                        "background": "#FFFFFF",
-                        "color": "#333333",
-                        "border": "1px solid #CCCCCC",
-                        "borderRadius": "5px",
-                        "padding": "2px 5px",
-                        "fontSize": "12px",
-                    },
+                    style=dict(MEMBER_NODE_STYLE),
                     draggable=True,
                     parent=cluster_id,
                 )
             )
+        if view.members and view.hidden_members:
+            nodes.append(
+                StreamlitFlowNode(
+                    id=f"{cluster_id}__more",
+                    pos=(x + 10, y + 30 + len(view.members) * 25),
+                    data={
+                        "label": INFO_MESSAGES["more_members"].format(
+                            count=view.hidden_members
+                        ),
+                        "type": "more",
+                        "parent": cluster_id,
+                    },
+                    node_type="default",
+                    style=dict(MEMBER_NODE_STYLE, color="#888888"),
+                    draggable=False,
+                    parent=cluster_id,
+                )
+            )
 
     # --- build edges ---
-    edge_id = 0
     # use a set of cluster ids present for quick membership checks
     present_clusters = {n.id for n in nodes if n.data.get("type") == "cluster"}
+    seen_edges = set()
     for cluster in clusters:
         source_id = str(cluster["id"])
         for related_id in cluster.get("relationships", []):
-            if related_id in present_clusters:
+            edge_id = f"edge_{source_id}_{related_id}"
+            if related_id in present_clusters and edge_id not in seen_edges:
+                seen_edges.add(edge_id)
                 edges.append(
                     StreamlitFlowEdge(
-                        id=f"edge_{edge_id}",
+                        id=edge_id,
                         source=source_id,
                         target=related_id,
                         edge_type="smoothstep",
@@ -124,17 +234,35 @@ def create_flow_visualization(
                         animated=False,
                     )
                 )
-                edge_id += 1
 
+    return nodes, edges, (flow_signatures(nodes), flow_signatures(edges))
+
+
+def create_flow_visualization(
+    nodes: List[StreamlitFlowNode],
+    edges: List[StreamlitFlowEdge],
+    signatures: Tuple[Dict, Dict],
+) -> StreamlitFlowState:
+    """Create flow visualization of clusters using streamlit-flow (v1.6+ compatible)
+
+    Takes the output of build_flow_elements.
+    """
     # --- keep state in session_state to avoid infinite re-render loops ---
-    if "flow_state" not in st.session_state:
-        st.session_state.flow_state = StreamlitFlowState(nodes, edges)
+    # Only elements whose content hash changed since the last run are
+    # replaced; the others keep the state the browser sent back, such as
+    # dragged positions. The timestamp tells the component to take the
+    # patched state, so it is left alone when nothing changed.
+    state = st.session_state.get("flow_state")
+    if state is None:
+        st.session_state.flow_state = StreamlitFlowState(list(nodes), list(edges))
     else:
-        # Re-initialize only if the underlying data really changed.
-        # A simple (and cheap) guard: compare counts; replace if different.
-        cur = st.session_state.flow_state
-        if len(cur.nodes) != len(nodes) or len(cur.edges) != len(edges):
-            st.session_state.flow_state = StreamlitFlowState(nodes, edges)
+        node_diff = diff_flow(st.session_state.flow_signatures[0], signatures[0])
+        edge_diff = diff_flow(st.session_state.flow_signatures[1], signatures[1])
+        if node_diff or edge_diff:
+            state.nodes = patch_flow_elements(state.nodes, nodes, node_diff)
+            state.edges = patch_flow_elements(state.edges, edges, edge_diff)
+            state.timestamp = int(datetime.now().timestamp() * 1000)
+    st.session_state.flow_signatures = signatures
 
     # Render component (positional args; no extra kwargs)
     updated_state = streamlit_flow("cluster_flow", st.session_state.flow_state)
@@ -147,22 +275,32 @@ def create_flow_visualization(
 
 
 def handle_flow_events(flow_state: Optional[StreamlitFlowState], cluster_manager):
-    """Handle interactions using the returned StreamlitFlowState."""
+    """Handle interactions using the returned StreamlitFlowState.
+
+    Clicking a cluster node toggles whether its members are drawn and moves
+    the viewport used for virtualized rendering onto that cluster.
+    """
     if not flow_state:
         return
 
-    # Example pattern: if your state exposes a 'last_interaction' or 'selected_id',
-    # you can react to it here. (Exact field names depend on the version;
-    # see the Interactions demo/docs.)
-    # Pseudocode:
-    #
-    # selected = getattr(flow_state, "selected_id", None)
-    # if selected:
-    #     if "_" in selected:
-    #         cluster_id, member_id = selected.split("_", 1)
-    #         st.session_state.selected_member = {"cluster_id": cluster_id, "member_id": member_id}
-    #     else:
-    #         st.session_state.selected_cluster = selected
+    selected = getattr(flow_state, "selected_id", None)
+    if not selected or selected == st.session_state.get("last_selected_id"):
+        return
+    st.session_state.last_selected_id = selected
+
+    if cluster_manager.get_cluster_by_id(selected) is None:
+        return
+    expanded = st.session_state.expanded_clusters
+    if selected in expanded:
+        expanded.discard(selected)
+    else:
+        expanded.add(selected)
+    node = next((n for n in flow_state.nodes if n.id == selected), None)
+    if node is not None:
+        st.session_state.flow_viewport = viewport_around(
+            (node.position["x"], node.position["y"])
+        )
+    st.rerun()
 
 
 def render_sidebar(cluster_manager):
@@ -172,7 +310,9 @@ def render_sidebar(cluster_manager):
         with st.expander(label="Cluster Metrics", expanded=True):
 
             if cluster_manager.data["clusters"]:
-                metrics = cluster_manager.get_metrics()
+                metrics = cached(
+                    cluster_manager, "metrics", cluster_manager.get_metrics
+                )
 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -181,9 +321,74 @@ def render_sidebar(cluster_manager):
                 with col2:
                     st.metric("Avg Members/Cluster", metrics["avg_members_per_cluster"])
                     st.metric("Total Relationships", metrics["total_relationships"])
+
+                st.caption(
+                    INFO_MESSAGES["cluster_size_stats"].format(
+                        min=metrics["min_cluster_size"],
+                        median=metrics["median_cluster_size"],
+                        max=metrics["max_cluster_size"],
+                    )
+                )
+                st.caption(
+                    INFO_MESSAGES["relationship_graph_stats"].format(
+                        min=metrics["min_degree"],
+                        avg=metrics["avg_degree"],
+                        max=metrics["max_degree"],
+                        isolated=metrics["isolated_clusters"],
+                    )
+                )
+                st.caption(
+                    INFO_MESSAGES["largest_clusters"].format(
+                        clusters=", ".join(
+                            f"{c['name']} ({c['members']})"
+                            for c in metrics["largest_clusters"]
+                        )
+                    )
+                )
             else:
                 st.info(INFO_MESSAGES["upload_data"])
 
+        facets = cached(cluster_manager, "facets", cluster_manager.get_facet_counts)
+        if facets:
+            with st.expander(label="Member Facets", expanded=False):
+                st.caption(INFO_MESSAGES["facet_search_hint"])
+                for field, counts in facets.items():
+                    st.markdown(f"**{field}**")
+                    st.caption(
+                        " · ".join(f"{value} ({count})" for value, count in counts)
+                    )
+
+        if cluster_manager.data["clusters"]:
+            with st.expander(label="🕸️ Graph Analytics", expanded=False):
+                render_graph_analytics(cluster_manager)
+
+        st.divider()
+
+        # View
+        st.header("🖼️ View")
+        st.toggle(
+            "Virtualized rendering",
+            value=True,
+            key="virtualized_view",
+            help=INFO_MESSAGES["virtualized_view_help"],
+        )
+        st.number_input(
+            "Node budget",
+            min_value=100,
+            value=DEFAULT_NODE_BUDGET,
+            step=100,
+            key="node_budget",
+            disabled=not st.session_state.virtualized_view,
+        )
+        if st.button("➖ Collapse All Clusters"):
+            st.session_state.expanded_clusters = set()
+            st.session_state.flow_viewport = None
+            st.rerun()
+        if st.button("🧭 Re-run Layout", help=INFO_MESSAGES["rerun_layout_help"]):
+            st.session_state.graph_layout.clear()
+            st.session_state.layout_generation += 1
+            st.rerun()
+
         st.divider()
 
         # Operations
@@ -195,30 +400,357 @@ def render_sidebar(cluster_manager):
                 st.rerun()
             else:
                 st.warning(ERROR_MESSAGES["nothing_to_undo"])
+        if st.button("↪️ Redo Last Operation"):
+            if cluster_manager.redo():
+                st.success(SUCCESS_MESSAGES["operation_redone"])
+                st.rerun()
+            else:
+                st.warning(ERROR_MESSAGES["nothing_to_redo"])
+        if cluster_manager.history:
+            metrics = cached(cluster_manager, "metrics", cluster_manager.get_metrics)
+            st.caption(
+                INFO_MESSAGES["history_usage"].format(
+                    depth=metrics["history_depth"],
+                    redo=metrics["redo_depth"],
+                    size=metrics["history_bytes"] / 1024,
+                )
+            )
         # Clear the progress
         if st.button(
             label="🧹 Clear Workbench",
             help="Caution: This will clear all your progress and data.",
         ):
-            cluster_manager.data["clusters"] = []
+            cluster_manager.clear()
             st.rerun()
 
         # Export functionality
         if cluster_manager.data["clusters"]:
             st.header("📤 Export")
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"clusters_updated_{timestamp}.json"
-
-            json_str = json.dumps(cluster_manager.data, indent=2)
-            st.download_button(
-                label="📥 Download Updated JSON",
-                data=json_str,
-                file_name=filename,
-                mime="application/json",
+            export_format = st.selectbox(
+                "Format",
+                ["json", "binary"] + available_formats(),
+                format_func=EXPORT_FORMATS.get,
+                help=INFO_MESSAGES["table_export_help"],
+            )
+            filename = f"clusters_updated_{timestamp}"
+
+            # Exports are only generated when the button is clicked, and
+            # ClusterManager caches them until the data changes
+            if export_format == "json":
+                compact = st.toggle(
+                    "Compact JSON", help=INFO_MESSAGES["compact_export_help"]
+                )
+                compress = st.toggle("Gzip", help=INFO_MESSAGES["gzip_export_help"])
+                st.download_button(
+                    label="📥 Download Updated JSON",
+                    data=lambda: cluster_manager.export_json(compact, compress),
+                    file_name=f"{filename}.json.gz" if compress else f"{filename}.json",
+                    mime="application/gzip" if compress else "application/json",
+                )
+            elif export_format == "binary":
+                st.download_button(
+                    label="📥 Download Binary Workbench",
+                    data=cluster_manager.export_binary,
+                    file_name=f"{filename}.cwb",
+                    mime="application/octet-stream",
+                    help=INFO_MESSAGES["binary_file_help"],
+                )
+            else:
+                st.download_button(
+                    label=f"📥 Download {EXPORT_FORMATS[export_format]} Tables",
+                    data=lambda: cluster_manager.export_columnar(export_format),
+                    file_name=f"{filename}_{export_format}.zip",
+                    mime="application/zip",
+                )
+
+        render_workbench_file(cluster_manager)
+
+        with st.expander("🛠️ Settings", expanded=False):
+            stats = st.session_state.view_cache.stats()
+            st.caption(
+                INFO_MESSAGES["view_cache_stats"].format(
+                    hits=stats["hits"],
+                    misses=stats["misses"],
+                    rate=stats["hit_rate"] * 100,
+                    entries=stats["entries"],
+                    version=cluster_manager.version,
+                )
+            )
+            shared = dataset_cache().stats()
+            st.caption(
+                INFO_MESSAGES["dataset_cache_stats"].format(
+                    entries=shared["entries"],
+                    size=shared["bytes"] / 1024**2,
+                    hits=shared["hits"],
+                )
             )
+            if st.button("♻️ Reset View Cache"):
+                st.session_state.view_cache.clear()
+                st.rerun()
     return
 
 
+def workbench_file(name: str, extension: str = ".db") -> Optional[str]:
+    """Path of the workbench file called name in WORKBENCH_DIR, or None if
+    name is not a plain file name"""
+    if not WORKBENCH_NAME.fullmatch(name):
+        return None
+    os.makedirs(WORKBENCH_DIR, exist_ok=True)
+    return os.path.join(WORKBENCH_DIR, f"{name}{extension}")
+
+
+def open_workbench(cluster_manager, name: str) -> tuple:
+    """Open the named workbench file and remember it in the page URL, so that
+    a browser refresh or a new session reopens it"""
+    path = workbench_file(name)
+    if path is None:
+        return False, "invalid_workbench_name"
+    result = cluster_manager.open_workbench(path)
+    if result[0]:
+        st.query_params["workbench"] = name
+        st.session_state.layout_generation += 1
+    return result
+
+
+def open_binary(cluster_manager, name: str) -> tuple:
+    """Open the named binary workbench file in WORKBENCH_DIR"""
+    path = workbench_file(name, ".cwb")
+    if path is None:
+        return False, "invalid_workbench_name"
+    if not os.path.exists(path):
+        return False, "no_binary_file", {"name": name}
+    result = cluster_manager.load_binary(path)
+    if result[0]:
+        st.session_state.layout_generation += 1
+    return result
+
+
+def render_workbench_file(cluster_manager):
+    """Render opening a workbench file and its snapshots"""
+    st.header("💾 Workbench File")
+    name = st.text_input(
+        "Workbench name",
+        value=st.query_params.get("workbench", "workbench"),
+        help=INFO_MESSAGES["workbench_file_help"],
+    )
+    if st.button("📂 Open Workbench"):
+        success, message, *details = open_workbench(cluster_manager, name)
+        if success:
+            st.success(SUCCESS_MESSAGES[message])
+            st.rerun()
+        else:
+            st.error(format_error(message, *details))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("⚡ Open Binary", help=INFO_MESSAGES["binary_file_help"]):
+            success, message, *details = open_binary(cluster_manager, name)
+            if success:
+                st.success(SUCCESS_MESSAGES[message])
+                st.rerun()
+            else:
+                st.error(format_error(message, *details))
+    with col2:
+        if cluster_manager.data["clusters"] and st.button("💾 Save Binary"):
+            path = workbench_file(name, ".cwb")
+            if path is None:
+                st.error(ERROR_MESSAGES["invalid_workbench_name"])
+            else:
+                success, message, *details = cluster_manager.save_binary(path)
+                if success:
+                    st.success(SUCCESS_MESSAGES[message].format(path=path))
+                else:
+                    st.error(format_error(message, *details))
+
+    if cluster_manager.workbench_path is None:
+        return
+    st.caption(
+        INFO_MESSAGES["workbench_saving"].format(path=cluster_manager.workbench_path)
+    )
+    snapshot_name = st.text_input(
+        "Snapshot name", value=datetime.now().strftime("%Y-%m-%d %H:%M")
+    )
+    if snapshot_name and st.button("📸 Save Snapshot"):
+        success, message, *details = cluster_manager.save_snapshot(snapshot_name)
+        if success:
+            st.success(SUCCESS_MESSAGES[message].format(name=snapshot_name))
+        else:
+            st.error(format_error(message, *details))
+
+    snapshots = {
+        name: INFO_MESSAGES["snapshot_option"].format(
+            name=name, created=created, count=count
+        )
+        for name, created, count in cluster_manager.list_snapshots()
+    }
+    if snapshots:
+        snapshot = st.selectbox("Snapshot", list(snapshots), format_func=snapshots.get)
+        if st.button(
+            "⏪ Restore Snapshot", help=INFO_MESSAGES["restore_snapshot_help"]
+        ):
+            success, message, *details = cluster_manager.restore_snapshot(snapshot)
+            if success:
+                st.success(SUCCESS_MESSAGES[message].format(name=snapshot))
+                st.rerun()
+            else:
+                st.error(format_error(message, *details))
+
+
+def render_graph_analytics(cluster_manager, top_k: int = 5):
+    """Render components, central clusters and shortest paths of the
+    relationship graph. Nothing is computed until the toggle is on, and
+    results are kept by ClusterManager until the data changes.
+    """
+    if not st.toggle(
+        "Analyze relationships",
+        key="graph_analytics",
+        help=INFO_MESSAGES["graph_analytics_help"],
+    ):
+        return
+
+    analytics = cluster_manager.get_analytics()
+
+    def describe(scores, fmt):
+        return ", ".join(
+            f"{cluster_manager.get_cluster_by_id(cluster_id)['name']} ({fmt(score)})"
+            for cluster_id, score in analytics.top(scores, top_k)
+        )
+
+    groups = analytics.component_sizes()
+    st.caption(
+        INFO_MESSAGES["graph_components"].format(
+            count=len(groups),
+            edges=analytics.edge_count,
+            largest=groups[0][0],
+        )
+    )
+    st.caption(
+        INFO_MESSAGES["most_connected"].format(
+            clusters=describe(analytics.degrees(), int)
+        )
+    )
+    st.caption(
+        INFO_MESSAGES["bridge_clusters"].format(
+            clusters=describe(analytics.betweenness(), lambda score: f"{score:.3f}")
+        )
+    )
+    if len(analytics.ids) > EXACT_BETWEENNESS_LIMIT:
+        st.caption(
+            INFO_MESSAGES["sampled_betweenness"].format(
+                samples=DEFAULT_BETWEENNESS_SAMPLES
+            )
+        )
+
+    path_from = cluster_picker(cluster_manager, "Path from", "path_from")
+    path_to = cluster_picker(cluster_manager, "Path to", "path_to")
+    if path_from and path_to and st.button("🔎 Find Shortest Path"):
+        path = analytics.shortest_path(path_from, path_to)
+        if path is None:
+            st.warning(INFO_MESSAGES["no_path"])
+        else:
+            st.caption(
+                INFO_MESSAGES["shortest_path"].format(
+                    hops=len(path) - 1,
+                    path=" → ".join(
+                        cluster_manager.get_cluster_by_id(cluster_id)["name"]
+                        for cluster_id in path
+                    ),
+                )
+            )
+
+
+def cluster_picker(cluster_manager, label: str, key: str) -> Optional[str]:
+    """Type-ahead cluster selector returning the id of the chosen cluster.
+
+    Only the best SELECTOR_LIMIT matches of the typed text, found through
+    the ClusterManager index, are offered instead of every cluster.
+    """
+    query = st.text_input(
+        label,
+        key=f"{key}_query",
+        placeholder=INFO_MESSAGES["find_cluster_placeholder"],
+    )
+    matches = cached(
+        cluster_manager,
+        ("find_clusters", query),
+        lambda: cluster_manager.find_clusters(query, SELECTOR_LIMIT),
+    )
+    if not matches:
+        st.caption(INFO_MESSAGES["no_cluster_matches"])
+        return None
+    options = {str(c["id"]): f"{c['name']} (ID: {c['id']})" for c in matches}
+    if len(matches) == SELECTOR_LIMIT:
+        st.caption(INFO_MESSAGES["more_matches"].format(limit=SELECTOR_LIMIT))
+    return st.selectbox(
+        label,
+        list(options),
+        format_func=options.get,
+        key=key,
+        label_visibility="collapsed",
+    )
+
+
+def member_picker(cluster_manager, cluster_id: str, label: str, key: str) -> List[str]:
+    """Choose members of a cluster and return their ids.
+
+    Members are either picked from type-ahead matches, keeping earlier picks
+    while the search changes, or selected by a field:value rule that
+    ClusterManager resolves against its metadata index.
+    """
+    mode = st.radio(
+        label, ["Pick members", "Select by rule"], horizontal=True, key=f"{key}_mode"
+    )
+    if mode == "Select by rule":
+        rule = st.text_input(
+            "Rule",
+            key=f"{key}_rule",
+            placeholder='department:Engineering location:"Austin, TX"',
+            help=INFO_MESSAGES["member_rule_help"],
+        )
+        if not rule:
+            return []
+        member_ids = cached(
+            cluster_manager,
+            ("select_members", cluster_id, rule),
+            lambda: cluster_manager.select_members(cluster_id, rule),
+        )
+        if member_ids is None:
+            st.warning(
+                ERROR_MESSAGES["invalid_member_rule"].format(
+                    fields=", ".join(cluster_manager.get_facet_fields())
+                )
+            )
+            return []
+        st.caption(INFO_MESSAGES["rule_matches"].format(count=len(member_ids)))
+        return member_ids
+
+    query = st.text_input(
+        "Find members",
+        key=f"{key}_query",
+        placeholder=INFO_MESSAGES["find_member_placeholder"],
+    )
+    matches = cached(
+        cluster_manager,
+        ("find_members", cluster_id, query),
+        lambda: cluster_manager.find_members(cluster_id, query, SELECTOR_LIMIT),
+    )
+    labels = {}
+    # Earlier picks stay selected even when the new query does not match them
+    for member_id in st.session_state.get(key, []):
+        member = cluster_manager.get_member_by_id(cluster_id, member_id)
+        if member is not None:
+            labels[member_id] = f"{member['name']} (ID: {member['id']})"
+    st.session_state[key] = list(labels)
+    for member in matches:
+        labels.setdefault(str(member["id"]), f"{member['name']} (ID: {member['id']})")
+    if len(matches) == SELECTOR_LIMIT:
+        st.caption(INFO_MESSAGES["more_matches"].format(limit=SELECTOR_LIMIT))
+    return st.multiselect(
+        "Selected members", list(labels), format_func=labels.get, key=key
+    )
+
+
 def render_cluster_operations(cluster_manager):
     """Render the cluster operations panel"""
     if cluster_manager.data["clusters"]:
@@ -226,13 +758,16 @@ def render_cluster_operations(cluster_manager):
 
         # Operation selection
         operation = st.selectbox(
-            "Select Operation", ["Merge Clusters", "Move Members", "Split Cluster"]
+            "Select Operation",
+            [
+                "Merge Clusters",
+                "Move Members",
+                "Split Cluster",
+                "Apply Operations File",
+            ],
         )
 
         clusters = cluster_manager.data["clusters"]
-        cluster_options = {
-            f"{c['name']} (ID: {c['id']})": str(c["id"]) for c in clusters
-        }
 
         if operation == "Merge Clusters":
             st.subheader("🔗 Merge Two Clusters")
@@ -240,23 +775,18 @@ def render_cluster_operations(cluster_manager):
             if len(clusters) < 2:
                 st.warning(INFO_MESSAGES["need_two_clusters"].format(operation="merge"))
             else:
-                cluster1 = st.selectbox(
-                    "Select first cluster",
-                    options=list(cluster_options.keys()),
-                    key="merge_cluster1",
+                cluster1_id = cluster_picker(
+                    cluster_manager, "Select first cluster", "merge_cluster1"
                 )
-                cluster2 = st.selectbox(
-                    "Select second cluster",
-                    options=list(cluster_options.keys()),
-                    key="merge_cluster2",
+                cluster2_id = cluster_picker(
+                    cluster_manager, "Select second cluster", "merge_cluster2"
                 )
                 new_name = st.text_input("New cluster name", value="Merged Cluster")
 
-                if cluster1 != cluster2 and new_name:
+                if cluster1_id is None or cluster2_id is None:
+                    return
+                if cluster1_id != cluster2_id and new_name:
                     if st.button("🔗 Merge Clusters", type="primary"):
-                        cluster1_id = cluster_options[cluster1]
-                        cluster2_id = cluster_options[cluster2]
-
                         if cluster_manager.merge_clusters(
                             cluster1_id, cluster2_id, new_name
                         ):
@@ -264,7 +794,7 @@ def render_cluster_operations(cluster_manager):
                             st.rerun()
                         else:
                             st.error(ERROR_MESSAGES["merge_failed"])
-                elif cluster1 == cluster2:
+                elif cluster1_id == cluster2_id:
                     st.warning(INFO_MESSAGES["select_different_clusters"])
 
         elif operation == "Move Members":
@@ -275,39 +805,30 @@ def render_cluster_operations(cluster_manager):
                     INFO_MESSAGES["need_two_clusters"].format(operation="move members")
                 )
             else:
-                source_cluster = st.selectbox(
-                    "Source cluster",
-                    options=list(cluster_options.keys()),
-                    key="move_source",
+                source_cluster_id = cluster_picker(
+                    cluster_manager, "Source cluster", "move_source"
                 )
-                target_cluster = st.selectbox(
-                    "Target cluster",
-                    options=list(cluster_options.keys()),
-                    key="move_target",
+                target_cluster_id = cluster_picker(
+                    cluster_manager, "Target cluster", "move_target"
                 )
 
-                if source_cluster != target_cluster:
-                    source_cluster_id = cluster_options[source_cluster]
+                if source_cluster_id is None or target_cluster_id is None:
+                    return
+                if source_cluster_id != target_cluster_id:
                     source_cluster_obj = cluster_manager.get_cluster_by_id(
                         source_cluster_id
                     )
 
                     if source_cluster_obj and source_cluster_obj["members"]:
-                        member_options = {
-                            f"{m['name']} (ID: {m['id']})": str(m["id"])
-                            for m in source_cluster_obj["members"]
-                        }
-                        selected_members = st.multiselect(
-                            "Select members to move",
-                            options=list(member_options.keys()),
+                        member_ids = member_picker(
+                            cluster_manager,
+                            source_cluster_id,
+                            "Members to move",
+                            "move_members",
                         )
 
-                        if selected_members:
-                            member_ids = [member_options[m] for m in selected_members]
-
+                        if member_ids:
                             if st.button("🔄 Move Members", type="primary"):
-                                target_cluster_id = cluster_options[target_cluster]
-
                                 if cluster_manager.move_members(
                                     source_cluster_id, target_cluster_id, member_ids
                                 ):
@@ -323,34 +844,29 @@ def render_cluster_operations(cluster_manager):
         elif operation == "Split Cluster":
             st.subheader("✂️ Split Cluster")
 
-            selected_cluster = st.selectbox(
-                "Select cluster to split",
-                options=list(cluster_options.keys()),
-                key="split_cluster",
+            cluster_id = cluster_picker(
+                cluster_manager, "Select cluster to split", "split_cluster"
+            )
+            cluster_obj = (
+                cluster_manager.get_cluster_by_id(cluster_id) if cluster_id else None
             )
-            cluster_id = cluster_options[selected_cluster]
-            cluster_obj = cluster_manager.get_cluster_by_id(cluster_id)
 
             if cluster_obj and len(cluster_obj["members"]) > 1:
-                member_options = {
-                    f"{m['name']} (ID: {m['id']})": str(m["id"])
-                    for m in cluster_obj["members"]
-                }
-                selected_members = st.multiselect(
-                    "Select members for new cluster",
-                    options=list(member_options.keys()),
+                member_ids = member_picker(
+                    cluster_manager,
+                    cluster_id,
+                    "Members for new cluster",
+                    "split_members",
                 )
                 new_cluster_name = st.text_input(
                     "New cluster name", value="Split Cluster"
                 )
 
                 if (
-                    selected_members
+                    member_ids
                     and new_cluster_name
-                    and len(selected_members) < len(cluster_obj["members"])
+                    and len(member_ids) < len(cluster_obj["members"])
                 ):
-                    member_ids = [member_options[m] for m in selected_members]
-
                     if st.button("✂️ Split Cluster", type="primary"):
                         if cluster_manager.split_cluster(
                             cluster_id, member_ids, new_cluster_name
@@ -359,10 +875,40 @@ def render_cluster_operations(cluster_manager):
                             st.rerun()
                         else:
                             st.error(ERROR_MESSAGES["split_failed"])
-                elif len(selected_members) >= len(cluster_obj["members"]):
+                elif len(member_ids) >= len(cluster_obj["members"]):
                     st.warning(INFO_MESSAGES["cannot_move_all"])
-            else:
+            elif cluster_obj:
                 st.warning(INFO_MESSAGES["min_members_to_split"])
+
+        elif operation == "Apply Operations File":
+            st.subheader("📜 Apply Operations File")
+
+            operations_file = st.file_uploader(
+                "Upload JSON file with operations",
+                type=["json"],
+                help=INFO_MESSAGES["operations_file_help"],
+                key="operations_file",
+            )
+            if operations_file is not None:
+                try:
+                    document = json.load(operations_file)
+                except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                    st.error(ERROR_MESSAGES["invalid_json_file"].format(e=str(e)))
+                    return
+                operations, errors = operations_from_document(document)
+                if errors:
+                    st.error(format_error(errors[0].code, errors[0].params))
+                elif st.button(
+                    f"▶️ Apply {len(operations)} Operations", type="primary"
+                ):
+                    success, message, *details = cluster_manager.apply_batch(operations)
+                    if success:
+                        st.success(
+                            SUCCESS_MESSAGES[message].format(count=len(operations))
+                        )
+                        st.rerun()
+                    else:
+                        st.error(format_error(message, *details))
     else:
         st.info(INFO_MESSAGES["upload_data_for_ops"])
 
@@ -379,10 +925,22 @@ def render_data_import(cluster_manager):
         with col1:
             uploaded_file = st.file_uploader(
                 "Upload JSON file with cluster data",
-                type=["json"],
-                help="Upload a JSON file containing cluster data with the required structure",
+                type=["json", "zip", "cwb"],
+                help=INFO_MESSAGES["upload_file_help"],
                 accept_multiple_files=False,
             )
+            report_all_errors = st.checkbox(
+                "Report all validation errors",
+                help=INFO_MESSAGES["report_all_errors_help"],
+            )
+            resolve_duplicates = st.checkbox(
+                "Drop duplicate member IDs",
+                help=INFO_MESSAGES["resolve_duplicates_help"],
+            )
+            cluster_manager.compact = st.checkbox(
+                "Compact storage",
+                help=INFO_MESSAGES["compact_storage_help"],
+            )
 
         with col2:
             st.write("**Quick Test:**")
@@ -391,51 +949,73 @@ def render_data_import(cluster_manager):
                     with open("./data/sample_data.json", "r") as f:
                         sample_data = json.load(f)
 
-                    success, message = cluster_manager.load_data(sample_data)
+                    success, message, *details = cluster_manager.load_data(sample_data)
                     if success:
                         st.success(SUCCESS_MESSAGES["sample_loaded"])
                         st.rerun()
                     else:
-                        st.error(ERROR_MESSAGES.get(message, f"Error: {message}"))
+                        st.error(format_error(message, *details))
                 except Exception as e:
                     st.error(f"Error loading sample data: {str(e)}")
 
         if uploaded_file is not None:
             try:
-                # Check file size (limit to 10MB)
-                if uploaded_file.size > 10 * 1024 * 1024:  # 10MB limit
-                    st.error(ERROR_MESSAGES["file_too_large"])
+                # Check file size
+                if uploaded_file.size > MAX_UPLOAD_BYTES:
+                    st.error(
+                        format_error(
+                            "file_too_large",
+                            {"limit": f"{MAX_UPLOAD_BYTES // 1024**3}GB"},
+                        )
+                    )
                     return
 
                 # Add progress indicator
                 with st.spinner("Processing JSON file..."):
-                    # Read file content
-                    file_content = uploaded_file.read()
-                    # Parse JSON
-                    json_data = json.loads(file_content.decode("utf-8"))
-                    # Validate and load data
-                    success, message = cluster_manager.load_data(json_data)
+                    if uploaded_file.name.lower().endswith(".cwb"):
+                        # Read in place from the uploaded bytes, not parsed
+                        success, message, *details = cluster_manager.load_binary(
+                            uploaded_file.getbuffer()
+                        )
+                    else:
+                        # Clusters are parsed and validated as they are read,
+                        # once per distinct file across all sessions
+                        success, message, *details = cluster_manager.load_shared(
+                            uploaded_file,
+                            dataset_cache(),
+                            columnar=uploaded_file.name.lower().endswith(".zip"),
+                            collect_all=report_all_errors,
+                            resolve_duplicates=resolve_duplicates,
+                        )
 
                     if success:
                         st.success(SUCCESS_MESSAGES["data_loaded"])
+                        if cluster_manager.resolved_duplicates:
+                            st.toast(
+                                INFO_MESSAGES["duplicates_resolved"].format(
+                                    count=len(cluster_manager.resolved_duplicates)
+                                )
+                            )
 
                         # Show summary of loaded data
                         metrics = cluster_manager.get_metrics()
                         st.info(
-                            f"Loaded {metrics['total_clusters']} clusters with {metrics['total_members']} total members"
+                            INFO_MESSAGES["loaded_summary"].format(
+                                clusters=metrics["total_clusters"],
+                                members=metrics["total_members"],
+                            )
                         )
 
                         # Force rerun to update the UI
                         st.rerun()
                     else:
                         # Handle error messages with parameters
-                        if isinstance(message, tuple) and len(message) > 1:
-                            error_msg = ERROR_MESSAGES.get(message[0], message[0])
-                            if len(message) > 2:
-                                error_msg = error_msg.format(**message[2])
-                            st.error(error_msg)
-                        else:
-                            st.error(ERROR_MESSAGES.get(message, message))
+                        st.error(format_error(message, *details))
+                        render_validation_errors(cluster_manager.validation_errors)
+                        if message == "invalid_json_file":
+                            st.info(
+                                "Please ensure your file contains valid JSON syntax"
+                            )
 
                         # Show expected structure
                         with st.expander("📋 Expected JSON Structure"):
@@ -460,61 +1040,167 @@ def render_data_import(cluster_manager):
                                 language="json",
                             )
 
-            except json.JSONDecodeError as e:
-                st.error(ERROR_MESSAGES["invalid_json_file"].format(e=str(e)))
-                st.info("Please ensure your file contains valid JSON syntax")
-            except UnicodeDecodeError:
-                st.error(ERROR_MESSAGES["encoding_error"])
             except Exception as e:
                 st.error(ERROR_MESSAGES["file_processing_error"].format(e=str(e)))
                 st.info("Please check your file format and try again")
 
 
+def render_validation_errors(errors, limit: int = 1000):
+    """Render a table of validation errors when there is more than one"""
+    if len(errors) <= 1:
+        return
+    with st.expander(
+        INFO_MESSAGES["validation_errors"].format(count=len(errors)), expanded=True
+    ):
+        st.dataframe(
+            [
+                {
+                    "code": error.code,
+                    "cluster": (
+                        error.cluster_index + 1
+                        if error.cluster_index is not None
+                        else None
+                    ),
+                    "member": (
+                        error.member_index + 1
+                        if error.member_index is not None
+                        else None
+                    ),
+                    "message": format_error(error.code, error.params),
+                }
+                for error in errors[:limit]
+            ],
+            width="stretch",
+        )
+
+
 def render_cluster_details(cluster_manager, search_query):
-    """Render the cluster details section"""
-    if cluster_manager.data["clusters"]:
-        with st.expander("📋 Cluster wise details", expanded=False):
-            # Use filtered clusters if searching
-            display_clusters = (
-                cluster_manager.search_clusters(search_query)
-                if search_query
-                else cluster_manager.data["clusters"]
-            )
+    """Render the cluster details section one page at a time.
 
-            for i, cluster in enumerate(display_clusters):
-                with st.expander(
-                    f"🗃️ {cluster['name']} (ID: {cluster['id']}) - {len(cluster['members'])} members"
-                ):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        with st.expander("Members", expanded=True, icon="👨‍👩‍👧‍👦"):
-                            for member in cluster["members"]:
-                                member_info = (
-                                    f"• **{member['name']} (ID: {member['id']})**"
-                                )
-                                st.write(member_info)
-                                if "metadata" in member and member["metadata"]:
-                                    st.table(member["metadata"])
-
-                    with col2:
-                        with st.expander("Relationships", expanded=True, icon="🤝"):
-                            if cluster.get("relationships"):
-                                for rel_id in cluster["relationships"]:
-                                    related_cluster = cluster_manager.get_cluster_by_id(
-                                        rel_id
-                                    )
-                                    if related_cluster:
-                                        st.write(
-                                            f"• {related_cluster['name']} (ID: {rel_id})"
-                                        )
-                            else:
-                                st.write("No relationships")
+    The page is a single summary table, and only the cluster opened from it
+    gets its member table (one dataframe, cached until the data changes).
+    """
+    if not cluster_manager.data["clusters"]:
+        return
+    st.subheader("📋 Cluster wise details")
+    if not st.toggle("Show details", key="show_cluster_details"):
+        return
+
+    # Use filtered clusters if searching
+    display_clusters = (
+        cached(
+            cluster_manager,
+            ("search", search_query),
+            lambda: cluster_manager.search_clusters(search_query),
+        )
+        if search_query
+        else cluster_manager.data["clusters"]
+    )
+    if not display_clusters:
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        page_size = st.selectbox(
+            "Clusters per page", DETAILS_PAGE_SIZES, key="details_page_size"
+        )
+    pages = -(-len(display_clusters) // page_size)
+    # Keep the page in range when a search or an operation shrinks the list
+    if st.session_state.get("details_page", 1) > pages:
+        st.session_state.details_page = pages
+    with col2:
+        page = st.number_input(
+            "Page", min_value=1, max_value=pages, step=1, key="details_page"
+        )
+    start = (page - 1) * page_size
+    page_clusters = display_clusters[start : start + page_size]
+    st.caption(
+        INFO_MESSAGES["details_page"].format(
+            first=start + 1,
+            last=start + len(page_clusters),
+            total=len(display_clusters),
+        )
+    )
+    st.dataframe(
+        cached(
+            cluster_manager,
+            ("details_page", search_query, page, page_size),
+            lambda: pd.DataFrame(
+                {
+                    "id": [str(c["id"]) for c in page_clusters],
+                    "name": [c["name"] for c in page_clusters],
+                    "members": [len(c["members"]) for c in page_clusters],
+                    "relationships": [
+                        len(c.get("relationships", ())) for c in page_clusters
+                    ],
+                }
+            ),
+        ),
+        hide_index=True,
+        width="stretch",
+    )
+
+    page_options = {
+        f"🗃️ {c['name']} (ID: {c['id']}) - {len(c['members'])} members": str(c["id"])
+        for c in page_clusters
+    }
+    opened = st.selectbox(
+        "Open cluster",
+        list(page_options.keys()),
+        index=None,
+        placeholder=INFO_MESSAGES["open_cluster_placeholder"],
+        key="details_open",
+    )
+    if opened is None:
+        return
+    cluster_id = page_options[opened]
+    cluster = cluster_manager.get_cluster_by_id(cluster_id)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**👨‍👩‍👧‍👦 Members**")
+        st.dataframe(
+            cached(
+                cluster_manager,
+                ("member_frame", cluster_id),
+                lambda: member_frame(cluster),
+            ),
+            hide_index=True,
+            width="stretch",
+        )
+
+    with col2:
+        st.markdown("**🤝 Relationships**")
+        referrers = cluster_manager.get_referrers(cluster_id)
+        if cluster.get("relationships") or referrers:
+            for rel_id in cluster.get("relationships", []):
+                related_cluster = cluster_manager.get_cluster_by_id(rel_id)
+                if related_cluster:
+                    st.write(f"• {related_cluster['name']} (ID: {rel_id})")
+            for rel_id in sorted(referrers):
+                related_cluster = cluster_manager.get_cluster_by_id(rel_id)
+                st.write(
+                    INFO_MESSAGES["referenced_by"].format(
+                        name=related_cluster["name"], id=rel_id
+                    )
+                )
+        else:
+            st.write("No relationships")
 
 
 def main():
     # Initialize session state
     if "cluster_manager" not in st.session_state:
         st.session_state.cluster_manager = ClusterManager()
+        # Reopen the workbench file of the page, after a refresh or restart
+        if "workbench" in st.query_params:
+            path = workbench_file(st.query_params["workbench"])
+            if path is not None and os.path.exists(path):
+                success, message, *details = (
+                    st.session_state.cluster_manager.open_workbench(path)
+                )
+                if not success:
+                    st.error(format_error(message, *details))
 
     if "selected_clusters" not in st.session_state:
         st.session_state.selected_clusters = []
@@ -522,6 +1208,19 @@ def main():
     if "selected_members" not in st.session_state:
         st.session_state.selected_members = []
 
+    if "expanded_clusters" not in st.session_state:
+        st.session_state.expanded_clusters = set()
+
+    if "flow_viewport" not in st.session_state:
+        st.session_state.flow_viewport = DEFAULT_VIEWPORT
+
+    if "graph_layout" not in st.session_state:
+        st.session_state.graph_layout = GraphLayout()
+        st.session_state.layout_generation = 0
+
+    if "view_cache" not in st.session_state:
+        st.session_state.view_cache = ViewCache()
+
     # Header
     st.markdown(
         '<div class="main-header">Clusters Manipulation Tool</div>',
@@ -551,12 +1250,19 @@ def main():
             with col2:
                 search_query = st.text_input(
                     "Search clusters or members",
-                    placeholder="Enter search term...",
+                    placeholder="Enter search term or field:value...",
                     icon="🔍",
                 )
 
             # Filter clusters based on search
-            filtered_clusters = cluster_manager.search_clusters(search_query)
+            filtered_clusters = cached(
+                cluster_manager,
+                ("search", search_query),
+                lambda: cluster_manager.search_clusters(search_query),
+            )
+            matched_ids = (
+                {str(c["id"]) for c in filtered_clusters} if search_query else set()
+            )
 
             if search_query and not filtered_clusters:
                 st.warning(
@@ -566,7 +1272,37 @@ def main():
                 )
                 filtered_clusters = cluster_manager.data["clusters"]
 
-            flow_state = create_flow_visualization(filtered_clusters, search_query)
+            # Lay out every cluster so positions do not change while searching
+            generation = st.session_state.layout_generation
+            layout = cached(
+                cluster_manager,
+                ("layout", generation),
+                lambda: st.session_state.graph_layout.positions(
+                    cluster_manager.data["clusters"]
+                ),
+            )
+            if st.session_state.get("virtualized_view", True):
+                view = (
+                    frozenset(st.session_state.expanded_clusters),
+                    st.session_state.flow_viewport,
+                    st.session_state.get("node_budget", DEFAULT_NODE_BUDGET),
+                )
+            else:
+                view = (None, None, None)
+            expanded, viewport, node_budget = view
+            elements = cached(
+                cluster_manager,
+                ("flow", search_query, generation, view),
+                lambda: build_flow_elements(
+                    filtered_clusters,
+                    matched_ids,
+                    expanded=expanded,
+                    viewport=viewport,
+                    node_budget=node_budget,
+                    layout=layout,
+                ),
+            )
+            flow_state = create_flow_visualization(*elements)
             handle_flow_events(flow_state, cluster_manager)
 
             # Display search results info
@@ -1,12 +1,21 @@
 # Success and error messages for the application
 
+from typing import Any, Dict, Optional
+
 SUCCESS_MESSAGES = {
     "data_loaded": "✅ Data loaded successfully!",
     "operation_undone": "Operation undone!",
+    "operation_redone": "Operation redone!",
     "clusters_merged": "✅ Clusters merged successfully!",
     "members_moved": "✅ Members moved successfully!",
     "cluster_split": "✅ Cluster split successfully!",
     "sample_loaded": "✅ Sample data loaded!",
+    "batch_applied": "✅ Applied {count} operations as one undoable step!",
+    "workbench_created": "✅ Workbench saved! Changes are now saved as you make them",
+    "workbench_opened": "✅ Workbench reopened!",
+    "snapshot_saved": "✅ Snapshot '{name}' saved!",
+    "snapshot_restored": "✅ Snapshot '{name}' restored! Undo to go back",
+    "binary_saved": "✅ Binary workbench saved to {path}",
 }
 
 ERROR_MESSAGES = {
@@ -14,25 +23,58 @@ ERROR_MESSAGES = {
     "missing_clusters": "❌ Missing required 'clusters' key in JSON",
     "clusters_not_array": "❌ 'clusters' must be an array",
     "no_clusters": "❌ No clusters found in the data",
-    "cluster_not_object": "❌ Cluster {i+1} is not a valid object",
-    "missing_keys": "❌ Cluster {i+1} missing required keys: {', '.join(missing_keys)}",
-    "members_not_array": "❌ Cluster {i+1}: 'members' must be an array",
-    "member_not_object": "❌ Cluster {i+1}, Member {j+1} is not a valid object",
-    "member_missing_keys": "❌ Cluster {i+1}, Member {j+1} missing: {', '.join(member_missing)}",
+    "cluster_not_object": "❌ Cluster {cluster} is not a valid object",
+    "missing_keys": "❌ Cluster {cluster} missing required keys: {missing_keys}",
+    "members_not_array": "❌ Cluster {cluster}: 'members' must be an array",
+    "member_not_object": "❌ Cluster {cluster}, Member {member} is not a valid object",
+    "member_missing_keys": "❌ Cluster {cluster}, Member {member} missing: {member_missing}",
     "duplicate_ids": "❌ Duplicate cluster IDs found",
-    "unexpected_error": "❌ Unexpected error: {str(e)}",
-    "file_too_large": "❌ File too large. Please upload files smaller than 10MB",
-    "invalid_json_file": "❌ Invalid JSON file: {str(e)}",
+    "duplicate_member_ids": "❌ Cluster {cluster}, Member {member}: member ID '{id}' is already used in cluster '{owner}'",
+    "error_offset": " (at character {offset})",
+    "unexpected_error": "❌ Unexpected error: {e}",
+    "file_too_large": "❌ File too large. Please upload files smaller than {limit}",
+    "invalid_json_file": "❌ Invalid JSON file: {e}",
+    "invalid_archive": "❌ Not a cluster table archive (expected a zip written by the table export)",
+    "missing_archive_table": "❌ The archive has no {table}",
+    "missing_archive_columns": "❌ The {table} table is missing columns: {missing_keys}",
+    "unknown_archive_cluster": "❌ The archive refers to unknown cluster '{id}'",
     "encoding_error": "❌ File encoding error. Please ensure your file is UTF-8 encoded",
-    "file_processing_error": "❌ Error processing file: {str(e)}",
+    "file_processing_error": "❌ Error processing file: {e}",
+    "operations_not_array": "❌ An operations file must be an array of operations or an object with an 'operations' array",
+    "no_operations": "❌ The operations file has no operations",
+    "operation_not_object": "❌ Operation {number} is not a valid object",
+    "unknown_operation": "❌ Operation {number}: unknown operation '{op}' (expected move, merge, split or reassign)",
+    "operation_missing_keys": "❌ Operation {number} ({op}) missing required keys: {missing_keys}",
+    "operation_members_not_array": "❌ Operation {number} ({op}): 'members' must be a non-empty array",
+    "operation_assignments_not_object": "❌ Operation {number} ({op}): 'assignments' must be a non-empty object mapping member IDs to cluster IDs",
+    "operation_unknown_cluster": "❌ Operation {number} ({op}): cluster '{id}' does not exist at that point of the batch",
+    "operation_same_cluster": "❌ Operation {number} ({op}): cluster '{id}' is named twice",
+    "operation_cluster_exists": "❌ Operation {number} ({op}): cluster '{id}' already exists",
+    "operation_failed": "❌ Operation {number} ({op}) could not be applied; no changes were made",
+    "invalid_member_rule": "❌ A rule is made of field:value terms on metadata fields only. Fields: {fields}",
+    "workbench_error": "❌ Could not open the workbench file: {e}",
+    "workbench_locked": "❌ {path} is open in another session, which saves its own changes to it. Open the workbench under another name, or close the other session first",
+    "invalid_workbench_name": "❌ Workbench names may only use letters, digits, spaces, dots, dashes and underscores",
+    "no_workbench_file": "❌ Open a workbench file first",
+    "unknown_snapshot": "❌ There is no snapshot named '{name}'",
+    "invalid_binary_workbench": "❌ Not a binary workbench file",
+    "binary_workbench_version": "❌ Binary workbench format version {version} is not supported",
+    "truncated_binary_workbench": "❌ The binary workbench file is truncated",
+    "binary_save_error": "❌ Could not save the binary workbench: {e}",
+    "no_binary_file": "❌ There is no binary workbench file named '{name}'",
     "merge_failed": "❌ Failed to merge clusters",
     "move_failed": "❌ Failed to move members",
     "split_failed": "❌ Failed to split cluster",
     "nothing_to_undo": "❌ Nothing to undo",
+    "nothing_to_redo": "❌ Nothing to redo",
 }
 
 INFO_MESSAGES = {
     "upload_data": "Upload data to see metrics",
+    "upload_file_help": "Upload a JSON file containing cluster data with the required structure, a zip of tables from the table export, or a binary workbench file",
+    "report_all_errors_help": "Validate the whole file instead of stopping at the first problem",
+    "resolve_duplicates_help": "Keep only the first member with each ID instead of rejecting the file",
+    "loaded_summary": "Loaded {clusters} clusters with {members} total members",
     "no_matching_clusters": "No clusters found matching '{search_query}'",
     "need_two_clusters": "Need at least 2 clusters to {operation}",
     "select_different_clusters": "Please select different clusters",
@@ -41,4 +83,59 @@ INFO_MESSAGES = {
     "min_members_to_split": "Cluster needs at least 2 members to split",
     "upload_data_for_ops": "Upload data to access cluster operations",
     "showing_results": "Showing {count} clusters matching '{query}'",
+    "duplicates_resolved": "Dropped {count} duplicate members (kept the first occurrence of each ID)",
+    "validation_errors": "{count} validation errors found",
+    "cluster_size_stats": "Cluster size: min {min} · median {median} · max {max}",
+    "largest_clusters": "Largest: {clusters}",
+    "relationship_graph_stats": "Relationships per cluster: min {min} · avg {avg} · max {max} · {isolated} unconnected",
+    "referenced_by": "• ← {name} (ID: {id}) links here",
+    "find_cluster_placeholder": "Type a cluster name or ID...",
+    "find_member_placeholder": "Type a member name, ID or field:value...",
+    "no_cluster_matches": "No clusters match",
+    "more_matches": "Showing the first {limit} matches, type more to narrow them down",
+    "member_rule_help": "Selects every member of the cluster with all of the given metadata values, e.g. department:Engineering level:3",
+    "rule_matches": "The rule selects {count} members",
+    "workbench_file_help": "Save the workbench to a file on the server, or reopen a saved one. Every change is then written as it is made, and the workbench is reopened after a browser refresh",
+    "workbench_saving": "Saving changes to {path}",
+    "snapshot_option": "{name} ({created}, {count} clusters)",
+    "restore_snapshot_help": "Replace the clusters with those of the snapshot. This can be undone",
+    "binary_file_help": "A binary workbench file opens in a moment however large it is, as it is read as it is used instead of parsed. Members are indexed on the first search, member lookup or change",
+    "details_page": "Clusters {first}–{last} of {total}",
+    "open_cluster_placeholder": "Choose a cluster on this page to see its members",
+    "graph_analytics_help": "Find connected groups, the most connected clusters and the clusters that bridge groups, treating relationships as undirected. Results are kept until the data changes",
+    "graph_components": "{count} connected groups over {edges} links, the largest with {largest} clusters",
+    "most_connected": "Most connected: {clusters}",
+    "bridge_clusters": "Bridge clusters (betweenness): {clusters}",
+    "sampled_betweenness": "Betweenness estimated from shortest paths of {samples} sampled clusters",
+    "shortest_path": "{hops} hops: {path}",
+    "no_path": "These clusters are not connected by relationships",
+    "facet_search_hint": 'Search with field:value, e.g. department:Engineering or location:"Austin, TX"',
+    "history_usage": "History: {depth} undo / {redo} redo steps, ~{size:.1f} KB",
+    "rerun_layout_help": "Lay out all clusters again from their current relationships. Otherwise clusters keep their position and only new ones are placed",
+    "table_export_help": "Parquet, Feather and CSV export a zip of clusters, members (one column per metadata field) and relationships tables, which can be loaded back here or with pandas",
+    "compact_export_help": "Leave out indentation and line breaks for a smaller file",
+    "gzip_export_help": "Compress the export with gzip, recommended for large workbenches",
+    "view_cache_stats": "View cache: {hits} hits / {misses} misses ({rate:.0f}% hit rate), {entries} entries at data version {version}",
+    "dataset_cache_stats": "Shared datasets: {entries} loaded from {size:.1f} MB of files, reused {hits} times",
+    "more_members": "… {count} more members",
+    "operations_file_help": 'A JSON array of move, merge, split and reassign operations, e.g. {"op": "move", "source": "c1", "target": "c2", "members": ["m1"]} or {"op": "reassign", "assignments": {"m1": "c2", "m2": "c3"}}. The batch is checked first and applied all or nothing as one undoable step',
+    "compact_storage_help": "Keep members in packed tables instead of one object each, using several times less memory for large files at the cost of slower loading",
+    "virtualized_view_help": "Draw clusters collapsed and only show members of clicked clusters and of clusters around the last clicked one, up to the node budget",
 }
+
+
+def format_error(code: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Render an error code and the parameters returned with it as a message"""
+    params = dict(params or {})
+    if "i" in params:
+        params["cluster"] = params["i"] + 1
+    if "j" in params:
+        params["member"] = params["j"] + 1
+    for key in ("missing_keys", "member_missing"):
+        if key in params:
+            params[key] = ", ".join(params[key])
+
+    message = ERROR_MESSAGES.get(code, code).format(**params)
+    if "offset" in params:
+        message += ERROR_MESSAGES["error_offset"].format(offset=params["offset"])
+    return message
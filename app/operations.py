@@ -0,0 +1,124 @@
+"""
+Batches of cluster operations, as applied by ClusterManager.apply_batch.
+
+An operations file is a JSON array of operations, or an object with an
+"operations" array. Each operation is an object naming the operation and its
+arguments:
+
+    {"op": "move", "source": "c1", "target": "c2", "members": ["m1", "m2"]}
+    {"op": "merge", "cluster1": "c1", "cluster2": "c2", "name": "Merged"}
+    {"op": "split", "cluster": "c1", "members": ["m3"], "name": "New", "id": "c9"}
+    {"op": "reassign", "assignments": {"m4": "c2", "m5": "c9"}}
+
+The "id" of a split is optional; without it the new cluster gets a random
+id. A reassign moves each member, from whichever cluster holds it, to the
+cluster it is mapped to. Errors are reported with the error codes used in
+messages.py, with the one-based position of the operation as the number
+parameter.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from .validation import ValidationError
+except ImportError:  # loaded as a top-level module by `streamlit run app/main.py`
+    from validation import ValidationError
+
+OPERATION_KEYS = {
+    "move": ("source", "target", "members"),
+    "merge": ("cluster1", "cluster2", "name"),
+    "split": ("cluster", "members", "name"),
+    "reassign": ("assignments",),
+}
+# Keys holding the ids of clusters that must exist when the operation runs
+_CLUSTER_KEYS = {
+    "move": ("source", "target"),
+    "merge": ("cluster1", "cluster2"),
+    "split": ("cluster",),
+}
+
+
+def operations_from_document(
+    document: Any,
+) -> Tuple[Optional[List], List[ValidationError]]:
+    """Return the list of operations in a parsed operations file"""
+    if isinstance(document, dict):
+        document = document.get("operations")
+    if not isinstance(document, list):
+        return None, [ValidationError("operations_not_array")]
+    if not document:
+        return None, [ValidationError("no_operations")]
+    return document, []
+
+
+def validate_operation(operation: Any, number: int) -> List[ValidationError]:
+    """Return the problems with the form of one operation"""
+    if not isinstance(operation, dict):
+        return [ValidationError("operation_not_object", params={"number": number})]
+    op = operation.get("op")
+    params = {"number": number, "op": op}
+    if op not in OPERATION_KEYS:
+        return [ValidationError("unknown_operation", params=params)]
+    missing_keys = [key for key in OPERATION_KEYS[op] if key not in operation]
+    if missing_keys:
+        params["missing_keys"] = missing_keys
+        return [ValidationError("operation_missing_keys", params=params)]
+    if "members" in operation and not (
+        isinstance(operation["members"], list) and operation["members"]
+    ):
+        return [ValidationError("operation_members_not_array", params=params)]
+    if "assignments" in operation and not (
+        isinstance(operation["assignments"], dict) and operation["assignments"]
+    ):
+        return [ValidationError("operation_assignments_not_object", params=params)]
+    return []
+
+
+def _named_clusters(operation: Dict) -> List[str]:
+    """Ids of the clusters that must exist for an operation to run"""
+    if operation["op"] == "reassign":
+        return list(dict.fromkeys(map(str, operation["assignments"].values())))
+    return [str(operation[key]) for key in _CLUSTER_KEYS[operation["op"]]]
+
+
+def validate_operations(
+    operations: List, cluster_ids: Iterable[str]
+) -> List[ValidationError]:
+    """Check a batch before any of it is applied.
+
+    Besides the form of each operation, the clusters it names are checked
+    against cluster_ids as the batch goes along: a merge removes its second
+    cluster and a split with an id adds one. Whether members are where an
+    operation expects them is only known once the earlier ones have run.
+    """
+    errors = []
+    existing = set(map(str, cluster_ids))
+    for number, operation in enumerate(operations, 1):
+        operation_errors = validate_operation(operation, number)
+        if not operation_errors:
+            op = operation["op"]
+            params = {"number": number, "op": op}
+            ids = _named_clusters(operation)
+            unknown = [cluster_id for cluster_id in ids if cluster_id not in existing]
+            if unknown:
+                params["id"] = unknown[0]
+                operation_errors.append(
+                    ValidationError("operation_unknown_cluster", params=params)
+                )
+            elif len(set(ids)) < len(ids):
+                params["id"] = ids[0]
+                operation_errors.append(
+                    ValidationError("operation_same_cluster", params=params)
+                )
+            elif op == "merge":
+                existing.discard(ids[1])
+            elif op == "split" and operation.get("id") is not None:
+                new_id = str(operation["id"])
+                if new_id in existing:
+                    params["id"] = new_id
+                    operation_errors.append(
+                        ValidationError("operation_cluster_exists", params=params)
+                    )
+                existing.add(new_id)
+        errors.extend(operation_errors)
+    return errors
@@ -0,0 +1,358 @@
+"""
+Inverted indexes used to answer cluster searches without rescanning the data.
+"""
+
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+class SearchIndex:
+    """Map lowercased name n-grams to the ids of the clusters containing them"""
+
+    def __init__(self, n: int = 3):
+        self.n = n
+        # cluster_id -> lowercased cluster and member names, one per line
+        self._text: Dict[str, str] = {}
+        # n-gram -> ids of clusters with a name token containing it
+        self._postings: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._text)
+
+    def layer(self) -> "LayeredSearchIndex":
+        """Return an index that starts out like this one and leaves it
+        unchanged when changed itself"""
+        return LayeredSearchIndex(self)
+
+    def _grams(self, text: str) -> Set[str]:
+        """Return the n-grams of every whitespace separated token in text"""
+        n = self.n
+        return {
+            token[i : i + n]
+            for token in text.split()
+            for i in range(len(token) - n + 1)
+        }
+
+    def add(self, cluster_id: str, names: Iterable[str]):
+        """Index the names belonging to a cluster"""
+        if cluster_id in self._text:
+            self.remove(cluster_id)
+        text = "\n".join(str(name).lower() for name in names)
+        self._text[cluster_id] = text
+        for gram in self._grams(text):
+            self._postings.setdefault(gram, set()).add(cluster_id)
+
+    def remove(self, cluster_id: str):
+        """Drop a cluster from the index"""
+        text = self._text.pop(cluster_id, None)
+        if text is None:
+            return
+        for gram in self._grams(text):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(cluster_id)
+                if not postings:
+                    del self._postings[gram]
+
+    def rename(self, cluster_id: str, before: str, after: str):
+        """Replace the name of an indexed cluster, leaving its member names"""
+        text = self._text.get(cluster_id)
+        if text is None:
+            return
+        old, new = str(before).lower(), str(after).lower()
+        rest = text[len(old) :]
+        self._text[cluster_id] = new + rest
+        new_grams = self._grams(new)
+        # n-grams hold no whitespace, so one still in use occurs in rest
+        for gram in self._grams(old) - new_grams:
+            if gram not in rest:
+                postings = self._postings[gram]
+                postings.discard(cluster_id)
+                if not postings:
+                    del self._postings[gram]
+        for gram in new_grams:
+            self._postings.setdefault(gram, set()).add(cluster_id)
+
+    def clear(self):
+        """Drop every cluster from the index"""
+        self._text = {}
+        self._postings = {}
+
+    def search(self, query: str) -> Set[str]:
+        """Return ids of clusters with a name containing query (case-insensitive)"""
+        query = query.lower()
+        if not query:
+            return set(self._text)
+
+        # Any name containing the query contains every n-gram of its
+        # whitespace separated pieces, so intersecting postings yields a
+        # candidate superset that only needs a final substring check.
+        grams = self._grams(query)
+        if grams:
+            postings = sorted(
+                (self._postings.get(gram, set()) for gram in grams), key=len
+            )
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                candidates &= posting
+        else:
+            candidates = self._text.keys()
+
+        text = self._text
+        return {cluster_id for cluster_id in candidates if query in text[cluster_id]}
+
+
+class LayeredSearchIndex(SearchIndex):
+    """A SearchIndex over a base index shared with other owners.
+
+    A cluster added, removed or renamed through the layer is hidden from
+    the base, which is never changed, and indexed in the layer's own tables,
+    so the layer only holds the clusters changed through it.
+    """
+
+    def __init__(self, base: SearchIndex):
+        super().__init__(base.n)
+        self._base = base
+        # ids of the clusters whose base entries no longer apply
+        self._hidden: Set[str] = set()
+
+    def __len__(self) -> int:
+        base = self._base._text
+        hidden = sum(cluster_id in base for cluster_id in self._hidden)
+        return len(base) - hidden + len(self._text)
+
+    def add(self, cluster_id: str, names: Iterable[str]):
+        self._hidden.add(cluster_id)
+        super().add(cluster_id, names)
+
+    def remove(self, cluster_id: str):
+        self._hidden.add(cluster_id)
+        super().remove(cluster_id)
+
+    def rename(self, cluster_id: str, before: str, after: str):
+        if cluster_id not in self._hidden and cluster_id in self._base._text:
+            self.add(cluster_id, self._base._text[cluster_id].split("\n"))
+        super().rename(cluster_id, before, after)
+
+    def clear(self):
+        super().clear()
+        self._base = SearchIndex(self.n)
+        self._hidden = set()
+
+    def search(self, query: str) -> Set[str]:
+        hidden = self._hidden
+        found = super().search(query)
+        found.update(
+            cluster_id
+            for cluster_id in self._base.search(query)
+            if cluster_id not in hidden
+        )
+        return found
+
+
+class FieldIndex:
+    """Map member metadata field values to the members carrying them"""
+
+    def __init__(self):
+        # field -> lowercased value -> {(cluster_id, member_id)}
+        self._postings: Dict[str, Dict[str, Set[Tuple[str, str]]]] = {}
+        # field -> lowercased value -> value as first seen, for display
+        self._labels: Dict[str, Dict[str, str]] = {}
+
+    @property
+    def fields(self) -> List[str]:
+        return sorted(filter(self._has_field, self._postings))
+
+    def _has_field(self, field: str) -> bool:
+        """Whether any indexed member has a value for field"""
+        return field in self._postings
+
+    def layer(self) -> "LayeredFieldIndex":
+        """Return an index that starts out like this one and leaves it
+        unchanged when changed itself"""
+        return LayeredFieldIndex(self)
+
+    @staticmethod
+    def _flatten(metadata: Dict, prefix: str = "") -> Iterator[Tuple[str, str]]:
+        """Yield (field, value) pairs, using dotted names for nested dicts"""
+        for key, value in metadata.items():
+            field = f"{prefix}{key}"
+            if isinstance(value, dict):
+                yield from FieldIndex._flatten(value, f"{field}.")
+            elif isinstance(value, (list, tuple, set)):
+                for item in value:
+                    if item is not None and not isinstance(item, (dict, list)):
+                        yield field, str(item)
+            elif value is not None:
+                yield field, str(value)
+
+    def _entries(self, members: Iterable[Dict]):
+        for member in members:
+            metadata = member.get("metadata")
+            if isinstance(metadata, dict) and metadata:
+                yield str(member["id"]), self._flatten(metadata)
+
+    def add(self, cluster_id: str, members: Iterable[Dict]):
+        """Index the metadata of a cluster's members"""
+        for member_id, pairs in self._entries(members):
+            key = (cluster_id, member_id)
+            for field, value in pairs:
+                lowered = value.lower()
+                values = self._postings.setdefault(field, {})
+                values.setdefault(lowered, set()).add(key)
+                self._labels.setdefault(field, {}).setdefault(lowered, value)
+
+    def remove(self, cluster_id: str, members: Iterable[Dict]):
+        """Drop the metadata of a cluster's members from the index"""
+        for member_id, pairs in self._entries(members):
+            key = (cluster_id, member_id)
+            for field, value in pairs:
+                lowered = value.lower()
+                values = self._postings.get(field)
+                if values is None or lowered not in values:
+                    continue
+                values[lowered].discard(key)
+                if not values[lowered]:
+                    del values[lowered]
+                    del self._labels[field][lowered]
+                    if not values:
+                        del self._postings[field]
+                        del self._labels[field]
+
+    def clear(self):
+        """Drop every member from the index"""
+        self._postings = {}
+        self._labels = {}
+
+    def parse_query(self, query: str) -> Tuple[List[Tuple[str, str]], str]:
+        """Split query into indexed field:value filters and remaining free text"""
+        filters = []
+
+        def take(match: "re.Match") -> str:
+            field = match.group(1)
+            if not self._has_field(field):
+                return match.group(0)
+            value = match.group(2) if match.group(2) is not None else match.group(3)
+            filters.append((field, value))
+            return " "
+
+        text = _FIELD_TERM.sub(take, query)
+        return filters, text.strip() if filters else query
+
+    def match(self, filters: List[Tuple[str, str]]) -> Set[Tuple[str, str]]:
+        """Return (cluster_id, member_id) keys of members matching every filter"""
+        postings = sorted(
+            (
+                self._postings.get(field, {}).get(value.lower(), set())
+                for field, value in filters
+            ),
+            key=len,
+        )
+        if not postings:
+            return set()
+        matches = set(postings[0])
+        for posting in postings[1:]:
+            matches &= posting
+        return matches
+
+    def facet_counts(
+        self, field: str, limit: Optional[int] = None
+    ) -> List[Tuple[str, int]]:
+        """Return (value, member count) pairs for a field, most common first"""
+        labels = self._labels.get(field, {})
+        counts = sorted(
+            (
+                (labels[value], len(keys))
+                for value, keys in self._postings.get(field, {}).items()
+            ),
+            key=lambda item: (-item[1], item[0]),
+        )
+        return counts[:limit] if limit is not None else counts
+
+
+class LayeredFieldIndex(FieldIndex):
+    """A FieldIndex over a base index shared with other owners.
+
+    Like LayeredSearchIndex, it hides the clusters changed through it from
+    the base and indexes their members itself. Clusters are removed before
+    they are indexed again, as ClusterManager does, so that the base members
+    hidden from each (field, value) can be counted when a cluster is removed.
+    """
+
+    def __init__(self, base: FieldIndex):
+        super().__init__()
+        self._base = base
+        # ids of the clusters whose base entries no longer apply
+        self._hidden: Set[str] = set()
+        # field -> lowercased value -> number of base members hidden
+        self._hidden_counts: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def fields(self) -> List[str]:
+        return sorted(
+            filter(self._has_field, self._base._postings.keys() | self._postings)
+        )
+
+    def _has_field(self, field: str) -> bool:
+        if field in self._postings:
+            return True
+        hidden = self._hidden_counts.get(field, {})
+        return any(
+            len(keys) > hidden.get(value, 0)
+            for value, keys in self._base._postings.get(field, {}).items()
+        )
+
+    def add(self, cluster_id: str, members: Iterable[Dict]):
+        self._hidden.add(cluster_id)
+        super().add(cluster_id, members)
+
+    def remove(self, cluster_id: str, members: Iterable[Dict]):
+        if cluster_id not in self._hidden:
+            self._hidden.add(cluster_id)
+            base = self._base._postings
+            for member_id, pairs in self._entries(members):
+                key = (cluster_id, member_id)
+                for field, lowered in {(f, v.lower()) for f, v in pairs}:
+                    if key in base.get(field, {}).get(lowered, ()):
+                        counts = self._hidden_counts.setdefault(field, {})
+                        counts[lowered] = counts.get(lowered, 0) + 1
+        super().remove(cluster_id, members)
+
+    def clear(self):
+        super().clear()
+        self._base = FieldIndex()
+        self._hidden = set()
+        self._hidden_counts = {}
+
+    def match(self, filters: List[Tuple[str, str]]) -> Set[Tuple[str, str]]:
+        # A member's postings are all in the base or all in the layer
+        hidden = self._hidden
+        matches = super().match(filters)
+        matches.update(key for key in self._base.match(filters) if key[0] not in hidden)
+        return matches
+
+    def facet_counts(
+        self, field: str, limit: Optional[int] = None
+    ) -> List[Tuple[str, int]]:
+        labels = {
+            **self._labels.get(field, {}),
+            **self._base._labels.get(field, {}),
+        }
+        hidden = self._hidden_counts.get(field, {})
+        totals = {
+            value: len(keys) - hidden.get(value, 0)
+            for value, keys in self._base._postings.get(field, {}).items()
+        }
+        for value, keys in self._postings.get(field, {}).items():
+            totals[value] = totals.get(value, 0) + len(keys)
+        counts = sorted(
+            ((labels[value], count) for value, count in totals.items() if count),
+            key=lambda item: (-item[1], item[0]),
+        )
+        return counts[:limit] if limit is not None else counts
+
+
+# field:value or field:"quoted value"
+_FIELD_TERM = re.compile(r'(?<!\S)([^\s:"]+):(?:"([^"]*)"|(\S+))')
@@ -0,0 +1,205 @@
+"""
+Schema validation for cluster documents.
+
+Well-formed clusters are accepted by a fast path made of C-level builtins
+(type checks, dict key views and itemgetter mapped over the member list); only
+clusters that fail it are walked member by member to work out what exactly is
+wrong. Errors are reported with the error codes used in messages.py.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from operator import itemgetter
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+CLUSTER_KEYS = ("id", "name", "members")
+MEMBER_KEYS = ("id", "name")
+
+_CLUSTER_KEY_SET = frozenset(CLUSTER_KEYS)
+_member_keys = itemgetter(*MEMBER_KEYS)
+
+
+class ValidationError(NamedTuple):
+    """A single validation problem.
+
+    code is an ERROR_MESSAGES key and params the values its message is
+    formatted with; cluster_index and member_index locate the problem and are
+    None when it does not belong to a cluster or member.
+    """
+
+    code: str
+    cluster_index: Optional[int] = None
+    member_index: Optional[int] = None
+    params: Dict[str, Any] = {}
+
+    def as_result(self) -> tuple:
+        """Return the (False, code[, params]) tuple returned by load_data"""
+        return (False, self.code, self.params) if self.params else (False, self.code)
+
+
+def _members_are_valid(members: List) -> bool:
+    """Fast check that every member is a dict with the required keys"""
+    if not all(map(isinstance, members, repeat(dict))):
+        return False
+    try:
+        # Look up the required keys of every member without building a result
+        deque(map(_member_keys, members), maxlen=0)
+    except KeyError:
+        return False
+    return True
+
+
+def validate_cluster(
+    cluster: Any, i: int, collect_all: bool = True
+) -> List[ValidationError]:
+    """Return the problems with one cluster (at most one unless collect_all)"""
+    if not isinstance(cluster, dict):
+        return [ValidationError("cluster_not_object", i, None, {"i": i})]
+
+    missing_keys = [key for key in CLUSTER_KEYS if key not in cluster]
+    if missing_keys:
+        params = {"i": i, "missing_keys": missing_keys}
+        return [ValidationError("missing_keys", i, None, params)]
+
+    members = cluster["members"]
+    if not isinstance(members, list):
+        return [ValidationError("members_not_array", i, None, {"i": i})]
+
+    errors = []
+    for j, member in enumerate(members):
+        if not isinstance(member, dict):
+            errors.append(ValidationError("member_not_object", i, j, {"i": i, "j": j}))
+        else:
+            member_missing = [key for key in MEMBER_KEYS if key not in member]
+            if not member_missing:
+                continue
+            params = {"i": i, "j": j, "member_missing": member_missing}
+            errors.append(ValidationError("member_missing_keys", i, j, params))
+        if not collect_all:
+            break
+    return errors
+
+
+def validate_clusters(
+    clusters: List, start: int = 0, collect_all: bool = True
+) -> List[ValidationError]:
+    """Validate a list (or chunk) of clusters; start is the index of the first"""
+    errors = []
+    for i, cluster in enumerate(clusters, start):
+        if (
+            type(cluster) is dict
+            and _CLUSTER_KEY_SET <= cluster.keys()
+            and type(cluster["members"]) is list
+            and _members_are_valid(cluster["members"])
+        ):
+            continue
+        errors.extend(validate_cluster(cluster, i, collect_all))
+        if errors and not collect_all:
+            break
+    return errors
+
+
+def _validate_chunk(args: tuple) -> List[ValidationError]:
+    clusters, start, collect_all = args
+    return validate_clusters(clusters, start, collect_all)
+
+
+def index_members(
+    clusters: List[Dict], start: int = 0, owners: Optional[Dict[str, str]] = None
+) -> Tuple[Dict[str, str], List[ValidationError]]:
+    """Map member ids to the id of the cluster holding them, in one pass.
+
+    Clusters must already be valid. Members whose id was already seen (in
+    another cluster or earlier in the same one) are reported as
+    duplicate_member_ids errors; the first occurrence keeps ownership. Pass
+    owners to continue an index built from earlier clusters.
+    """
+    if owners is None:
+        owners = {}
+    errors = []
+    for i, cluster in enumerate(clusters, start):
+        cluster_id = str(cluster["id"])
+        for j, member in enumerate(cluster["members"]):
+            member_id = str(member["id"])
+            owner = owners.get(member_id)
+            if owner is None:
+                owners[member_id] = cluster_id
+            else:
+                params = {"i": i, "j": j, "id": member_id, "owner": owner}
+                errors.append(ValidationError("duplicate_member_ids", i, j, params))
+    return owners, errors
+
+
+def drop_duplicate_members(
+    clusters: List[Dict], duplicates: List[ValidationError], start: int = 0
+):
+    """Remove the members reported by index_members, keeping first occurrences"""
+    positions: Dict[int, set] = {}
+    for error in duplicates:
+        positions.setdefault(error.cluster_index, set()).add(error.member_index)
+    for i, member_positions in positions.items():
+        cluster = clusters[i - start]
+        cluster["members"] = [
+            member
+            for j, member in enumerate(cluster["members"])
+            if j not in member_positions
+        ]
+
+
+def validate_document(
+    json_data: Any,
+    collect_all: bool = True,
+    workers: Optional[int] = None,
+    chunk_size: int = 10000,
+    check_member_ids: bool = True,
+) -> List[ValidationError]:
+    """Validate a whole cluster document and return every problem found.
+
+    Cluster problems come first in document order, followed by duplicate
+    cluster ids and (with check_member_ids) member ids used more than once.
+    With workers > 1, chunks of chunk_size clusters are validated in separate
+    processes; this only pays off for very large documents since each chunk
+    has to be pickled to its worker.
+    """
+    if not isinstance(json_data, dict):
+        return [ValidationError("invalid_json")]
+    if "clusters" not in json_data:
+        return [ValidationError("missing_clusters")]
+    clusters = json_data["clusters"]
+    if not isinstance(clusters, list):
+        return [ValidationError("clusters_not_array")]
+    if len(clusters) == 0:
+        return [ValidationError("no_clusters")]
+
+    if workers and workers > 1 and len(clusters) > chunk_size:
+        chunks = [
+            (clusters[start : start + chunk_size], start, collect_all)
+            for start in range(0, len(clusters), chunk_size)
+        ]
+        errors = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_errors in executor.map(_validate_chunk, chunks):
+                errors.extend(chunk_errors)
+                if errors and not collect_all:
+                    break
+    else:
+        errors = validate_clusters(clusters, 0, collect_all)
+    if errors and not collect_all:
+        return errors[:1]
+
+    seen = set()
+    for i, cluster in enumerate(clusters):
+        if not isinstance(cluster, dict) or "id" not in cluster:
+            continue
+        cluster_id = str(cluster["id"])
+        if cluster_id in seen:
+            errors.append(ValidationError("duplicate_ids", i))
+            if not collect_all:
+                return errors
+        seen.add(cluster_id)
+
+    if check_member_ids and not errors:
+        _, duplicates = index_members(clusters)
+        errors.extend(duplicates if collect_all else duplicates[:1])
+    return errors
@@ -0,0 +1,66 @@
+"""
+Memoization of values derived from the workbench data.
+
+Streamlit reruns the whole script on every interaction. Values computed from
+ClusterManager.data (search results, metrics, selector options, flow
+elements) are cached against ClusterManager.version, so they are only
+recomputed after the data actually changed.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class ViewCache:
+    """LRU cache of derived values, valid for a single data version.
+
+    Entries are keyed on the data version and on a key describing the value
+    and the parameters (search query, view options) it was computed with.
+    Asking for another version drops every entry of the previous one.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: int, compute: Callable[[], T]) -> T:
+        """Return the cached value of key at version, computing it on a miss"""
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            value = self._entries[key] = compute()
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return value
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        self._entries.clear()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters, hit rate and number of cached entries"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,192 @@
+"""
+Decide which parts of the cluster graph are sent to the flow component.
+
+Rendering every member of every cluster does not scale, so the flow view is
+planned first: clusters are shown as summary nodes, and member nodes are only
+materialized for clusters the user expanded or that sit inside the current
+viewport, within a fixed node budget. Each render is then compared with the
+previous one by content hash so that only the elements that changed are
+replaced in the flow state.
+"""
+
+import copy
+import hashlib
+import json
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+DEFAULT_NODE_BUDGET = 2000
+VIEWPORT_SIZE = (1200.0, 800.0)
+DEFAULT_VIEWPORT = (0.0, 0.0) + VIEWPORT_SIZE
+
+Position = Tuple[float, float]
+Viewport = Tuple[float, float, float, float]  # x, y, width, height
+
+
+class ClusterView(NamedTuple):
+    """A cluster as it should be drawn: position and the members to show"""
+
+    index: int
+    cluster: Dict
+    position: Position
+    members: List[Dict]
+    hidden_members: int
+
+
+def grid_position(i: int) -> Position:
+    """Position of the i-th cluster on the default 3-column grid"""
+    return (100 + (i % 3) * 300, 100 + (i // 3) * 200)
+
+
+def viewport_around(position: Position, size: Position = VIEWPORT_SIZE) -> Viewport:
+    """A viewport of the given size centred on position"""
+    width, height = size
+    return (position[0] - width / 2, position[1] - height / 2, width, height)
+
+
+def _in_viewport(position: Position, viewport: Viewport) -> bool:
+    x, y, width, height = viewport
+    return x <= position[0] <= x + width and y <= position[1] <= y + height
+
+
+def plan_flow_view(
+    clusters: Sequence[Dict],
+    positions: Sequence[Position],
+    expanded: Set[str],
+    viewport: Optional[Viewport] = None,
+    node_budget: Optional[int] = None,
+    priority: Set[str] = frozenset(),
+) -> List[ClusterView]:
+    """Choose the clusters and member nodes to render.
+
+    Clusters are ranked: expanded ones first, then those inside viewport,
+    then those in priority (e.g. search matches), then the rest, keeping data
+    order within a rank. With a node_budget, at most half the budget goes to
+    cluster nodes when there are more clusters than that, and the remaining
+    budget is spent on members of expanded and visible clusters in rank
+    order. Without a budget every chosen cluster shows all its members.
+    The result keeps the order of clusters.
+    """
+    ranks = []
+    for i, cluster in enumerate(clusters):
+        cluster_id = str(cluster["id"])
+        if cluster_id in expanded:
+            rank = 0
+        elif viewport is not None and _in_viewport(positions[i], viewport):
+            rank = 1
+        elif cluster_id in priority:
+            rank = 2
+        else:
+            rank = 3
+        ranks.append(rank)
+
+    order = sorted(range(len(clusters)), key=lambda i: (ranks[i], i))
+    if node_budget is not None and len(order) > node_budget // 2:
+        order = order[: max(node_budget // 2, 1)]
+    remaining = None if node_budget is None else node_budget - len(order)
+
+    shown: Dict[int, List[Dict]] = {}
+    for i in order:
+        members = clusters[i]["members"]
+        if ranks[i] > 1:
+            shown[i] = []
+        elif remaining is None:
+            shown[i] = members
+        else:
+            shown[i] = members[: max(remaining, 0)]
+            remaining -= len(shown[i])
+
+    return [
+        ClusterView(
+            i,
+            clusters[i],
+            positions[i],
+            shown[i],
+            len(clusters[i]["members"]) - len(shown[i]),
+        )
+        for i in sorted(order)
+    ]
+
+
+# -- flow state diffing ----------------------------------------------------
+
+# Node fields the browser changes while the user works with the graph; they
+# are not part of an element's content
+_VOLATILE_FIELDS = ("position", "selected", "dragging", "resizing")
+
+Signature = Tuple[str, Optional[Position]]
+
+
+class FlowDiff(NamedTuple):
+    """Ids of flow elements added, removed, changed or moved since last run"""
+
+    added: Set[str]
+    removed: Set[str]
+    changed: Set[str]
+    moved: Set[str]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed or self.moved)
+
+
+def element_signature(element) -> Signature:
+    """Content hash of a flow node or edge, and the position it was placed at.
+
+    The position is kept apart from the hash so that an element whose content
+    changed can keep the position the user dragged it to.
+    """
+    content = element.asdict()
+    position = content.get("position")
+    for field in _VOLATILE_FIELDS:
+        content.pop(field, None)
+    digest = hashlib.blake2b(
+        json.dumps(content, sort_keys=True, default=str).encode(), digest_size=12
+    ).hexdigest()
+    if position is None:
+        return digest, None
+    return digest, (position["x"], position["y"])
+
+
+def flow_signatures(elements: Sequence) -> Dict[str, Signature]:
+    """Map the id of each flow element to its signature"""
+    return {element.id: element_signature(element) for element in elements}
+
+
+def diff_flow(
+    previous: Dict[str, Signature], current: Dict[str, Signature]
+) -> FlowDiff:
+    """Compare the signatures of two renders of the flow"""
+    added = current.keys() - previous.keys()
+    removed = previous.keys() - current.keys()
+    changed = set()
+    moved = set()
+    for element_id in current.keys() & previous.keys():
+        (old_hash, old_position), (new_hash, new_position) = (
+            previous[element_id],
+            current[element_id],
+        )
+        if old_hash != new_hash:
+            changed.add(element_id)
+        if old_position != new_position:
+            moved.add(element_id)
+    return FlowDiff(set(added), set(removed), changed, moved)
+
+
+def patch_flow_elements(existing: Sequence, elements: Sequence, diff: FlowDiff) -> List:
+    """Return elements, reusing the existing object of every unchanged one.
+
+    Reused objects carry the state the browser sent back (dragged positions,
+    selection). Changed elements that were not moved keep their dragged
+    position. The elements passed in are not modified.
+    """
+    current = {element.id: element for element in existing}
+    patched = []
+    for element in elements:
+        old = current.get(element.id)
+        if old is not None and element.id not in diff.moved:
+            if element.id not in diff.changed:
+                element = old
+            elif hasattr(old, "position"):
+                element = copy.copy(element)
+                element.position = old.position
+        patched.append(element)
+    return patched
@@ -0,0 +1,307 @@
+"""
+Workbenches persisted in a SQLite file.
+
+Every cluster is one row of the clusters table, holding the cluster as
+compact JSON and a position that orders the rows as the workbench orders
+its clusters. Positions are floats, so a cluster inserted between two others
+gets the midpoint of their positions and no other row has to be rewritten;
+when no float fits any more all positions are renumbered.
+
+ClusterManager writes the rows an operation touched after every operation,
+undo and redo, so saving costs what the operation changed rather than the
+size of the workbench. Reopening reads the rows back without validating
+them again, since only validated data is ever written, and the facet
+summary written with every full save (operations move members between
+clusters, which leaves it unchanged) lets members be indexed later.
+
+Only one WorkbenchDB at a time, in any session or process, can have a file
+open: each session writes from its own copy of the workbench, so two of
+them would overwrite each other's rows. The file is claimed with an
+exclusive lock on a "-lock" file next to it, which the operating system
+releases when the WorkbenchDB is closed or garbage collected, or its
+process ends.
+
+A snapshot copies the clusters table under a name inside the same file,
+with a single INSERT ... SELECT.
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    from .export import to_json
+except ImportError:  # loaded as a top-level module by `streamlit run app/main.py`
+    from export import to_json
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS clusters (
+    id TEXT PRIMARY KEY,
+    position REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS clusters_by_position ON clusters (position);
+CREATE TABLE IF NOT EXISTS snapshots (
+    name TEXT PRIMARY KEY,
+    created TEXT NOT NULL,
+    document TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_clusters (
+    snapshot TEXT NOT NULL,
+    id TEXT NOT NULL,
+    position REAL NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (snapshot, id)
+);
+"""
+
+
+class WorkbenchLockedError(Exception):
+    """Raised when another WorkbenchDB has the file open"""
+
+
+def _lock(path: str) -> BinaryIO:
+    """Open and exclusively lock the lock file of the workbench at path,
+    raising WorkbenchLockedError if it is already locked"""
+    lock = open(path + "-lock", "a+b")
+    try:
+        # Locks belong to the open file, so they also keep out other
+        # sessions of the same process
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock.close()
+        raise WorkbenchLockedError(path) from None
+    return lock
+
+
+class WorkbenchDB:
+    """A workbench stored in a SQLite file, written one cluster row at a time"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = _lock(path)
+        try:
+            # Streamlit may run a session's reruns on different threads; a
+            # session only ever runs one script at a time
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            with self._connection:
+                self._connection.executescript(_SCHEMA)
+                self._connection.execute(
+                    "INSERT OR IGNORE INTO meta VALUES ('schema_version', ?)",
+                    (str(SCHEMA_VERSION),),
+                )
+            # cluster id -> position of its row
+            self._positions: Dict[str, float] = dict(
+                self._connection.execute("SELECT id, position FROM clusters")
+            )
+        except Exception:
+            self._lock.close()
+            raise
+
+    def close(self):
+        """Close the file and let another WorkbenchDB open it"""
+        self._connection.close()
+        self._lock.close()
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def is_empty(self) -> bool:
+        """Whether nothing was ever saved here (an empty workbench counts)"""
+        row = self._connection.execute(
+            "SELECT 1 FROM meta WHERE key = 'document'"
+        ).fetchone()
+        return row is None
+
+    def load(self) -> Dict:
+        """Return the saved workbench document"""
+        return self._document(
+            "SELECT value FROM meta WHERE key = 'document'",
+            "SELECT data FROM clusters ORDER BY position",
+            (),
+        )
+
+    def facets(self) -> Optional[Dict]:
+        """Return the facet summary saved by write_all, if any"""
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = 'facets'"
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _document(self, document_query: str, clusters_query: str, args: tuple):
+        row = self._connection.execute(document_query, args).fetchone()
+        document = json.loads(row[0]) if row else {}
+        loads = json.loads
+        document["clusters"] = [
+            loads(data) for (data,) in self._connection.execute(clusters_query, args)
+        ]
+        return document
+
+    def write_all(self, data: Dict, facets: Optional[Dict] = None):
+        """Replace everything saved with data, and the facet summary with
+        facets"""
+        clusters = data["clusters"]
+        self._positions = {str(c["id"]): float(i) for i, c in enumerate(clusters)}
+        document = {key: value for key, value in data.items() if key != "clusters"}
+        with self._connection:
+            self._connection.execute("DELETE FROM clusters")
+            self._connection.executemany(
+                "INSERT INTO clusters VALUES (?, ?, ?)",
+                ((str(c["id"]), float(i), to_json(c)) for i, c in enumerate(clusters)),
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('document', ?)",
+                (to_json(document),),
+            )
+            self._connection.execute("DELETE FROM meta WHERE key = 'facets'")
+            if facets is not None:
+                self._connection.execute(
+                    "INSERT INTO meta VALUES ('facets', ?)", (to_json(facets),)
+                )
+
+    def update(
+        self,
+        clusters: Sequence[Dict],
+        positions: Dict[str, int],
+        touched: Iterable[str],
+    ):
+        """Write the rows of the touched clusters.
+
+        clusters is the workbench's list of clusters and positions maps their
+        ids to their index in it; touched clusters missing from it are
+        deleted. Clusters keep their row position while it still lies
+        between those of their neighbours.
+        """
+        touched = sorted(
+            set(touched), key=lambda cluster_id: positions.get(cluster_id, -1)
+        )
+        with self._connection:
+            for cluster_id in touched:
+                index = positions.get(cluster_id)
+                if index is None:
+                    self._positions.pop(cluster_id, None)
+                    self._connection.execute(
+                        "DELETE FROM clusters WHERE id = ?", (cluster_id,)
+                    )
+                    continue
+                position = self._position_at(clusters, index)
+                if position is None:
+                    self._renumber(clusters)
+                    position = self._positions[cluster_id]
+                self._positions[cluster_id] = position
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO clusters VALUES (?, ?, ?)",
+                    (cluster_id, position, to_json(clusters[index])),
+                )
+
+    def _position_at(self, clusters: Sequence[Dict], index: int) -> Optional[float]:
+        """Position for the row of clusters[index] that sorts it between its
+        neighbours, or None if no float fits between them"""
+        before = self._neighbour_position(clusters, index, -1)
+        after = self._neighbour_position(clusters, index, 1)
+        current = self._positions.get(str(clusters[index]["id"]))
+        if current is not None and (before is None or before < current):
+            if after is None or current < after:
+                return current
+        if before is None and after is None:
+            return 0.0
+        if before is None:
+            return after - 1
+        if after is None:
+            return before + 1
+        middle = (before + after) / 2
+        return middle if before < middle < after else None
+
+    def _neighbour_position(
+        self, clusters: Sequence[Dict], index: int, step: int
+    ) -> Optional[float]:
+        """Position of the nearest saved cluster before (step -1) or after
+        (step 1) clusters[index]"""
+        index += step
+        while 0 <= index < len(clusters):
+            position = self._positions.get(str(clusters[index]["id"]))
+            if position is not None:
+                return position
+            index += step
+        return None
+
+    def _renumber(self, clusters: Sequence[Dict]):
+        """Give the rows the positions 0, 1, 2, ... in workbench order.
+
+        Clusters without a row yet get their position too, for the caller
+        to write.
+        """
+        self._positions = {str(c["id"]): float(i) for i, c in enumerate(clusters)}
+        self._connection.executemany(
+            "UPDATE clusters SET position = ? WHERE id = ?",
+            (
+                (position, cluster_id)
+                for cluster_id, position in self._positions.items()
+            ),
+        )
+
+    # -- snapshots -----------------------------------------------------------
+
+    def save_snapshot(self, name: str):
+        """Copy the saved workbench under name, replacing a snapshot of that name"""
+        with self._connection:
+            self._connection.execute("DELETE FROM snapshots WHERE name = ?", (name,))
+            self._connection.execute(
+                "DELETE FROM snapshot_clusters WHERE snapshot = ?", (name,)
+            )
+            self._connection.execute(
+                "INSERT INTO snapshots SELECT ?, ?, value FROM meta"
+                " WHERE key = 'document'",
+                (name, datetime.now().isoformat(timespec="seconds")),
+            )
+            self._connection.execute(
+                "INSERT INTO snapshot_clusters"
+                " SELECT ?, id, position, data FROM clusters",
+                (name,),
+            )
+
+    def snapshots(self) -> List[Tuple[str, str, int]]:
+        """(name, creation time, number of clusters) of every snapshot, newest first"""
+        return self._connection.execute(
+            "SELECT name, created, (SELECT COUNT(*) FROM snapshot_clusters"
+            " WHERE snapshot = name) FROM snapshots ORDER BY created DESC, name"
+        ).fetchall()
+
+    def load_snapshot(self, name: str) -> Optional[Dict]:
+        """Return the workbench document saved as snapshot name, if any"""
+        exists = self._connection.execute(
+            "SELECT 1 FROM snapshots WHERE name = ?", (name,)
+        ).fetchone()
+        if exists is None:
+            return None
+        return self._document(
+            "SELECT document FROM snapshots WHERE name = ?",
+            "SELECT data FROM snapshot_clusters WHERE snapshot = ? ORDER BY position",
+            (name,),
+        )
+
+    def delete_snapshot(self, name: str) -> bool:
+        """Drop a snapshot, returning whether it existed"""
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM snapshot_clusters WHERE snapshot = ?", (name,)
+            )
+            deleted = self._connection.execute(
+                "DELETE FROM snapshots WHERE name = ?", (name,)
+            ).rowcount
+        return bool(deleted)
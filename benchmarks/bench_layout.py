@@ -0,0 +1,55 @@
+"""
+Time the automatic cluster graph layout, from scratch and from its cache.
+
+Usage: python benchmarks/bench_layout.py [clusters] [relationships_per_cluster]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.layout import GraphLayout  # noqa: E402
+
+
+def make_clusters(clusters, relationships, group=20):
+    """Clusters related to random others in their group of group clusters"""
+    rng = random.Random(0)
+    return [
+        {
+            "id": f"cluster_{i}",
+            "relationships": [
+                f"cluster_{min(clusters - 1, i // group * group + rng.randrange(group))}"
+                for _ in range(relationships)
+            ],
+        }
+        for i in range(clusters)
+    ]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    clusters = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    relationships = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    data = make_clusters(clusters, relationships)
+    print(f"{clusters} clusters x {relationships} relationships")
+
+    layout = GraphLayout()
+    full = timed(lambda: layout.positions(data))
+    cached = timed(lambda: layout.positions(data))
+    data.append({"id": "new", "relationships": ["cluster_0"]})
+    incremental = timed(lambda: layout.positions(data))
+    print(f"full layout:          {full:.3f}s")
+    print(f"cached:               {cached:.3f}s")
+    print(f"one cluster added:    {incremental:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
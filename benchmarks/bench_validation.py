@@ -0,0 +1,87 @@
+"""
+Compare the fast-path cluster validator with the original nested-loop one.
+
+Usage: python benchmarks/bench_validation.py [clusters] [members_per_cluster]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.validation import validate_document  # noqa: E402
+
+
+def legacy_validate(json_data):
+    """The validation loop load_data used before app/validation.py"""
+    for i, cluster in enumerate(json_data["clusters"]):
+        if not isinstance(cluster, dict):
+            return False, "cluster_not_object", {"i": i}
+        required_keys = ["id", "name", "members"]
+        missing_keys = [key for key in required_keys if key not in cluster]
+        if missing_keys:
+            return False, "missing_keys", {"i": i, "missing_keys": missing_keys}
+        if not isinstance(cluster["members"], list):
+            return False, "members_not_array", {"i": i}
+        for j, member in enumerate(cluster["members"]):
+            if not isinstance(member, dict):
+                return False, "member_not_object", {"i": i, "j": j}
+            member_required = ["id", "name"]
+            member_missing = [key for key in member_required if key not in member]
+            if member_missing:
+                return (
+                    False,
+                    "member_missing_keys",
+                    {"i": i, "j": j, "member_missing": member_missing},
+                )
+    cluster_ids = [str(cluster["id"]) for cluster in json_data["clusters"]]
+    if len(cluster_ids) != len(set(cluster_ids)):
+        return False, "duplicate_ids"
+    return True, "data_loaded"
+
+
+def make_data(clusters, members):
+    return {
+        "clusters": [
+            {
+                "id": f"cluster_{i}",
+                "name": f"Cluster {i}",
+                "members": [
+                    {"id": f"member_{i}_{j}", "name": f"Member {j}", "metadata": {}}
+                    for j in range(members)
+                ],
+                "relationships": [],
+            }
+            for i in range(clusters)
+        ]
+    }
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    clusters = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    members = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    data = make_data(clusters, members)
+    print(f"{clusters} clusters x {members} members")
+
+    # The legacy validator never looked at member ids, so the fast path is
+    # compared without the member id check and timed with it separately
+    legacy = best_of(lambda: legacy_validate(data))
+    fast = best_of(lambda: validate_document(data, check_member_ids=False))
+    checked = best_of(lambda: validate_document(data))
+    print(f"legacy validator:     {legacy:.3f}s")
+    print(f"fast-path validator:  {fast:.3f}s  ({legacy / fast:.1f}x)")
+    print(f"  with member ids:    {checked:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
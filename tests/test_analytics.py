@@ -0,0 +1,95 @@
+"""
+Tests for graph analytics over cluster relationships.
+"""
+
+import numpy as np
+import pytest
+
+from app.analytics import GraphAnalytics
+
+
+def make_clusters(edges, extra=()):
+    """Clusters named after the ends of edges, related along them."""
+    ids = list(dict.fromkeys([c for edge in edges for c in edge] + list(extra)))
+    related = {cluster_id: [] for cluster_id in ids}
+    for source, target in edges:
+        related[source].append(target)
+    return [
+        {"id": cluster_id, "name": cluster_id, "members": [], "relationships": rel}
+        for cluster_id, rel in related.items()
+    ]
+
+
+class TestGraphAnalytics:
+    """Test cases for GraphAnalytics."""
+
+    def test_components_and_degrees(self):
+        """Test that relationships are undirected and deduplicated."""
+        clusters = make_clusters(
+            [("a", "b"), ("b", "a"), ("b", "c"), ("d", "e")], extra=["f"]
+        )
+        clusters[0]["relationships"].append("missing")
+        analytics = GraphAnalytics(clusters)
+
+        assert analytics.edge_count == 3
+        assert analytics.degrees().tolist() == [1, 2, 1, 1, 1, 0]
+        assert analytics.component_sizes() == [
+            (3, ["a", "b", "c"]),
+            (2, ["d", "e"]),
+            (1, ["f"]),
+        ]
+
+    def test_components_of_long_path(self):
+        """Test that labels reach the end of a long chain."""
+        ids = [f"c{i}" for i in range(500)]
+        analytics = GraphAnalytics(make_clusters(list(zip(ids, ids[1:]))))
+        assert analytics.components().tolist() == [0] * 500
+
+    def test_exact_betweenness(self):
+        """Test betweenness of a path and a star graph."""
+        path = GraphAnalytics(make_clusters([("a", "b"), ("b", "c"), ("c", "d")]))
+        # b lies on a-c and a-d out of the 3 pairs not involving it
+        assert path.betweenness() == pytest.approx([0, 2 / 3, 2 / 3, 0])
+
+        star = GraphAnalytics(make_clusters([("hub", leaf) for leaf in "wxyz"]))
+        assert star.betweenness() == pytest.approx([1, 0, 0, 0, 0])
+        assert star.top(star.betweenness(), 1) == [("hub", 1.0)]
+
+    def test_shared_shortest_paths(self):
+        """Test that betweenness is split between equally short paths."""
+        square = GraphAnalytics(
+            make_clusters([("a", "b"), ("b", "c"), ("c", "d"), ("d", "a")])
+        )
+        # Each cluster carries half of the one pair opposite it
+        assert square.betweenness() == pytest.approx([1 / 6] * 4)
+
+    def test_sampled_betweenness(self):
+        """Test that sampled betweenness estimates the exact value."""
+        rng = np.random.default_rng(1)
+        ids = [f"c{i}" for i in range(300)]
+        edges = [(ids[i], ids[j]) for i, j in rng.integers(0, 300, (600, 2))]
+        analytics = GraphAnalytics(make_clusters(edges, extra=ids))
+
+        exact = analytics.betweenness()
+        sampled = analytics.betweenness(samples=150)
+        assert analytics.betweenness(samples=150) is sampled
+        assert np.argmax(sampled) == np.argmax(exact)
+        assert sampled.sum() == pytest.approx(exact.sum(), rel=0.1)
+
+    def test_shortest_path(self):
+        """Test shortest paths and unconnected or unknown clusters."""
+        analytics = GraphAnalytics(
+            make_clusters([("a", "b"), ("b", "c"), ("c", "d"), ("a", "d"), ("e", "f")])
+        )
+        assert analytics.shortest_path("a", "d") == ["a", "d"]
+        assert analytics.shortest_path("b", "d") in (["b", "a", "d"], ["b", "c", "d"])
+        assert analytics.shortest_path("a", "a") == ["a"]
+        assert analytics.shortest_path("a", "e") is None
+        assert analytics.shortest_path("a", "missing") is None
+
+    def test_empty(self):
+        """Test analytics of a workbench without clusters."""
+        analytics = GraphAnalytics([])
+        assert analytics.edge_count == 0
+        assert analytics.component_sizes() == []
+        assert analytics.betweenness().tolist() == []
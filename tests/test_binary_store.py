@@ -0,0 +1,128 @@
+"""
+Tests for binary workbench files.
+"""
+
+import json
+
+import pytest
+
+from app.binary_store import (
+    HEADER,
+    BinaryFormatError,
+    BinaryWorkbench,
+    _Records,
+    export_binary,
+    save_binary,
+)
+from app.export import to_json
+
+
+@pytest.fixture
+def document():
+    return {
+        "version": 2,
+        "clusters": [
+            {
+                "id": "a",
+                "name": "Team A",
+                "members": [
+                    {"id": "m1", "name": "Ann", "metadata": {"role": "Dev", "x": [1]}},
+                    {"id": 7, "name": "Bob", "notes": "typed id"},
+                ],
+                "relationships": ["b"],
+                "color": "red",
+            },
+            {
+                "id": "b",
+                "name": "Team B",
+                "members": [{"id": "m3", "name": "Cy", "metadata": None}],
+                "relationships": [1, "a"],
+            },
+            {"id": "c", "name": "Empty", "members": [], "relationships": []},
+        ],
+    }
+
+
+class TestBinaryWorkbench:
+    """Test cases for writing and reading binary workbench files."""
+
+    def test_round_trip(self, document):
+        """Test that every cluster, member and key reads back as written."""
+        workbench = BinaryWorkbench(export_binary(document))
+        assert len(workbench) == 3
+        assert workbench.member_count == 3
+        assert workbench.document() == {"version": 2}
+        assert list(workbench.clusters) == document["clusters"]
+        assert json.loads(to_json(workbench.clusters)) == document["clusters"]
+
+    def test_members_and_relationships_behave_like_lists(self, document):
+        """Test indexing, slicing and comparing the lists read from a file."""
+        cluster = BinaryWorkbench(export_binary(document)).clusters[0]
+        members = cluster["members"]
+        assert len(members) == 2
+        assert members[-1]["id"] == 7
+        assert [m["name"] for m in members[:1]] == ["Ann"]
+        assert members == document["clusters"][0]["members"]
+        assert members != document["clusters"][1]["members"]
+        assert cluster["relationships"] == ["b"]
+        assert members[0].get("metadata") == {"role": "Dev", "x": [1]}
+        assert members[1].get("metadata") is None
+        assert "metadata" not in members[1]
+        with pytest.raises(IndexError):
+            members[2]
+        with pytest.raises(TypeError):
+            _Records(cluster._workbench, 0, 1)
+
+    def test_cluster_changes_kept_over_file(self, document):
+        """Test that keys set on or deleted from a cluster view are kept."""
+        cluster = BinaryWorkbench(export_binary(document)).clusters[2]
+        cluster["name"] = "Renamed"
+        cluster["members"] = [{"id": "m9", "name": "New"}]
+        cluster["tag"] = 1
+        del cluster["relationships"]
+        assert dict(cluster) == {
+            "id": "c",
+            "name": "Renamed",
+            "members": [{"id": "m9", "name": "New"}],
+            "tag": 1,
+        }
+        with pytest.raises(KeyError):
+            del cluster["relationships"]
+
+    def test_mapped_file_survives_save(self, document, tmp_path):
+        """Test that saving over a mapped file leaves its readers intact."""
+        path = str(tmp_path / "w.cwb")
+        save_binary(document, path, facets={"limit": 5, "counts": {}})
+        workbench = BinaryWorkbench(path)
+        assert workbench.facets() == {"limit": 5, "counts": {}}
+
+        save_binary({"clusters": []}, path)
+        assert workbench.clusters[1]["name"] == "Team B"
+        assert len(BinaryWorkbench(path)) == 0
+        assert BinaryWorkbench(path).facets() is None
+        assert list(tmp_path.iterdir()) == [tmp_path / "w.cwb"]
+
+    def test_invalid_files(self, document, tmp_path):
+        """Test that other files, other versions and truncation are reported."""
+        contents = export_binary(document)
+        with pytest.raises(BinaryFormatError) as error:
+            BinaryWorkbench(b'{"clusters": []}')
+        assert error.value.code == "invalid_binary_workbench"
+
+        with pytest.raises(BinaryFormatError) as error:
+            BinaryWorkbench(contents[: HEADER.size + 8])
+        assert error.value.code == "truncated_binary_workbench"
+
+        newer = bytearray(contents)
+        newer[4] = 9
+        with pytest.raises(BinaryFormatError) as error:
+            BinaryWorkbench(bytes(newer))
+        assert (error.value.code, error.value.params) == (
+            "binary_workbench_version",
+            {"version": 9},
+        )
+
+        empty = tmp_path / "empty.cwb"
+        empty.write_bytes(b"")
+        with pytest.raises(BinaryFormatError):
+            BinaryWorkbench(str(empty))
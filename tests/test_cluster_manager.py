@@ -4,7 +4,11 @@ Tests for the ClusterManager class.
 
 import pytest
 import copy
+import io
+import json
 from app.cluster_manager import ClusterManager
+from app.dataset_cache import DatasetCache
+from app.search_index import FieldIndex
 
 
 class TestClusterManager:
@@ -295,3 +299,880 @@ class TestClusterManager:
         """Test drag and drop with invalid member."""
         success = manager_with_data.handle_drag_drop("cluster1", "invalid", "cluster2")
         assert success is False
+
+    def test_index_follows_merge(self, manager_with_data):
+        """Test that lookups reflect a merge."""
+        manager_with_data.merge_clusters("cluster1", "cluster2", "Merged")
+
+        assert manager_with_data.get_cluster_by_id("cluster2") is None
+        member = manager_with_data.get_member_by_id("cluster1", "member3")
+        assert member is not None
+        assert member["name"] == "Bob Johnson"
+
+    def test_index_follows_move_and_split(self, manager_with_data):
+        """Test that member lookups follow moved and split members."""
+        manager_with_data.move_members("cluster1", "cluster2", ["member1"])
+        assert manager_with_data.get_member_by_id("cluster1", "member1") is None
+        assert manager_with_data.get_member_by_id("cluster2", "member1") is not None
+
+        manager_with_data.split_cluster("cluster2", ["member3"], "Split")
+        new_cluster = manager_with_data.data["clusters"][-1]
+        assert manager_with_data.get_cluster_by_id(new_cluster["id"]) is new_cluster
+        assert manager_with_data.get_member_by_id(new_cluster["id"], "member3")
+        assert manager_with_data.get_member_by_id("cluster2", "member3") is None
+
+    def test_index_rebuilt_on_undo(self, manager_with_data):
+        """Test that lookups point at the restored data after undo."""
+        manager_with_data.merge_clusters("cluster1", "cluster2", "Merged")
+        manager_with_data.undo()
+
+        cluster2 = manager_with_data.get_cluster_by_id("cluster2")
+        assert cluster2 is manager_with_data.data["clusters"][1]
+        assert manager_with_data.get_member_by_id("cluster1", "member3") is None
+
+    def test_undo_restores_every_operation(self, manager_with_data, sample_data):
+        """Test that undoing a sequence of operations restores the loaded data."""
+        original = copy.deepcopy(manager_with_data.data)
+
+        manager_with_data.move_members("cluster1", "cluster2", ["member1"])
+        manager_with_data.split_cluster("cluster2", ["member3"], "Split")
+        manager_with_data.merge_clusters("cluster2", "cluster1", "Merged")
+
+        while manager_with_data.undo():
+            pass
+
+        assert manager_with_data.data == original
+        assert manager_with_data.get_member_by_id("cluster1", "member1") is not None
+        assert manager_with_data.get_member_by_id("cluster2", "member1") is None
+
+    def test_history_records_changes_not_snapshots(self, manager_with_data):
+        """Test that history entries only hold what an operation touched."""
+        manager_with_data.move_members("cluster1", "cluster2", ["member1"])
+
+        entry = manager_with_data.history[-1]
+        assert entry["operation"] == "move"
+        touched = {change[1] for change in entry["changes"]}
+        assert touched == {"cluster1", "cluster2"}
+
+    def test_failed_operation_records_no_history(self, manager_with_data):
+        """Test that an operation that changes nothing is not recorded."""
+        manager_with_data.move_members("cluster1", "cluster2", ["invalid"])
+        assert len(manager_with_data.history) == 1
+
+    def test_undo_clear(self, manager_with_data):
+        """Test that clearing the workbench can be undone."""
+        manager_with_data.clear()
+        assert manager_with_data.data["clusters"] == []
+        assert manager_with_data.get_cluster_by_id("cluster1") is None
+
+        assert manager_with_data.undo() is True
+        assert len(manager_with_data.data["clusters"]) == 2
+        assert manager_with_data.get_cluster_by_id("cluster1") is not None
+
+    def test_version_increases_on_every_change(self, manager_with_data):
+        """Test that the data version moves forward on each kind of change."""
+        versions = [manager_with_data.version]
+        manager_with_data.merge_clusters("cluster1", "cluster2", "Merged")
+        versions.append(manager_with_data.version)
+        manager_with_data.undo()
+        versions.append(manager_with_data.version)
+        manager_with_data.redo()
+        versions.append(manager_with_data.version)
+        manager_with_data.clear()
+        versions.append(manager_with_data.version)
+        manager_with_data.load_data(
+            {"clusters": [{"id": "c1", "name": "C1", "members": []}]}
+        )
+        versions.append(manager_with_data.version)
+        assert versions == sorted(set(versions))
+
+    def test_version_unchanged_without_changes(self, manager_with_data):
+        """Test that failed operations and lookups keep the version."""
+        version = manager_with_data.version
+        manager_with_data.move_members("cluster1", "cluster2", ["invalid"])
+        manager_with_data.search_clusters("Test")
+        manager_with_data.undo()
+        manager_with_data.undo()
+        assert manager_with_data.version == version
+
+    def test_export_json_cached_by_version(self, manager_with_data):
+        """Test that exports are reused until the data changes."""
+        export = manager_with_data.export_json()
+        assert json.loads(export) == manager_with_data.data
+        assert manager_with_data.export_json() is export
+        assert manager_with_data.export_json(compact=True) is not export
+
+        manager_with_data.merge_clusters("cluster1", "cluster2", "Merged")
+        updated = manager_with_data.export_json()
+        assert updated is not export
+        assert json.loads(updated) == manager_with_data.data
+
+    def test_columnar_round_trip(self, manager_with_data):
+        """Test loading the table export into a new manager."""
+        archive = manager_with_data.export_columnar("csv")
+        assert manager_with_data.export_columnar("csv") is archive
+
+        manager = ClusterManager()
+        assert manager.load_columnar(io.BytesIO(archive)) == (True, "data_loaded")
+        assert manager.data == manager_with_data.data
+
+    def test_load_columnar_invalid(self):
+        """Test that a broken archive is reported as an error."""
+        manager = ClusterManager()
+        assert manager.load_columnar(io.BytesIO(b"junk")) == (False, "invalid_archive")
+        assert manager.data["clusters"] == []
+
+    def test_owner_after_undo_merge(self, manager_with_data):
+        """Test that undoing a merge gives members back to their cluster."""
+        manager_with_data.merge_clusters("cluster1", "cluster2", "Merged")
+        assert manager_with_data.get_member_owner("member3") == "cluster1"
+        manager_with_data.undo()
+        assert manager_with_data.get_member_owner("member3") == "cluster2"
+        manager_with_data.redo()
+        assert manager_with_data.get_member_owner("member3") == "cluster1"
+
+    def test_compact_storage(self, sample_data):
+        """Test that operations give the same results in compact storage."""
+        manager = ClusterManager()
+        compact = ClusterManager(compact=True)
+        manager.load_data(copy.deepcopy(sample_data))
+        compact.load_data(copy.deepcopy(sample_data))
+        assert compact.data == manager.data
+
+        for m in (manager, compact):
+            assert m.move_members("cluster1", "cluster2", ["member1"])
+            assert m.handle_drag_drop(None, "member3", "cluster1")
+            assert m.merge_clusters("cluster1", "cluster2", "Merged")
+            assert m.undo()
+        assert compact.data == manager.data
+        assert compact.get_member_owner("member1") == "cluster2"
+        assert compact.get_member_by_id("cluster1", "member3")["name"] == "Bob Johnson"
+        assert compact.get_member_by_id("cluster2", "member3") is None
+        assert compact.search_cluster_ids("role:Developer") == {"cluster2"}
+        assert compact.export_json() == manager.export_json()
+
+    def test_compact_storage_redo_keeps_members(self):
+        """Test that redone member changes leave later history entries intact."""
+        data = {
+            "clusters": [
+                {
+                    "id": cluster_id,
+                    "name": cluster_id.upper(),
+                    "members": [{"id": m, "name": m} for m in members],
+                    "relationships": [],
+                }
+                for cluster_id, members in (
+                    ("a", ["m1", "m2"]),
+                    ("b", ["m3"]),
+                    ("c", ["m4"]),
+                )
+            ]
+        }
+        managers = [ClusterManager(), ClusterManager(compact=True)]
+        for m in managers:
+            m.load_data(copy.deepcopy(data))
+            assert m.reassign_members({"m1": "b", "m3": "a"})
+            assert m.move_members("a", "c", ["m2"])
+            m.undo()
+            m.undo()
+            m.redo()
+            m.redo()
+            m.undo()
+            members = m.get_cluster_by_id("a")["members"]
+            assert [member["id"] for member in members] == ["m2", "m3"]
+            assert m.get_metrics()["total_members"] == 4
+
+    def test_reassign_members(self, manager_with_data):
+        """Test moving members out of several clusters in one operation."""
+        manager_with_data.split_cluster("cluster1", ["member2"], "New", "cluster3")
+        assert manager_with_data.reassign_members(
+            {"member3": "cluster1", "member1": "cluster2", "member2": "cluster2"}
+        )
+        data = {c["id"]: c["members"] for c in manager_with_data.data["clusters"]}
+        assert [m["id"] for m in data["cluster1"]] == ["member3"]
+        assert [m["id"] for m in data["cluster2"]] == ["member1", "member2"]
+        assert data["cluster3"] == []
+        assert manager_with_data.get_member_owner("member2") == "cluster2"
+
+        manager_with_data.undo()
+        assert manager_with_data.get_member_owner("member2") == "cluster3"
+        assert manager_with_data.get_member_owner("member3") == "cluster2"
+
+    def test_reassign_members_invalid(self, manager_with_data):
+        """Test that unknown members or clusters reject the whole mapping."""
+        before = copy.deepcopy(manager_with_data.data)
+        assert not manager_with_data.reassign_members(
+            {"member1": "cluster2", "ghost": "cluster2"}
+        )
+        assert not manager_with_data.reassign_members({"member1": "nowhere"})
+        assert not manager_with_data.reassign_members({"member1": "cluster1"})
+        assert manager_with_data.data == before
+
+    def test_apply_batch(self, manager_with_data):
+        """Test that a batch is applied in order as one history entry."""
+        depth = len(manager_with_data.history)
+        before = copy.deepcopy(manager_with_data.data)
+        operations = [
+            {
+                "op": "split",
+                "cluster": "cluster1",
+                "members": ["member2"],
+                "name": "New",
+                "id": "c3",
+            },
+            {
+                "op": "move",
+                "source": "cluster2",
+                "target": "c3",
+                "members": ["member3"],
+            },
+            {
+                "op": "merge",
+                "cluster1": "cluster1",
+                "cluster2": "cluster2",
+                "name": "Merged",
+            },
+        ]
+        assert manager_with_data.apply_batch(operations) == (True, "batch_applied")
+        assert [c["id"] for c in manager_with_data.data["clusters"]] == [
+            "cluster1",
+            "c3",
+        ]
+        assert manager_with_data.get_member_owner("member3") == "c3"
+        assert len(manager_with_data.history) == depth + 1
+        assert manager_with_data.history[-1]["operation"] == "batch"
+
+        assert manager_with_data.undo()
+        assert manager_with_data.data == before
+        assert manager_with_data.get_member_owner("member3") == "cluster2"
+
+    def test_apply_batch_rolls_back(self, manager_with_data):
+        """Test that a failing operation leaves the data untouched."""
+        before = copy.deepcopy(manager_with_data.data)
+        depth = len(manager_with_data.history)
+        operations = [
+            {
+                "op": "move",
+                "source": "cluster1",
+                "target": "cluster2",
+                "members": ["member1"],
+            },
+            {
+                "op": "move",
+                "source": "cluster1",
+                "target": "cluster2",
+                "members": ["member1"],
+            },
+        ]
+        assert manager_with_data.apply_batch(operations) == (
+            False,
+            "operation_failed",
+            {"number": 2, "op": "move"},
+        )
+        assert manager_with_data.data == before
+        assert manager_with_data.get_member_owner("member1") == "cluster1"
+        assert len(manager_with_data.history) == depth
+
+    def test_apply_batch_checks_first(self, manager_with_data):
+        """Test that an invalid batch is rejected before anything runs."""
+        version = manager_with_data.version
+        operations = [
+            {
+                "op": "move",
+                "source": "cluster1",
+                "target": "cluster2",
+                "members": ["member1"],
+            },
+            {"op": "merge", "cluster1": "cluster1", "cluster2": "nope", "name": "X"},
+        ]
+        success, code, params = manager_with_data.apply_batch(operations)
+        assert (success, code, params["number"]) == (
+            False,
+            "operation_unknown_cluster",
+            2,
+        )
+        assert manager_with_data.version == version
+
+    def test_redo_operation(self, manager_with_data):
+        """Test that an undone operation can be redone."""
+        manager_with_data.merge_clusters("cluster1", "cluster2", "Merged")
+        merged = copy.deepcopy(manager_with_data.data)
+        manager_with_data.undo()
+
+        assert manager_with_data.redo() is True
+        assert manager_with_data.data == merged
+        assert manager_with_data.get_cluster_by_id("cluster2") is None
+        assert manager_with_data.redo() is False
+
+    def test_new_operation_clears_redo(self, manager_with_data):
+        """Test that a new operation discards undone operations."""
+        manager_with_data.move_members("cluster1", "cluster2", ["member1"])
+        manager_with_data.undo()
+        manager_with_data.move_members("cluster1", "cluster2", ["member2"])
+
+        assert manager_with_data.redo() is False
+
+    def test_history_byte_budget(self, sample_data):
+        """Test that the oldest entries are evicted once the byte budget is hit,
+        keeping the newest operation undoable."""
+        manager = ClusterManager(max_history=100, max_history_bytes=0)
+        manager.load_data(sample_data)
+        manager.move_members("cluster1", "cluster2", ["member1"])
+        manager.move_members("cluster2", "cluster1", ["member1"])
+
+        assert [entry["operation"] for entry in manager.history] == ["load", "move"]
+        assert manager.undo() is True
+        assert manager.get_member_owner("member1") == "cluster2"
+        assert manager.undo() is False
+
+    def test_history_byte_budget_trims_redo(self, sample_data):
+        """Test that redo entries furthest from the current state are evicted."""
+        manager = ClusterManager()
+        manager.load_data(sample_data)
+        for _ in range(2):
+            manager.move_members("cluster1", "cluster2", ["member1"])
+            manager.move_members("cluster2", "cluster1", ["member1"])
+        for _ in range(4):
+            manager.undo()
+        assert len(manager.redo_history) == 4
+
+        manager.max_history_bytes = 0
+        assert manager.redo()
+        assert len(manager.history) == 2
+        assert len(manager.redo_history) == 1
+        assert manager.redo()
+        assert manager.get_member_owner("member1") == "cluster1"
+        assert manager.redo() is False
+        assert manager.get_metrics()["history_bytes"] == sum(
+            entry["bytes"] for entry in manager.history
+        )
+
+    def test_get_metrics_history(self, manager_with_data):
+        """Test that history depth and memory are reported in metrics."""
+        manager_with_data.move_members("cluster1", "cluster2", ["member1"])
+        manager_with_data.move_members("cluster2", "cluster1", ["member3"])
+        manager_with_data.undo()
+        metrics = manager_with_data.get_metrics()
+
+        assert metrics["history_depth"] == 1
+        assert metrics["redo_depth"] == 1
+        assert metrics["history_bytes"] > 0
+
+    def test_search_follows_operations(self, manager_with_data):
+        """Test that search results reflect moved members and undo."""
+        manager_with_data.move_members("cluster1", "cluster2", ["member2"])
+        results = manager_with_data.search_clusters("jane")
+        assert [c["id"] for c in results] == ["cluster2"]
+
+        manager_with_data.undo()
+        results = manager_with_data.search_clusters("jane")
+        assert [c["id"] for c in results] == ["cluster1"]
+
+    def test_search_clusters_keeps_data_order(self, manager_with_data):
+        """Test that search results are returned in workbench order."""
+        results = manager_with_data.search_clusters("test cluster")
+        assert [c["id"] for c in results] == ["cluster1", "cluster2"]
+        assert manager_with_data.search_cluster_ids("o") == {"cluster1", "cluster2"}
+
+    def test_search_metadata_fields(self, manager_with_data):
+        """Test searching by member metadata fields."""
+        results = manager_with_data.search_clusters("role:designer")
+        assert [c["id"] for c in results] == ["cluster1"]
+
+        assert manager_with_data.search_cluster_ids("role:manager bob") == {"cluster2"}
+        assert manager_with_data.search_cluster_ids("role:manager jane") == set()
+
+    def test_workbench_file(self, manager_with_data, tmp_path):
+        """Test that changes are saved as they are made and reopened."""
+        path = str(tmp_path / "w.db")
+        assert manager_with_data.open_workbench(path) == (True, "workbench_created")
+        assert manager_with_data.workbench_path == path
+        manager_with_data.move_members("cluster1", "cluster2", ["member1"])
+        manager_with_data.merge_clusters("cluster1", "cluster2", "Merged")
+        manager_with_data.undo()
+        expected = json.loads(manager_with_data.export_json())
+        manager_with_data.close_workbench()
+
+        reopened = ClusterManager()
+        assert reopened.open_workbench(path) == (True, "workbench_opened")
+        assert reopened.data == expected
+        assert reopened.get_facet_counts() == manager_with_data.get_facet_counts()
+        assert not reopened._members_indexed
+        assert reopened.get_member_owner("member1") == "cluster2"
+        assert not reopened.undo()
+
+    def test_workbench_file_has_one_writer(self, manager_with_data, tmp_path):
+        """Test that a file open in one workbench is refused by another."""
+        path = str(tmp_path / "w.db")
+        manager_with_data.open_workbench(path)
+        other = ClusterManager()
+        assert other.open_workbench(path) == (
+            False,
+            "workbench_locked",
+            {"path": path},
+        )
+        assert other.workbench_path is None
+        assert manager_with_data.open_workbench(path) == (True, "workbench_opened")
+
+        manager_with_data.close_workbench()
+        assert other.open_workbench(path) == (True, "workbench_opened")
+
+    def test_snapshots(self, manager_with_data, tmp_path):
+        """Test that restoring a snapshot is saved and can be undone."""
+        assert manager_with_data.save_snapshot("s") == (False, "no_workbench_file")
+        manager_with_data.open_workbench(str(tmp_path / "w.db"))
+        before = json.loads(manager_with_data.export_json())
+        assert manager_with_data.save_snapshot("s") == (True, "snapshot_saved")
+        manager_with_data.merge_clusters("cluster1", "cluster2", "Merged")
+
+        assert manager_with_data.restore_snapshot("s") == (True, "snapshot_restored")
+        assert json.loads(manager_with_data.export_json()) == before
+        assert manager_with_data.get_member_owner("member3") == "cluster2"
+        assert [name for name, _, _ in manager_with_data.list_snapshots()] == ["s"]
+        assert manager_with_data.restore_snapshot("x") == (
+            False,
+            "unknown_snapshot",
+            {"name": "x"},
+        )
+
+        manager_with_data.undo()
+        assert len(manager_with_data.data["clusters"]) == 1
+        manager_with_data.close_workbench()
+        reopened = ClusterManager()
+        reopened.open_workbench(str(tmp_path / "w.db"))
+        assert len(reopened.data["clusters"]) == 1
+
+    def test_open_workbench_invalid_file(self, tmp_path):
+        """Test that a file that is not a database is reported."""
+        path = tmp_path / "w.db"
+        path.write_bytes(b"not a database" * 100)
+        success, code, params = ClusterManager().open_workbench(str(path))
+        assert (success, code) == (False, "workbench_error")
+
+    def test_load_shared(self, sample_data):
+        """Test that sessions share a cached dataset until they change it."""
+        cache = DatasetCache()
+        raw = json.dumps(sample_data).encode()
+        first, second = ClusterManager(), ClusterManager()
+        assert first.load_shared(io.BytesIO(raw), cache) == (True, "data_loaded")
+        assert second.load_shared(io.BytesIO(raw), cache) == (True, "data_loaded")
+        assert first.data is second.data
+        assert cache.stats()["hits"] == 1
+
+        # Only the clusters a change reaches stop being shared
+        assert first.split_cluster("cluster1", ["member1"], "Split", "cluster3")
+        assert first.get_cluster_by_id("cluster2") is second.get_cluster_by_id(
+            "cluster2"
+        )
+        assert first.get_member_owner("member1") == "cluster3"
+        assert first.search_cluster_ids("split") == {"cluster3"}
+        assert first.get_referrers("cluster2") == {"cluster1"}
+        assert second.get_member_owner("member1") == "cluster1"
+        assert second.search_cluster_ids("split") == set()
+        first.undo()
+
+        assert first.move_members("cluster1", "cluster2", ["member1"])
+        assert first.merge_clusters("cluster2", "cluster1", "Merged")
+        assert second.data == sample_data
+        assert second.get_member_owner("member1") == "cluster1"
+        assert second.search_cluster_ids("role:developer") == {"cluster1"}
+        assert first.get_member_owner("member1") == "cluster2"
+        assert first.search_cluster_ids("role:developer") == {"cluster2"}
+
+        first.undo()
+        first.undo()
+        assert first.data == sample_data
+        third = ClusterManager(compact=True)
+        third.load_shared(io.BytesIO(raw), cache)
+        assert third.move_members("cluster1", "cluster2", ["member2"])
+        fourth = ClusterManager()
+        fourth.load_shared(io.BytesIO(raw), cache)
+        fourth.clear()
+        fourth.undo()
+        assert fourth.split_cluster("cluster1", ["member1"], "Split", "cluster3")
+        assert second.data == sample_data
+
+    def test_load_shared_errors_not_cached(self):
+        """Test that a file failing validation is reported and not cached."""
+        cache = DatasetCache()
+        raw = json.dumps({"clusters": [{"id": "a"}]}).encode()
+        manager = ClusterManager()
+        success, code, *_ = manager.load_shared(io.BytesIO(raw), cache)
+        assert (success, code) == (False, "missing_keys")
+        assert manager.validation_errors
+        assert len(cache) == 0
+
+    def test_load_binary(self, manager_with_data, sample_data, tmp_path):
+        """Test that a binary workbench opens with members indexed later."""
+        path = str(tmp_path / "w.cwb")
+        assert manager_with_data.save_binary(path) == (True, "binary_saved")
+        manager = ClusterManager()
+        assert manager.load_binary(path) == (True, "data_loaded")
+        assert manager.data == sample_data
+        assert manager.get_metrics() == manager_with_data.get_metrics()
+        assert manager.get_facet_counts() == manager_with_data.get_facet_counts()
+        assert manager.get_facet_fields() == ["role"]
+        assert not manager._members_indexed
+
+        assert manager.search_cluster_ids("role:manager") == {"cluster2"}
+        assert manager._members_indexed
+        assert manager.get_member_owner("member1") == "cluster1"
+
+    def test_changes_to_binary_workbench(self, sample_data, tmp_path):
+        """Test operations, undo and saving over the file that is open."""
+        path = str(tmp_path / "w.cwb")
+        source = ClusterManager()
+        source.load_data(copy.deepcopy(sample_data))
+        source.save_binary(path)
+        manager = ClusterManager()
+        manager.load_binary(path)
+
+        for m in (source, manager):
+            assert m.move_members("cluster1", "cluster2", ["member1"])
+            assert m.merge_clusters("cluster2", "cluster1", "Merged")
+        assert manager.data == source.data
+        assert manager.get_member_owner("member2") == "cluster2"
+
+        assert manager.save_binary(path) == (True, "binary_saved")
+        manager.undo()
+        manager.undo()
+        assert manager.data == sample_data
+        reopened = ClusterManager()
+        reopened.load_binary(path)
+        assert reopened.data == source.data
+
+    def test_load_binary_contents_and_errors(self, manager_with_data):
+        """Test loading file contents, and contents that are not a workbench."""
+        manager = ClusterManager(compact=True)
+        contents = manager_with_data.export_binary()
+        assert manager_with_data.export_binary() is contents
+        assert manager.load_binary(memoryview(contents)) == (True, "data_loaded")
+        assert manager.data == manager_with_data.data
+
+        assert manager.load_binary(b"{}") == (False, "invalid_binary_workbench")
+        assert manager.validation_errors[0].code == "invalid_binary_workbench"
+
+    def test_find_clusters_ranking(self):
+        """Test that type-ahead matches rank ids and name prefixes first."""
+        manager = ClusterManager()
+        manager.load_data(
+            {
+                "clusters": [
+                    {
+                        "id": "a",
+                        "name": "Team Sales",
+                        "members": [{"id": "m1", "name": "Sally"}],
+                    },
+                    {"id": "b", "name": "Sales East", "members": []},
+                    {"id": "sales", "name": "Other", "members": []},
+                    {"id": "c", "name": "Sales West", "members": []},
+                ]
+            }
+        )
+        found = manager.find_clusters("sales")
+        assert [c["id"] for c in found] == ["sales", "b", "c", "a"]
+        assert [c["id"] for c in manager.find_clusters("sal", limit=2)] == ["b", "c"]
+        assert [c["id"] for c in manager.find_clusters("", limit=1)] == ["a"]
+        assert manager.find_clusters("nothing") == []
+
+    def test_find_and_select_members(self, manager_with_data):
+        """Test member matches by name or id and rule-based selection."""
+        found = manager_with_data.find_members("cluster1", "J")
+        assert [m["id"] for m in found] == ["member1", "member2"]
+        found = manager_with_data.find_members("cluster1", "member2", limit=1)
+        assert [m["id"] for m in found] == ["member2"]
+        found = manager_with_data.find_members("cluster1", "role:designer j")
+        assert [m["id"] for m in found] == ["member2"]
+        assert manager_with_data.find_members("missing", "j") == []
+
+        assert manager_with_data.select_members("cluster1", "role:Developer") == [
+            "member1"
+        ]
+        assert manager_with_data.select_members("cluster2", "role:Developer") == []
+        assert manager_with_data.select_members("cluster1", "role:Developer j") is None
+        assert manager_with_data.select_members("cluster1", "team:x") is None
+
+    def test_facet_counts_follow_operations(self, manager_with_data):
+        """Test that facet counts are kept up to date by operations."""
+        counts = manager_with_data.get_facet_counts()
+        assert dict(counts["role"]) == {"Developer": 1, "Designer": 1, "Manager": 1}
+
+        manager_with_data.move_members("cluster1", "cluster2", ["member1"])
+        assert manager_with_data.search_cluster_ids("role:developer") == {"cluster2"}
+        assert manager_with_data.get_facet_counts(["role"], limit=None) == counts
+
+    def test_get_metrics_distribution(self, manager_with_data):
+        """Test cluster size statistics in metrics."""
+        metrics = manager_with_data.get_metrics()
+
+        assert metrics["min_cluster_size"] == 1
+        assert metrics["max_cluster_size"] == 2
+        assert metrics["median_cluster_size"] == 1.5
+        assert [c["id"] for c in metrics["largest_clusters"]] == [
+            "cluster1",
+            "cluster2",
+        ]
+
+    def test_get_metrics_graph(self):
+        """Test degree statistics in metrics, kept up to date by operations."""
+        manager = ClusterManager()
+        clusters = [
+            {"id": c, "name": c, "members": [], "relationships": related}
+            for c, related in [
+                ("a", ["b"]),
+                ("b", ["c", "missing"]),
+                ("c", []),
+                ("d", ["e"]),
+                ("e", ["d"]),
+                ("f", []),
+            ]
+        ]
+        manager.load_data({"clusters": clusters})
+        metrics = manager.get_metrics()
+
+        assert "connected_components" not in metrics
+        assert metrics["isolated_clusters"] == 1
+        assert (metrics["min_degree"], metrics["max_degree"]) == (0, 2)
+        assert metrics["avg_degree"] == 1
+        assert manager.get_neighbors("b") == {"a", "c"}
+        assert manager.get_referrers("d") == {"e"}
+
+        manager.merge_clusters("c", "d", "CD")
+        metrics = manager.get_metrics()
+        assert (metrics["min_degree"], metrics["max_degree"]) == (0, 2)
+        assert (metrics["avg_degree"], metrics["isolated_clusters"]) == (1.2, 1)
+        assert len(manager.get_analytics().component_sizes()) == 2
+        assert manager.get_referrers("c") == {"b", "e"}
+        assert manager.get_cluster_by_id("e")["relationships"] == ["c"]
+
+    def test_get_analytics_cached_per_version(self):
+        """Test that graph analytics are rebuilt only when the data changes."""
+        manager = ClusterManager()
+        manager.load_data(
+            {
+                "clusters": [
+                    {"id": "a", "name": "A", "members": [], "relationships": ["b"]},
+                    {"id": "b", "name": "B", "members": [], "relationships": []},
+                    {"id": "c", "name": "C", "members": [], "relationships": []},
+                ]
+            }
+        )
+        analytics = manager.get_analytics()
+        assert manager.get_analytics() is analytics
+        assert len(analytics.component_sizes()) == 2
+
+        manager.merge_clusters("b", "c", "BC")
+        assert manager.get_analytics() is not analytics
+        assert manager.get_analytics().shortest_path("a", "b") == ["a", "b"]
+
+    def test_merge_rewrites_only_referrers(self, monkeypatch):
+        """Test that a merge only rewrites clusters pointing at the removed one,
+        and only indexes the members of the merged cluster again."""
+        manager = ClusterManager()
+        clusters = [
+            {
+                "id": c,
+                "name": c,
+                "members": [
+                    {"id": f"{c}{i}", "name": "x", "metadata": {"k": c}}
+                    for i in range(3)
+                ],
+                "relationships": related,
+            }
+            for c, related in [("a", ["c"]), ("b", []), ("c", []), ("d", ["c"])]
+        ]
+        manager.load_data({"clusters": clusters})
+        indexed = []
+        add = FieldIndex.add
+
+        def counting_add(index, cluster_id, members):
+            indexed.append(cluster_id)
+            add(index, cluster_id, members)
+
+        monkeypatch.setattr(FieldIndex, "add", counting_add)
+        manager.merge_clusters("a", "c", "AC")
+
+        changes = manager.history[-1]["changes"]
+        assert {change[1] for change in changes if change[0] == "set"} == {"a", "d"}
+        assert indexed == ["a"]
+        assert manager.get_cluster_by_id("d")["relationships"] == ["a"]
+        assert manager.get_cluster_by_id("a")["relationships"] == []
+        assert manager.get_referrers("a") == {"d"}
+        assert manager.get_metrics()["total_relationships"] == 1
+        assert manager.search_cluster_ids("ac") == {"a"}
+        assert manager.search_cluster_ids("k:c") == {"a"}
+        assert manager.get_member_owner("d0") == "d"
+
+        manager.undo()
+        assert manager.search_cluster_ids("ac") == set()
+        assert manager.search_cluster_ids("k:c") == {"c"}
+        assert manager.get_referrers("c") == {"a", "d"}
+        assert manager.get_metrics()["total_relationships"] == 2
+
+    def test_get_metrics_follow_operations(self, manager_with_data):
+        """Test that running totals match the data after every operation."""
+
+        def recount():
+            clusters = manager_with_data.data["clusters"]
+            sizes = sorted(len(c["members"]) for c in clusters)
+            return (
+                sum(sizes),
+                sum(len(c["relationships"]) for c in clusters),
+                sizes[0],
+                sizes[-1],
+            )
+
+        def reported():
+            metrics = manager_with_data.get_metrics()
+            return (
+                metrics["total_members"],
+                metrics["total_relationships"],
+                metrics["min_cluster_size"],
+                metrics["max_cluster_size"],
+            )
+
+        manager_with_data.split_cluster("cluster1", ["member1"], "Split")
+        assert reported() == recount()
+        manager_with_data.move_members("cluster2", "cluster1", ["member3"])
+        assert reported() == recount()
+        manager_with_data.merge_clusters("cluster2", "cluster1", "Merged")
+        assert reported() == recount()
+        manager_with_data.undo()
+        manager_with_data.undo()
+        assert reported() == recount()
+
+    def test_load_stream(self, sample_data):
+        """Test loading cluster data from a binary stream."""
+        manager = ClusterManager()
+        stream = io.BytesIO(json.dumps(sample_data).encode("utf-8"))
+        success, message = manager.load_stream(stream)
+
+        assert success is True
+        assert message == "data_loaded"
+        assert manager.data == sample_data
+        assert manager.get_member_by_id("cluster2", "member3") is not None
+
+    def test_load_stream_reports_first_invalid_cluster(self, sample_data):
+        """Test that stream validation errors carry the cluster and offset."""
+        del sample_data["clusters"][1]["members"][0]["name"]
+        document = json.dumps(sample_data)
+        manager = ClusterManager()
+        success, code, params = manager.load_stream(
+            io.BytesIO(document.encode("utf-8"))
+        )
+
+        assert success is False
+        assert code == "member_missing_keys"
+        assert params["i"] == 1
+        assert params["j"] == 0
+        assert document[params["offset"] :].startswith('{"id": "cluster2"')
+
+    def test_load_stream_duplicate_ids(self):
+        """Test that duplicate cluster IDs are detected while streaming."""
+        document = b'{"clusters": [{"id": 1, "name": "a", "members": []},'
+        document += b' {"id": "1", "name": "b", "members": []}]}'
+        success, code, params = ClusterManager().load_stream(io.BytesIO(document))
+
+        assert success is False
+        assert code == "duplicate_ids"
+        assert params["i"] == 1
+
+    def test_load_data_collects_validation_errors(self, sample_data):
+        """Test that every validation problem is kept after a failed load."""
+        del sample_data["clusters"][0]["members"][0]["id"]
+        sample_data["clusters"][1]["members"].append("not a member")
+        manager = ClusterManager()
+        success, code, params = manager.load_data(sample_data)
+
+        assert success is False
+        assert code == "member_missing_keys"
+        assert params == {"i": 0, "j": 0, "member_missing": ["id"]}
+        assert [e.code for e in manager.validation_errors] == [
+            "member_missing_keys",
+            "member_not_object",
+        ]
+
+    def test_load_stream_collect_all(self, sample_data):
+        """Test that load_stream can keep validating after the first error."""
+        sample_data["clusters"][0]["members"] = "not a list"
+        del sample_data["clusters"][1]["name"]
+        stream = io.BytesIO(json.dumps(sample_data).encode("utf-8"))
+        manager = ClusterManager()
+        success, code, params = manager.load_stream(stream, collect_all=True)
+
+        assert success is False
+        assert code == "members_not_array"
+        assert [e.cluster_index for e in manager.validation_errors] == [0, 1]
+        assert manager.data == {"clusters": []}
+
+    def test_load_data_duplicate_member_ids(self, sample_data):
+        """Test that a member id used in two clusters is rejected."""
+        sample_data["clusters"][1]["members"][0]["id"] = "member1"
+        manager = ClusterManager()
+        success, code, params = manager.load_data(sample_data)
+
+        assert success is False
+        assert code == "duplicate_member_ids"
+        assert params["owner"] == "cluster1"
+
+    def test_load_data_resolve_duplicate_member_ids(self, sample_data):
+        """Test that duplicate members can be dropped on load."""
+        sample_data["clusters"][1]["members"].append(
+            {"id": "member2", "name": "Jane Smith (copy)"}
+        )
+        manager = ClusterManager()
+        success, message = manager.load_data(sample_data, resolve_duplicates=True)
+
+        assert success is True
+        assert len(manager.resolved_duplicates) == 1
+        assert len(manager.get_cluster_by_id("cluster2")["members"]) == 1
+        assert manager.get_member_owner("member2") == "cluster1"
+
+    def test_load_stream_duplicate_member_ids(self, sample_data):
+        """Test duplicate member detection while streaming."""
+        sample_data["clusters"][1]["members"][0]["id"] = "member2"
+        document = json.dumps(sample_data).encode("utf-8")
+
+        success, code, params = ClusterManager().load_stream(io.BytesIO(document))
+        assert (success, code, params["i"], params["j"]) == (
+            False,
+            "duplicate_member_ids",
+            1,
+            0,
+        )
+
+        manager = ClusterManager()
+        success, _ = manager.load_stream(io.BytesIO(document), resolve_duplicates=True)
+        assert success is True
+        assert manager.get_cluster_by_id("cluster2")["members"] == []
+
+    def test_member_owner_follows_operations(self, manager_with_data):
+        """Test that the member ownership map follows operations and undo."""
+        assert manager_with_data.get_member_owner("member1") == "cluster1"
+
+        manager_with_data.move_members("cluster1", "cluster2", ["member1"])
+        assert manager_with_data.get_member_owner("member1") == "cluster2"
+
+        manager_with_data.merge_clusters("cluster2", "cluster1", "Merged")
+        assert manager_with_data.get_member_owner("member2") == "cluster2"
+
+        manager_with_data.undo()
+        manager_with_data.undo()
+        assert manager_with_data.get_member_owner("member1") == "cluster1"
+        assert manager_with_data.get_member_owner("member2") == "cluster1"
+
+    def test_move_members_not_in_source(self, manager_with_data):
+        """Test that members held by another cluster are not moved."""
+        success = manager_with_data.move_members("cluster1", "cluster2", ["member3"])
+        assert success is False
+
+    def test_handle_drag_drop_without_source(self, manager_with_data):
+        """Test drag and drop resolving the source cluster from the member."""
+        success = manager_with_data.handle_drag_drop(None, "member3", "cluster1")
+
+        assert success is True
+        assert manager_with_data.get_member_owner("member3") == "cluster1"
+        assert (
+            manager_with_data.handle_drag_drop("cluster2", "member1", "cluster1")
+            is False
+        )
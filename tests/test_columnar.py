@@ -0,0 +1,95 @@
+"""
+Tests for the columnar export and import.
+"""
+
+import copy
+import io
+import zipfile
+
+import pytest
+from app.columnar import (
+    ColumnarFormatError,
+    available_formats,
+    export_archive,
+    member_frame,
+    read_archive,
+    to_frames,
+)
+
+CLUSTERS = [
+    {
+        "id": "c1",
+        "name": "Team 1",
+        "members": [
+            {
+                "id": "m1",
+                "name": "Alice",
+                "metadata": {
+                    "department": "Engineering",
+                    "skills": ["Python", "SQL"],
+                    "level": 3,
+                    "remote": True,
+                    "address": {"city": "Austin", "zip": "78701"},
+                },
+            },
+            {
+                "id": "m2",
+                "name": "Bob",
+                "metadata": {"department": "Sales", "level": 2.5, "tags": [1, "a"]},
+            },
+        ],
+        "relationships": ["c2"],
+    },
+    {"id": "c2", "name": "Team 2", "members": [], "relationships": []},
+]
+
+
+class TestColumnar:
+    """Test cases for the table archive."""
+
+    def test_tables(self):
+        """Test the shape of the clusters, members and relationships tables."""
+        frames, schema = to_frames(CLUSTERS)
+        assert list(frames["clusters"]["id"]) == ["c1", "c2"]
+        assert list(frames["members"]["cluster_id"]) == ["c1", "c1"]
+        assert "metadata.address.city" in frames["members"]
+        assert schema["members"]["metadata.level"] == "float"
+        assert schema["members"]["metadata.tags"] == "json"
+        assert frames["relationships"].values.tolist() == [["c1", "c2"]]
+
+    def test_member_frame(self):
+        """Test the display table of one cluster's members."""
+        cluster = copy.deepcopy(CLUSTERS[0])
+        cluster["members"][1]["metadata"]["name"] = "Robert"
+        frame = member_frame(cluster)
+        assert list(frame.columns[:4]) == ["id", "name", "department", "skills"]
+        assert frame["metadata.name"].isna().tolist() == [True, False]
+        assert frame["address.city"][0] == "Austin"
+        assert frame["skills"][0] == '["Python", "SQL"]'
+        assert member_frame(CLUSTERS[1]).empty
+
+    @pytest.mark.parametrize("fmt", available_formats())
+    def test_round_trip(self, fmt):
+        """Test that every format reads back the same clusters."""
+        expected = copy.deepcopy(CLUSTERS)
+        expected[0]["members"][1]["metadata"]["level"] = 2.5
+        document = read_archive(io.BytesIO(export_archive(CLUSTERS, fmt)))
+        assert document == {"clusters": expected}
+
+    def test_not_an_archive(self):
+        """Test that a file that is not a zip is rejected."""
+        with pytest.raises(ColumnarFormatError) as info:
+            read_archive(io.BytesIO(b"{}"))
+        assert info.value.code == "invalid_archive"
+
+    def test_missing_table(self):
+        """Test that an archive without the members table is rejected."""
+        source = zipfile.ZipFile(io.BytesIO(export_archive(CLUSTERS, "csv")))
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name in source.namelist():
+                if name != "members.csv":
+                    archive.writestr(name, source.read(name))
+        with pytest.raises(ColumnarFormatError) as info:
+            read_archive(io.BytesIO(buffer.getvalue()))
+        assert info.value.params == {"table": "members.csv"}
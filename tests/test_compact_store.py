@@ -0,0 +1,147 @@
+"""
+Tests for the compact cluster store.
+"""
+
+import copy
+
+import pytest
+from app.compact_store import CompactFieldIndex, CompactStore, StringTable
+
+CLUSTERS = [
+    {
+        "id": "c1",
+        "name": "Team 1",
+        "members": [
+            {"id": "m1", "name": "Zoë", "metadata": {"role": "Dev", "level": 2}},
+            {"id": 7, "name": "Bob", "metadata": None, "email": "bob@example.com"},
+        ],
+        "relationships": ["c2"],
+        "color": "red",
+    },
+    {
+        "id": "c2",
+        "name": "Team 2",
+        "members": [{"id": "m3", "name": "Eve"}],
+        "relationships": [],
+    },
+]
+
+
+class TestCompactStore:
+    """Test cases for CompactStore."""
+
+    @pytest.fixture
+    def store(self):
+        """A store holding the two example clusters."""
+        return CompactStore()
+
+    @pytest.fixture
+    def clusters(self, store):
+        """The example clusters in compact form, with owners recorded."""
+        clusters = store.load(copy.deepcopy(CLUSTERS))
+        for cluster in clusters:
+            store.claim(cluster)
+        return clusters
+
+    def test_views_equal_the_document(self, clusters):
+        """Test that clusters and members read back exactly as loaded."""
+        assert clusters == CLUSTERS
+        assert copy.deepcopy(clusters) == CLUSTERS
+        assert type(copy.deepcopy(clusters)[0]["members"][0]) is dict
+
+    def test_member_values(self, clusters):
+        """Test that non-string ids, null metadata and extra keys survive."""
+        bob = clusters[0]["members"][1]
+        assert bob["id"] == 7
+        assert bob["metadata"] is None
+        assert bob["email"] == "bob@example.com"
+        assert "metadata" not in clusters[1]["members"][0]
+        assert clusters[1]["members"][0].get("metadata") is None
+
+    def test_find_and_owner(self, store, clusters):
+        """Test looking up members by id and the cluster holding them."""
+        assert store.find("m3") == 2
+        assert store.find("7") == 1
+        assert store.find("missing") is None
+        assert store.owner_of("m1") == "c1"
+        assert store.member(clusters[1], "m3")["name"] == "Eve"
+        assert store.member(clusters[1], "m1") is None
+
+    def test_move_members(self, store, clusters):
+        """Test that moving a member is a write to the membership arrays."""
+        source, target = clusters
+        store.release(source)
+        target["members"].extend(source["members"][:1])
+        source["members"] = source["members"][1:]
+        store.claim(source)
+        store.claim(target)
+        assert [m["id"] for m in target["members"]] == ["m3", "m1"]
+        assert store.owner_of("m1") == "c2"
+        assert len(store) == 3
+
+    def test_new_members_are_added(self, store, clusters):
+        """Test that members given as dicts get a number of their own."""
+        clusters[1]["members"].append({"id": "m4", "name": "New"})
+        store.claim(clusters[1])
+        assert store.find("m4") == 3
+        assert store.owner_of("m4") == "c2"
+
+    def test_string_table(self):
+        """Test that strings are stored and appended by number."""
+        table = StringTable(["a", "", "ünïcode"])
+        assert table.append("x") == 3
+        assert [table[i] for i in range(len(table))] == ["a", "", "ünïcode", "x"]
+
+
+class TestCompactFieldIndex:
+    """Test cases for CompactFieldIndex."""
+
+    @pytest.fixture
+    def store(self):
+        """An empty store."""
+        return CompactStore()
+
+    @pytest.fixture
+    def clusters(self, store):
+        """The example clusters in compact form, with owners recorded."""
+        clusters = store.load(copy.deepcopy(CLUSTERS))
+        for cluster in clusters:
+            store.claim(cluster)
+        return clusters
+
+    @pytest.fixture
+    def index(self, store, clusters):
+        """A CompactFieldIndex of the example clusters."""
+        index = CompactFieldIndex(store)
+        for cluster in clusters:
+            index.add(cluster["id"], cluster["members"])
+        return index
+
+    def test_postings_are_member_numbers(self, index, clusters):
+        """Test that postings hold member numbers, each member indexed once."""
+        index.add("c1", clusters[0]["members"])
+        assert index._postings["role"]["dev"].tolist() == [0]
+        assert index.match([("role", "DEV")]) == {("c1", "m1")}
+        assert index.facet_counts("role") == [("Dev", 1)]
+        assert index.fields == ["level", "role"]
+
+    def test_owners_come_from_the_store(self, store, clusters, index):
+        """Test that matches follow the store as members move and leave."""
+        source, target = clusters
+        for cluster in clusters:
+            index.remove(cluster["id"], cluster["members"])
+            store.release(cluster)
+        target["members"].extend(source["members"][:1])
+        source["members"] = source["members"][1:]
+        for cluster in clusters:
+            store.claim(cluster)
+            index.add(cluster["id"], cluster["members"])
+        assert index.match([("role", "dev"), ("level", "2")]) == {("c2", "m1")}
+        assert index.facet_counts("level") == [("2", 1)]
+
+        index.remove("c2", target["members"])
+        store.release(target)
+        assert index.match([("role", "dev")]) == set()
+        assert index.facet_counts("role") == []
+        assert index.fields == []
+        assert index.parse_query("role:dev") == ([], "role:dev")
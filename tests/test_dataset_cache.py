@@ -0,0 +1,42 @@
+"""
+Tests for the process-wide cache of loaded datasets.
+"""
+
+import io
+
+from app.dataset_cache import DatasetCache, content_hash
+
+
+class TestDatasetCache:
+    """Test cases for DatasetCache."""
+
+    def test_content_hash(self):
+        """Test that the hash depends on content only and rewinds the stream."""
+        stream = io.BytesIO(b"abc")
+        digest, size = content_hash(stream)
+        assert size == 3
+        assert stream.tell() == 0
+        assert content_hash(io.BytesIO(b"abc"))[0] == digest
+        assert content_hash(io.BytesIO(b"abd"))[0] != digest
+
+    def test_get_and_put(self):
+        """Test hits, misses and replacing an entry."""
+        cache = DatasetCache()
+        assert cache.get("a") is None
+        cache.put("a", 1, 10)
+        cache.put("a", 2, 20)
+        assert cache.get("a") == 2
+        assert cache.stats() == {"entries": 1, "bytes": 20, "hits": 1, "misses": 1}
+
+    def test_lru_eviction_by_size(self):
+        """Test that the least recently used datasets are evicted first."""
+        cache = DatasetCache(max_bytes=100)
+        cache.put("a", "A", 40)
+        cache.put("b", "B", 40)
+        cache.get("a")
+        cache.put("c", "C", 40)
+        assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("A", None, "C")
+
+        cache.put("huge", "H", 500)
+        assert len(cache) == 1
+        assert cache.get("huge") == "H"
@@ -0,0 +1,66 @@
+"""
+Tests for the streaming JSON export.
+"""
+
+import gzip
+import io
+import json
+
+from app.export import export_json, iter_json, write_json
+
+DATA = {
+    "clusters": [
+        {
+            "id": f"c{i}",
+            "name": f"Cluster {i} ✓",
+            "members": [{"id": f"m{i}_{j}", "name": "Ann"} for j in range(20)],
+            "relationships": [],
+        }
+        for i in range(50)
+    ]
+}
+
+
+class TestExport:
+    """Test cases for the export functions."""
+
+    def test_indented_matches_json_dumps(self):
+        """Test that the default output is what json.dumps(indent=2) gives."""
+        assert export_json(DATA) == json.dumps(DATA, indent=2).encode("utf-8")
+
+    def test_other_top_level_keys(self):
+        """Test documents with extra keys, nested values and no clusters."""
+        for data in (
+            {"version": 2, "clusters": DATA["clusters"][:2], "meta": {"a": [1, {}]}},
+            {"clusters": []},
+            {"clusters": [{}], "x": []},
+            [1, 2],
+        ):
+            assert export_json(data) == json.dumps(data, indent=2).encode("utf-8")
+            compact = json.dumps(data, separators=(",", ":")).encode("utf-8")
+            assert export_json(data, compact=True) == compact
+
+    def test_compact(self):
+        """Test that compact output has no optional whitespace."""
+        output = export_json(DATA, compact=True)
+        assert output == json.dumps(DATA, separators=(",", ":")).encode("utf-8")
+        assert len(output) < len(export_json(DATA))
+
+    def test_chunks(self):
+        """Test that output is produced in several bounded chunks."""
+        chunks = list(iter_json(DATA, chunk_size=1024))
+        assert len(chunks) > 10
+        assert all(len(chunk) < 4096 for chunk in chunks)
+        assert json.loads(b"".join(chunks)) == DATA
+
+    def test_gzip(self):
+        """Test that compressed output decompresses to the same document."""
+        output = export_json(DATA, compress=True)
+        assert json.loads(gzip.decompress(output)) == DATA
+        assert output == export_json(DATA, compress=True)
+
+    def test_write_to_stream(self):
+        """Test writing straight into a binary stream."""
+        stream = io.BytesIO()
+        write_json(DATA, stream, compact=True)
+        assert json.loads(stream.getvalue()) == DATA
@@ -0,0 +1,82 @@
+"""
+Tests for the incremental cluster JSON reader.
+"""
+
+import io
+import json
+import pytest
+from app.json_stream import ClusterStream, StreamFormatError
+
+
+def read_all(document, chunk_size=7):
+    """Return the (offset, cluster) pairs and extra keys read from a document."""
+    if isinstance(document, str):
+        document = document.encode("utf-8")
+    reader = ClusterStream(io.BytesIO(document), chunk_size=chunk_size)
+    return list(reader), reader.extra
+
+
+class TestClusterStream:
+    """Test cases for ClusterStream functionality."""
+
+    def test_yields_clusters_across_chunks(self):
+        """Test that clusters split over many chunks are decoded intact."""
+        clusters = [
+            {"id": f"c{i}", "name": f"Cluster {i} – ünïcode", "members": [i, 1.5e3]}
+            for i in range(20)
+        ]
+        document = json.dumps({"version": 2, "clusters": clusters, "tail": [True]})
+
+        items, extra = read_all(document)
+
+        assert [cluster for _, cluster in items] == clusters
+        assert extra == {"version": 2, "clusters": None, "tail": [True]}
+
+    def test_offsets_point_at_clusters(self):
+        """Test that offsets are character positions in the document."""
+        document = '{"clusters": [ {"id": 1},\n  {"id": 2} ]}'
+        items, _ = read_all(document, chunk_size=3)
+
+        for offset, cluster in items:
+            assert json.JSONDecoder().raw_decode(document, offset)[0] == cluster
+
+    def test_number_at_chunk_boundary(self):
+        """Test that numbers cut by a chunk boundary are not truncated."""
+        items, _ = read_all('{"clusters": [12345678]}', chunk_size=16)
+        assert [cluster for _, cluster in items] == [12345678]
+
+    def test_empty_clusters(self):
+        """Test a document with an empty clusters array."""
+        items, extra = read_all('{"clusters": []}')
+        assert items == []
+        assert extra == {"clusters": None}
+
+    @pytest.mark.parametrize(
+        "document, code",
+        [
+            ("[1, 2]", "invalid_json"),
+            ('{"data": []}', "missing_clusters"),
+            ('{"clusters": "x"}', "clusters_not_array"),
+            ('{"clusters": [{"id": 1} {"id": 2}]}', "invalid_json_file"),
+            ('{"clusters": [{"id": 1}', "invalid_json_file"),
+            ('{"clusters": []} []', "invalid_json_file"),
+            ("", "invalid_json_file"),
+        ],
+    )
+    def test_format_errors(self, document, code):
+        """Test that malformed documents raise the matching error code."""
+        with pytest.raises(StreamFormatError) as error:
+            read_all(document)
+        assert error.value.code == code
+
+    def test_stops_at_first_syntax_error(self):
+        """Test that clusters before a syntax error are yielded first."""
+        reader = ClusterStream(
+            io.BytesIO(b'{"clusters": [{"id": 1}, {"id": 2,}, {"id": 3}]}'),
+            chunk_size=4,
+        )
+        iterator = iter(reader)
+        assert next(iterator)[1] == {"id": 1}
+        with pytest.raises(StreamFormatError) as error:
+            next(iterator)
+        assert "(char 34)" in error.value.params["e"]
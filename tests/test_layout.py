@@ -0,0 +1,91 @@
+"""
+Tests for the cluster graph layout.
+"""
+
+import numpy as np
+import pytest
+from app.layout import GraphLayout, force_layout, pack_slots
+
+
+def make_clusters(n, group=5):
+    """n clusters related to the next one in their group of size group."""
+    return [
+        {
+            "id": f"c{i}",
+            "relationships": [f"c{i + 1}"] if (i + 1) % group and i + 1 < n else [],
+        }
+        for i in range(n)
+    ]
+
+
+class TestForceLayout:
+    """Test cases for force_layout and pack_slots."""
+
+    def test_related_nodes_end_up_closer(self):
+        """Test that edges are shorter than the average distance."""
+        sources = np.arange(0, 99)
+        targets = sources + 1
+        pos = force_layout(100, sources, targets)
+        edge = np.linalg.norm(pos[sources] - pos[targets], axis=1).mean()
+        pairs = np.linalg.norm(pos[:, None] - pos[None], axis=2).mean()
+        assert edge < pairs / 3
+
+    def test_pinned_nodes_do_not_move(self):
+        """Test that pinned nodes keep their initial position."""
+        initial = np.random.default_rng(1).uniform(0, 5, size=(20, 2))
+        pinned = np.arange(20) < 10
+        pos = force_layout(20, np.array([0]), np.array([15]), initial, pinned)
+        assert np.array_equal(pos[:10], initial[:10])
+        assert not np.array_equal(pos[10:], initial[10:])
+
+    @pytest.mark.parametrize("n", [0, 1, 2, 7, 100, 1001])
+    def test_pack_slots_unique(self, n):
+        """Test that every node gets a slot of its own."""
+        pos = np.random.default_rng(n).normal(size=(n, 2))
+        slots = pack_slots(pos, 1.5)
+        assert len({tuple(slot) for slot in slots}) == n
+        assert (slots >= 0).all()
+
+    def test_pack_slots_keeps_order(self):
+        """Test that left-to-right order survives packing on a line."""
+        pos = np.column_stack([np.arange(10.0)[::-1], np.zeros(10)])
+        slots = pack_slots(pos, 0.01)
+        assert (slots[:, 1] == 0).all()
+        assert (np.diff(slots[:, 0]) < 0).all()
+
+
+class TestGraphLayout:
+    """Test cases for GraphLayout."""
+
+    def test_positions_cover_all_clusters(self):
+        """Test that every cluster gets a distinct position."""
+        clusters = make_clusters(50)
+        positions = GraphLayout().positions(clusters)
+        assert set(positions) == {c["id"] for c in clusters}
+        assert len(set(positions.values())) == 50
+
+    def test_cached_positions_are_stable(self):
+        """Test that known clusters keep their position when one is added."""
+        clusters = make_clusters(50)
+        layout = GraphLayout()
+        before = dict(layout.positions(clusters))
+        clusters.append({"id": "new", "relationships": ["c0"]})
+        after = layout.positions(clusters)
+        assert all(after[cid] == pos for cid, pos in before.items())
+        assert after["new"] not in before.values()
+
+    def test_removed_clusters_are_dropped(self):
+        """Test that positions of removed clusters are forgotten."""
+        clusters = make_clusters(10)
+        layout = GraphLayout()
+        before = dict(layout.positions(clusters))
+        after = layout.positions(clusters[1:])
+        assert "c0" not in after
+        assert after["c1"] == before["c1"]
+
+    def test_clear_lays_out_again(self):
+        """Test that clear forgets the cached positions."""
+        layout = GraphLayout()
+        layout.positions(make_clusters(10))
+        layout.clear()
+        assert set(layout.positions(make_clusters(3))) == {"c0", "c1", "c2"}
@@ -0,0 +1,26 @@
+"""
+Tests for error message formatting.
+"""
+
+from app.messages import ERROR_MESSAGES, format_error
+
+
+class TestFormatError:
+    """Test cases for format_error."""
+
+    def test_cluster_and_member_positions_are_one_based(self):
+        """Test that zero-based positions are shown one-based."""
+        message = format_error(
+            "member_missing_keys", {"i": 0, "j": 2, "member_missing": ["id", "name"]}
+        )
+        assert message == "❌ Cluster 1, Member 3 missing: id, name"
+
+    def test_offset_is_appended(self):
+        """Test that stream offsets are appended to the message."""
+        message = format_error("cluster_not_object", {"i": 4, "offset": 120})
+        assert message.endswith("Cluster 5 is not a valid object (at character 120)")
+
+    def test_code_without_params(self):
+        """Test codes that take no parameters."""
+        assert format_error("duplicate_ids") == ERROR_MESSAGES["duplicate_ids"]
+        assert format_error("unknown_code") == "unknown_code"
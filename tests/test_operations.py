@@ -0,0 +1,79 @@
+"""
+Tests for checking batches of operations.
+"""
+
+from app.operations import operations_from_document, validate_operations
+
+
+class TestValidateOperations:
+    """Test cases for validate_operations."""
+
+    def test_valid_batch(self):
+        """Test that a batch using clusters as they come and go is accepted."""
+        operations = [
+            {"op": "split", "cluster": "a", "members": ["m1"], "name": "N", "id": "n"},
+            {"op": "move", "source": "b", "target": "n", "members": ["m2"]},
+            {"op": "merge", "cluster1": "a", "cluster2": "b", "name": "AB"},
+        ]
+        assert validate_operations(operations, {"a", "b"}) == []
+
+    def test_form_errors(self):
+        """Test that malformed operations are reported by number."""
+        operations = [
+            "move",
+            {"op": "rename"},
+            {"op": "move", "source": "a"},
+            {"op": "split", "cluster": "a", "members": [], "name": "N"},
+        ]
+        errors = validate_operations(operations, {"a"})
+        assert [e.code for e in errors] == [
+            "operation_not_object",
+            "unknown_operation",
+            "operation_missing_keys",
+            "operation_members_not_array",
+        ]
+        assert errors[2].params["missing_keys"] == ["target", "members"]
+        assert [e.params["number"] for e in errors] == [1, 2, 3, 4]
+
+    def test_cluster_removed_by_merge(self):
+        """Test that a cluster merged away cannot be used afterwards."""
+        operations = [
+            {"op": "merge", "cluster1": "a", "cluster2": "b", "name": "AB"},
+            {"op": "move", "source": "b", "target": "a", "members": ["m"]},
+        ]
+        (error,) = validate_operations(operations, {"a", "b"})
+        assert error.code == "operation_unknown_cluster"
+        assert error.params == {"number": 2, "op": "move", "id": "b"}
+
+    def test_same_cluster_and_existing_id(self):
+        """Test merging a cluster with itself and reusing an id."""
+        operations = [
+            {"op": "merge", "cluster1": "a", "cluster2": "a", "name": "A"},
+            {"op": "split", "cluster": "a", "members": ["m"], "name": "N", "id": "b"},
+        ]
+        errors = validate_operations(operations, {"a", "b"})
+        assert [e.code for e in errors] == [
+            "operation_same_cluster",
+            "operation_cluster_exists",
+        ]
+
+    def test_operations_from_document(self):
+        """Test the accepted file layouts."""
+        operation = {"op": "merge", "cluster1": "a", "cluster2": "b", "name": "AB"}
+        assert operations_from_document([operation]) == ([operation], [])
+        assert operations_from_document({"operations": [operation]})[0] == [operation]
+        assert operations_from_document({})[1][0].code == "operations_not_array"
+        assert operations_from_document([])[1][0].code == "no_operations"
+
+    def test_reassign(self):
+        """Test that reassign targets must exist and assignments be an object."""
+        operations = [
+            {"op": "reassign", "assignments": {"m1": "a", "m2": "a"}},
+            {"op": "reassign", "assignments": {"m1": "x"}},
+            {"op": "reassign", "assignments": ["m1"]},
+        ]
+        errors = validate_operations(operations, {"a"})
+        assert [(e.code, e.params["number"]) for e in errors] == [
+            ("operation_unknown_cluster", 2),
+            ("operation_assignments_not_object", 3),
+        ]
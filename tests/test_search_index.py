@@ -0,0 +1,173 @@
+"""
+Tests for the SearchIndex class.
+"""
+
+import pytest
+from app.search_index import FieldIndex, SearchIndex
+
+
+class TestSearchIndex:
+    """Test cases for SearchIndex functionality."""
+
+    @pytest.fixture
+    def index(self):
+        """SearchIndex with a few indexed clusters."""
+        index = SearchIndex()
+        index.add("c1", ["Development Team", "Alice Johnson", "Bob Chen"])
+        index.add("c2", ["Design Team", "Diana Garcia"])
+        index.add("c3", ["QA", "Bo Li"])
+        return index
+
+    def test_substring_match(self, index):
+        """Test matching a substring inside a token."""
+        assert index.search("velop") == {"c1"}
+
+    def test_case_insensitive(self, index):
+        """Test that queries and names are compared lowercased."""
+        assert index.search("TEAM") == {"c1", "c2"}
+
+    def test_query_spanning_tokens(self, index):
+        """Test matching a query that spans a space."""
+        assert index.search("ice joh") == {"c1"}
+        assert index.search("alice chen") == set()
+
+    def test_short_query(self, index):
+        """Test queries shorter than the n-gram size."""
+        assert index.search("bo") == {"c1", "c3"}
+        assert index.search("qa") == {"c3"}
+
+    def test_remove(self, index):
+        """Test that removed clusters are no longer returned."""
+        index.remove("c1")
+        assert index.search("team") == {"c2"}
+        assert len(index) == 2
+
+    def test_rename(self, index):
+        """Test that renaming keeps n-grams still used by member names."""
+        index.rename("c3", "QA", "Bob's QA")
+        assert index.search("bob's") == {"c3"}
+        index.rename("c1", "Development Team", "Bobcats")
+        assert index.search("velop") == set()
+        assert index.search("team") == {"c2"}
+        assert index.search("bob") == {"c1", "c3"}
+        assert index.search("chen") == {"c1"}
+
+    def test_re_add_replaces_names(self, index):
+        """Test that adding an indexed cluster again replaces its names."""
+        index.add("c2", ["Marketing"])
+        assert index.search("design") == set()
+        assert index.search("market") == {"c2"}
+
+    def test_layer(self, index):
+        """Test that a layer changes what it finds and leaves its base alone."""
+        layer = index.layer()
+        layer.rename("c1", "Development Team", "Platform")
+        layer.remove("c2")
+        layer.add("c4", ["Design Ops"])
+        assert layer.search("team") == set()
+        assert layer.search("bo") == {"c1", "c3"}
+        assert layer.search("design") == {"c4"}
+        assert len(layer) == 3
+        assert index.search("team") == {"c1", "c2"}
+        assert len(index) == 3
+
+
+class TestFieldIndex:
+    """Test cases for FieldIndex functionality."""
+
+    @pytest.fixture
+    def index(self):
+        """FieldIndex with a few indexed members."""
+        index = FieldIndex()
+        index.add(
+            "c1",
+            [
+                {
+                    "id": "m1",
+                    "name": "Alice",
+                    "metadata": {"department": "Engineering", "skills": ["Python"]},
+                },
+                {
+                    "id": "m2",
+                    "name": "Bob",
+                    "metadata": {"department": "Engineering", "skills": ["Go"]},
+                },
+            ],
+        )
+        index.add(
+            "c2",
+            [
+                {
+                    "id": "m3",
+                    "name": "Carol",
+                    "metadata": {
+                        "department": "Design",
+                        "skills": ["Python"],
+                        "office": {"city": "Austin"},
+                    },
+                },
+            ],
+        )
+        return index
+
+    def test_parse_query(self, index):
+        """Test splitting indexed field filters from free text."""
+        filters, text = index.parse_query(
+            'skills:python alice unknown:x office.city:"Austin"'
+        )
+        assert filters == [("skills", "python"), ("office.city", "Austin")]
+        assert text.split() == ["alice", "unknown:x"]
+
+    def test_match_requires_every_filter_on_one_member(self, index):
+        """Test that filters are combined per member."""
+        assert index.match([("department", "engineering"), ("skills", "Python")]) == {
+            ("c1", "m1")
+        }
+        assert index.match([("department", "Design"), ("skills", "Go")]) == set()
+
+    def test_facet_counts(self, index):
+        """Test member counts per field value."""
+        assert index.facet_counts("department") == [("Engineering", 2), ("Design", 1)]
+        assert index.facet_counts("skills", limit=1) == [("Python", 2)]
+
+    def test_remove(self, index):
+        """Test that removed members no longer count towards facets."""
+        members = [
+            {
+                "id": "m3",
+                "name": "Carol",
+                "metadata": {
+                    "department": "Design",
+                    "skills": ["Python"],
+                    "office": {"city": "Austin"},
+                },
+            }
+        ]
+        index.remove("c2", members)
+
+        assert index.facet_counts("department") == [("Engineering", 2)]
+        assert index.facet_counts("skills") == [("Go", 1), ("Python", 1)]
+        assert "office.city" not in index.fields
+
+    def test_layer(self, index):
+        """Test that a layer counts and matches its own members over the base."""
+        layer = index.layer()
+        carol = {
+            "id": "m3",
+            "name": "Carol",
+            "metadata": {
+                "department": "Design",
+                "skills": ["Python"],
+                "office": {"city": "Austin"},
+            },
+        }
+        layer.remove("c2", [carol])
+        layer.add(
+            "c3", [{"id": "m4", "name": "Dan", "metadata": {"department": "Design"}}]
+        )
+        assert layer.facet_counts("department") == [("Engineering", 2), ("Design", 1)]
+        assert layer.facet_counts("skills") == [("Go", 1), ("Python", 1)]
+        assert layer.match([("department", "design")]) == {("c3", "m4")}
+        assert "office.city" not in layer.fields
+        assert index.match([("department", "design")]) == {("c2", "m3")}
+        assert "office.city" in index.fields
@@ -0,0 +1,121 @@
+"""
+Tests for cluster document validation.
+"""
+
+import pytest
+from app.validation import (
+    ValidationError,
+    drop_duplicate_members,
+    index_members,
+    validate_document,
+)
+
+
+def make_document(clusters=3, members=2):
+    return {
+        "clusters": [
+            {
+                "id": f"c{i}",
+                "name": f"Cluster {i}",
+                "members": [{"id": f"m{i}_{j}", "name": "x"} for j in range(members)],
+            }
+            for i in range(clusters)
+        ]
+    }
+
+
+class TestValidateDocument:
+    """Test cases for validate_document."""
+
+    def test_valid_document(self):
+        """Test that a valid document has no errors."""
+        assert validate_document(make_document()) == []
+
+    @pytest.mark.parametrize(
+        "document, code",
+        [
+            ([], "invalid_json"),
+            ({}, "missing_clusters"),
+            ({"clusters": {}}, "clusters_not_array"),
+            ({"clusters": []}, "no_clusters"),
+        ],
+    )
+    def test_document_errors(self, document, code):
+        """Test errors about the document structure."""
+        assert validate_document(document) == [ValidationError(code)]
+
+    def test_collects_every_error(self):
+        """Test that all problems are reported with their location."""
+        document = make_document(clusters=5)
+        document["clusters"][0]["members"][1] = "not a member"
+        document["clusters"][1]["members"][0].pop("name")
+        document["clusters"][2].pop("members")
+        document["clusters"][3]["members"] = {}
+        document["clusters"][4]["id"] = "c0"
+
+        errors = validate_document(document)
+
+        assert [(e.code, e.cluster_index, e.member_index) for e in errors] == [
+            ("member_not_object", 0, 1),
+            ("member_missing_keys", 1, 0),
+            ("missing_keys", 2, None),
+            ("members_not_array", 3, None),
+            ("duplicate_ids", 4, None),
+        ]
+        assert errors[1].params == {"i": 1, "j": 0, "member_missing": ["name"]}
+
+    def test_first_error_only(self):
+        """Test that collect_all=False stops at the first problem."""
+        document = make_document()
+        document["clusters"][1]["members"].append(1)
+        document["clusters"][2]["members"].append(2)
+
+        errors = validate_document(document, collect_all=False)
+        assert errors == [ValidationError("member_not_object", 1, 2, {"i": 1, "j": 2})]
+        assert errors[0].as_result() == (
+            False,
+            "member_not_object",
+            {"i": 1, "j": 2},
+        )
+
+    def test_parallel_chunks(self):
+        """Test that chunked validation in worker processes finds the same errors."""
+        document = make_document(clusters=30)
+        document["clusters"][7]["members"][0] = None
+        document["clusters"][22] = "not a cluster"
+
+        serial = validate_document(document)
+        parallel = validate_document(document, workers=2, chunk_size=10)
+        assert parallel == serial
+        assert [e.cluster_index for e in parallel] == [7, 22]
+
+    def test_duplicate_member_ids(self):
+        """Test that member ids used twice are reported after the first use."""
+        document = make_document(clusters=3)
+        document["clusters"][2]["members"][1]["id"] = "m0_0"
+        document["clusters"][0]["members"][1]["id"] = "m0_0"
+
+        errors = validate_document(document)
+
+        assert [(e.code, e.cluster_index, e.member_index) for e in errors] == [
+            ("duplicate_member_ids", 0, 1),
+            ("duplicate_member_ids", 2, 1),
+        ]
+        assert errors[1].params["owner"] == "c0"
+        assert validate_document(document, check_member_ids=False) == []
+
+
+class TestIndexMembers:
+    """Test cases for index_members and drop_duplicate_members."""
+
+    def test_owner_map_and_resolution(self):
+        """Test that the owner map keeps first occurrences."""
+        clusters = make_document(clusters=2)["clusters"]
+        clusters[1]["members"][0]["id"] = "m0_1"
+
+        owners, duplicates = index_members(clusters)
+        assert owners == {"m0_0": "c0", "m0_1": "c0", "m1_1": "c1"}
+
+        drop_duplicate_members(clusters, duplicates)
+        assert [m["id"] for m in clusters[1]["members"]] == ["m1_1"]
+        assert index_members(clusters)[1] == []
@@ -0,0 +1,52 @@
+"""
+Tests for the ViewCache class.
+"""
+
+from app.view_cache import ViewCache
+
+
+class TestViewCache:
+    """Test cases for ViewCache functionality."""
+
+    def test_hit_and_miss(self):
+        """Test that a value is computed once per key and version."""
+        cache = ViewCache()
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)  # noqa: E731
+        assert cache.get("metrics", 1, compute) == 1
+        assert cache.get("metrics", 1, compute) == 1
+        assert cache.get(("search", "dev"), 1, compute) == 2
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 2
+
+    def test_new_version_drops_entries(self):
+        """Test that values are recomputed after the version changes."""
+        cache = ViewCache()
+        cache.get("metrics", 1, lambda: "old")
+        cache.get("options", 1, lambda: "old")
+        assert cache.get("metrics", 2, lambda: "new") == "new"
+        assert len(cache) == 1
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first."""
+        cache = ViewCache(max_entries=2)
+        cache.get("a", 1, lambda: "a")
+        cache.get("b", 1, lambda: "b")
+        cache.get("a", 1, lambda: "a")
+        cache.get("c", 1, lambda: "c")
+        assert cache.get("a", 1, lambda: "recomputed") == "a"
+        assert cache.get("b", 1, lambda: "recomputed") == "recomputed"
+
+    def test_clear(self):
+        """Test that clear empties the cache and resets the counters."""
+        cache = ViewCache()
+        cache.get("a", 1, lambda: "a")
+        cache.get("a", 1, lambda: "a")
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.stats() == {
+            "hits": 0,
+            "misses": 0,
+            "hit_rate": 0.0,
+            "entries": 0,
+        }
@@ -0,0 +1,142 @@
+"""
+Tests for planning the virtualized flow view.
+"""
+
+import pytest
+from streamlit_flow.elements import StreamlitFlowEdge, StreamlitFlowNode
+
+from app.visualization import (
+    diff_flow,
+    flow_signatures,
+    grid_position,
+    patch_flow_elements,
+    plan_flow_view,
+    viewport_around,
+)
+
+
+class TestPlanFlowView:
+    """Test cases for plan_flow_view."""
+
+    @pytest.fixture
+    def clusters(self):
+        """Nine clusters of ten members on the default grid."""
+        return [
+            {
+                "id": f"c{i}",
+                "name": f"Cluster {i}",
+                "members": [{"id": f"m{i}_{j}", "name": f"M {j}"} for j in range(10)],
+            }
+            for i in range(9)
+        ]
+
+    @pytest.fixture
+    def positions(self, clusters):
+        """Grid positions of the clusters."""
+        return [grid_position(i) for i in range(len(clusters))]
+
+    def test_collapsed_by_default(self, clusters, positions):
+        """Test that clusters are drawn without members when nothing is open."""
+        views = plan_flow_view(clusters, positions, set(), node_budget=100)
+        assert [v.cluster["id"] for v in views] == [c["id"] for c in clusters]
+        assert all(v.members == [] and v.hidden_members == 10 for v in views)
+
+    def test_expanded_cluster_shows_members(self, clusters, positions):
+        """Test that an expanded cluster gets its member nodes."""
+        views = plan_flow_view(clusters, positions, {"c4"}, node_budget=100)
+        assert len(views[4].members) == 10
+        assert views[4].hidden_members == 0
+        assert all(not v.members for i, v in enumerate(views) if i != 4)
+
+    def test_viewport_expands_visible_clusters(self, clusters, positions):
+        """Test that clusters inside the viewport are drawn with members."""
+        viewport = viewport_around(grid_position(0), (100, 100))
+        views = plan_flow_view(clusters, positions, set(), viewport, node_budget=100)
+        assert [v.index for v in views if v.members] == [0]
+
+    def test_member_budget(self, clusters, positions):
+        """Test that members beyond the node budget are counted as hidden."""
+        views = plan_flow_view(clusters, positions, {"c0", "c1"}, node_budget=24)
+        assert len(views[0].members) == 10
+        assert len(views[1].members) == 5
+        assert views[1].hidden_members == 5
+
+    def test_cluster_budget_prefers_expanded_and_priority(self, clusters, positions):
+        """Test that the clusters kept under a tight budget are ranked."""
+        views = plan_flow_view(
+            clusters, positions, {"c8"}, node_budget=6, priority={"c5"}
+        )
+        assert [v.cluster["id"] for v in views] == ["c0", "c5", "c8"]
+        assert len(views[-1].members) == 3
+
+    def test_unbounded(self, clusters, positions):
+        """Test that without a budget every expanded cluster shows all members."""
+        expanded = {c["id"] for c in clusters}
+        views = plan_flow_view(clusters, positions, expanded)
+        assert sum(len(v.members) for v in views) == 90
+
+
+def make_nodes(labels, positions=None):
+    """Flow nodes n0, n1, ... with the given labels."""
+    return [
+        StreamlitFlowNode(
+            f"n{i}", positions[i] if positions else (i * 10, 0), {"label": label}
+        )
+        for i, label in enumerate(labels)
+    ]
+
+
+class TestFlowDiff:
+    """Test cases for diffing and patching flow elements."""
+
+    def test_no_changes(self):
+        """Test that identical renders produce an empty diff."""
+        before = flow_signatures(make_nodes(["a", "b"]))
+        after = flow_signatures(make_nodes(["a", "b"]))
+        assert not diff_flow(before, after)
+
+    def test_added_removed_changed_moved(self):
+        """Test that each kind of difference is reported by id."""
+        before = flow_signatures(make_nodes(["a", "b", "c"]))
+        after = flow_signatures(make_nodes(["a", "B"], positions=[(5, 5), (10, 0)]))
+        diff = diff_flow(before, after)
+        assert diff.added == set()
+        assert diff.removed == {"n2"}
+        assert diff.changed == {"n1"}
+        assert diff.moved == {"n0"}
+
+    def test_dragged_position_is_ignored(self):
+        """Test that positions set by the browser do not count as changes."""
+        nodes = make_nodes(["a"])
+        before = flow_signatures(nodes)
+        nodes[0].position = {"x": 500, "y": 500}
+        nodes[0].selected = True
+        assert flow_signatures(nodes) != before
+        assert not diff_flow(before, flow_signatures(make_nodes(["a"])))
+
+    def test_patch_keeps_unchanged_objects(self):
+        """Test that unchanged elements keep the object from the old state."""
+        old = make_nodes(["a", "b"])
+        old[0].position = {"x": 500, "y": 500}
+        old[1].position = {"x": 600, "y": 600}
+        new = make_nodes(["a", "B", "c"])
+        diff = diff_flow(flow_signatures(make_nodes(["a", "b"])), flow_signatures(new))
+        patched = patch_flow_elements(old, new, diff)
+        assert patched[0] is old[0]
+        assert patched[1].data == new[1].data
+        assert patched[1].position == {"x": 600, "y": 600}
+        assert new[1].position == {"x": 10, "y": 0}
+        assert patched[2] is new[2]
+
+    def test_patch_applies_moves(self):
+        """Test that elements moved by the layout take their new position."""
+        old = make_nodes(["a"])
+        new = make_nodes(["a"], positions=[(40, 40)])
+        diff = diff_flow(flow_signatures(old), flow_signatures(new))
+        assert patch_flow_elements(old, new, diff)[0].position == {"x": 40, "y": 40}
+
+    def test_edges(self):
+        """Test that edges are diffed by content."""
+        before = flow_signatures([StreamlitFlowEdge("e", "a", "b")])
+        after = flow_signatures([StreamlitFlowEdge("e", "a", "c")])
+        assert diff_flow(before, after).changed == {"e"}
@@ -0,0 +1,88 @@
+"""
+Tests for workbenches saved in SQLite files.
+"""
+
+import pytest
+
+from app.workbench_db import WorkbenchDB, WorkbenchLockedError
+
+
+def cluster(cluster_id, members=()):
+    return {
+        "id": cluster_id,
+        "name": cluster_id.upper(),
+        "members": [{"id": m, "name": m} for m in members],
+        "relationships": [],
+    }
+
+
+class TestWorkbenchDB:
+    """Test cases for WorkbenchDB."""
+
+    def test_write_all_and_load(self, tmp_path):
+        """Test that a saved document is loaded back as it was."""
+        path = str(tmp_path / "w.db")
+        db = WorkbenchDB(path)
+        assert db.is_empty()
+        data = {"version": 2, "clusters": [cluster("b", ["m1"]), cluster("a")]}
+        db.write_all(data)
+        db.close()
+
+        db = WorkbenchDB(path)
+        assert not db.is_empty()
+        assert len(db) == 2
+        assert db.load() == data
+        assert db.facets() is None
+        db.write_all(data, {"limit": 5, "counts": {}})
+        assert db.facets() == {"limit": 5, "counts": {}}
+
+    def test_one_writer(self, tmp_path):
+        """Test that a file can only be open once until it is closed."""
+        path = str(tmp_path / "w.db")
+        db = WorkbenchDB(path)
+        with pytest.raises(WorkbenchLockedError):
+            WorkbenchDB(path)
+        db.close()
+        WorkbenchDB(path).close()
+
+    def test_update_writes_touched_rows(self, tmp_path):
+        """Test that updates keep order, add, change and delete rows."""
+        db = WorkbenchDB(str(tmp_path / "w.db"))
+        clusters = [cluster("a"), cluster("b"), cluster("c")]
+        db.write_all({"clusters": clusters})
+
+        clusters.insert(1, cluster("new"))
+        clusters[0]["name"] = "Renamed"
+        del clusters[3]
+        positions = {c["id"]: i for i, c in enumerate(clusters)}
+        db.update(clusters, positions, {"a", "new", "c"})
+        assert db.load() == {"clusters": clusters}
+
+    def test_renumber_when_positions_run_out(self, tmp_path):
+        """Test repeated inserts between the same two clusters."""
+        db = WorkbenchDB(str(tmp_path / "w.db"))
+        clusters = [cluster("first"), cluster("last")]
+        db.write_all({"clusters": clusters})
+        for i in range(100):
+            clusters.insert(1, cluster(f"c{i}"))
+            positions = {c["id"]: i for i, c in enumerate(clusters)}
+            db.update(clusters, positions, {f"c{i}"})
+        assert [c["id"] for c in db.load()["clusters"]] == [c["id"] for c in clusters]
+
+    def test_snapshots(self, tmp_path):
+        """Test saving, listing, loading and deleting snapshots."""
+        db = WorkbenchDB(str(tmp_path / "w.db"))
+        db.write_all({"clusters": [cluster("a"), cluster("b")]})
+        db.save_snapshot("two")
+        db.write_all({"clusters": [cluster("c")]})
+        db.save_snapshot("one")
+
+        assert sorted((name, count) for name, _, count in db.snapshots()) == [
+            ("one", 1),
+            ("two", 2),
+        ]
+        assert db.load_snapshot("two") == {"clusters": [cluster("a"), cluster("b")]}
+        assert db.load_snapshot("missing") is None
+        assert db.delete_snapshot("two")
+        assert not db.delete_snapshot("two")
+        assert [name for name, _, _ in db.snapshots()] == ["one"]